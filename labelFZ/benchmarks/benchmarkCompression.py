@@ -0,0 +1,83 @@
+"""
+Benchmark of the codecs of the curves stored in sqlite (CURVE_CODECS): for
+each of them, the size of the stored curves and of the database against
+the raw ones, and the time to read and decode a force ramp, alone and in
+batches.
+
+Run from the main directory of the repository with:
+    python -m labelFZ.benchmarks.benchmarkCompression --rows 64 --columns 64
+"""
+
+###############################################################################
+# Imports
+###############################################################################
+import os
+import time
+import sqlite3
+import argparse
+import tempfile
+import numpy as np
+from ..local_classes.classNanoscopeForceVolume import *
+from ..local_classes.classForceVolumeSession import ForceVolumeSession
+from .syntheticFiles import writeForceVolume
+
+
+def curveBytes(database_name):
+    '''
+    Returns the bytes taken by the curves stored in database_name
+    '''
+    with sqlite3.connect(database_name) as connector:
+        return connector.execute(
+                "SELECT SUM(length(ForceForward) + length(ForceBackward)) FROM RawDataTable;"
+                ).fetchone()[0]
+
+
+def timeReads(database_name, experimentID, ids, batchSize):
+    '''
+    Returns the mean time (s) per force ramp of reading ids of experiment
+    experimentID one at a time, and in batches of batchSize
+    '''
+    with ForceVolumeSession(database_name, experimentID) as session:
+        start = time.perf_counter()
+        for idx in ids:
+            session.getForceRamp(int(idx))
+        single = (time.perf_counter() - start) / len(ids)
+        start = time.perf_counter()
+        for batchStart in range(0, len(ids), batchSize):
+            session.getForceRamps(ids=ids[batchStart:batchStart+batchSize])
+        batch = (time.perf_counter() - start) / len(ids)
+    return single, batch
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=64)
+    parser.add_argument('--columns', type=int, default=64)
+    parser.add_argument('--points', type=int, default=2048)
+    parser.add_argument('--reads', type=int, default=2000,
+                        help="force ramps read at random from each database")
+    parser.add_argument('--batch', type=int, default=64)
+    args = parser.parse_args()
+
+    nCurves = args.rows * args.columns
+    ids = np.random.default_rng(0).integers(0, nCurves, size=args.reads)
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, 'synthetic.fv')
+        writeForceVolume(file_name, args.rows, args.columns, args.points, returnData=False)
+        print(f"File: {nCurves} force ramps of {args.points} points, "
+              f"{os.path.getsize(file_name)/2**20:.1f} MiB")
+        rawBytes = None
+        for curveEncoding in CURVE_CODECS:
+            database_name = os.path.join(directory, f'{curveEncoding}.db')
+            start = time.perf_counter()
+            experimentID = NanoscopeForceVolumeObject().fvToSQL(file_name, database_name,
+                                                                curveEncoding=curveEncoding)
+            ingestTime = time.perf_counter() - start
+            stored = curveBytes(database_name)
+            rawBytes = rawBytes or stored
+            single, batch = timeReads(database_name, experimentID, ids, args.batch)
+            print(f"{curveEncoding:10}: ratio {rawBytes/stored:5.2f}, "
+                  f"curves {stored/2**20:6.1f} MiB, database "
+                  f"{os.path.getsize(database_name)/2**20:6.1f} MiB, ingest {ingestTime:5.2f} s, "
+                  f"read {single*1e6:6.1f} us/curve alone, {batch*1e6:6.1f} us/curve in batches")
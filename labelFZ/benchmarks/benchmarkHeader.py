@@ -0,0 +1,110 @@
+"""
+Microbenchmark of the parsing of Nanoscope headers: the former per-key
+re.search loop versus the single-pass NanoscopeHeader parser.
+
+Run from the main directory of the repository with:
+    python -m labelFZ.benchmarks.benchmarkHeader --repeat 2000
+"""
+
+###############################################################################
+# Imports
+###############################################################################
+import io
+import re
+import time
+import argparse
+from ..local_classes.classNanoscopeHeader import *
+from .syntheticFiles import forceVolumeHeader, forceRampHeader
+
+
+def legacySearchForParameters(_line, headerParameters):
+    '''
+    Former searchForParameters of NanoscopeForceVolumeObject, kept here
+    as the reference
+    '''
+    for key in headerParameters:
+        if re.search(re.escape(key), _line):
+            if key == "Image Data":
+                searchString = re.split(r'"', _line)
+                searchString = searchString[-2]
+                headerParameters[key].append(searchString)
+            else:
+                numbers = re.findall(r'\d+\.?\d*', _line)
+                if re.search(r'LSB', _line) or re.search(r'@', _line):
+                    headerParameters[key].append(float(numbers[-1]))
+                else:
+                    for number in numbers:
+                        headerParameters[key].append(float(number))
+    return headerParameters
+
+
+def legacyRampSearchForParameters(_line, headerParameters):
+    '''
+    Former searchForParameters of NanoscopeForceRamp, kept here as the
+    reference
+    '''
+    for key in headerParameters:
+        if re.search(re.escape(key), _line):
+            if key == '4:Image Data:':
+                searchString = re.split(r'"', _line)
+                searchString = searchString[-2]
+                headerParameters[key].append(searchString)
+            elif key == 'Bytes/pixel':
+                numbers = re.findall(r'\d+$', _line)
+                headerParameters[key].append(int(numbers[0]))
+            else:
+                numbers = re.findall(r'-?\d+\.?\d+', _line)
+                if key == '@4:Z scale':
+                    headerParameters[key].append(float(numbers[0]))
+                elif re.search(r'LSB', _line) or re.search(r'@', _line):
+                    headerParameters[key].append(float(numbers[-1]))
+                else:
+                    for number in numbers:
+                        headerParameters[key].append(float(number))
+    return headerParameters
+
+
+def legacyParse(lines, keys, legacySearch):
+    headerParameters = {key: [] for key in keys}
+    for line in lines:
+        headerParameters = legacySearch(line, headerParameters)
+        if re.search(r'\*File list end', line):
+            break
+    return headerParameters
+
+
+def singlePassParse(lines, keys):
+    return NanoscopeHeader(lines, keys).parameters
+
+
+def timeParser(parser, lines, repeat, *arguments):
+    '''
+    Returns the mean time (s) taken by parser to parse lines
+    '''
+    start = time.perf_counter()
+    for _ in range(repeat):
+        parser(lines, *arguments)
+    return (time.perf_counter() - start) / repeat
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    # Each header is parsed with the keys, and compared with the former
+    # parser, of the class that reads its files
+    headers = {'force volume': (forceVolumeHeader(128, 128, 512), FORCE_VOLUME_KEYS,
+                                legacySearchForParameters),
+               'force ramp': (forceRampHeader(512), FORCE_RAMP_KEYS,
+                              legacyRampSearchForParameters)}
+    for name, (header, keys, legacySearch) in headers.items():
+        # Split in lines as the files are read (text mode, universal newlines)
+        lines = io.StringIO(header.decode('cp1252'), newline=None).readlines()
+        assert legacyParse(lines, keys, legacySearch) == singlePassParse(lines, keys), name
+        legacy = timeParser(legacyParse, lines, args.repeat, keys, legacySearch)
+        singlePass = timeParser(singlePassParse, lines, args.repeat, keys)
+        print(f"{name} header ({len(lines)} lines): "
+              f"legacy {legacy*1e6:.1f} us, single-pass {singlePass*1e6:.1f} us "
+              f"({legacy/singlePass:.1f}x)")
@@ -0,0 +1,105 @@
+"""
+Benchmark of the ingest of a Force Volume file into a sqlite database:
+    baseline: as the first version of fvToSQL did, with the whole force
+        volume read at once and one INSERT (of a .npy blob) per curve (no
+        features are computed, unlike the others)
+    per-curve: fvToSQL with bulk=False (populateTables), reading the file
+        in blocks of rows
+    bulk: fvToSQL with bulk=True (populateTablesBulk)
+
+Run from the main directory of the repository with:
+    python -m labelFZ.benchmarks.benchmarkIngest --rows 128 --columns 128
+"""
+
+###############################################################################
+# Imports
+###############################################################################
+import os
+import time
+import argparse
+import tempfile
+from ..local_classes.classNanoscopeForceVolume import *
+from .syntheticFiles import writeForceVolume
+
+
+def timeIngest(file_name, database_name, bulk):
+    '''
+    Returns the time (s) taken by fvToSQL to ingest file_name
+    '''
+    if os.path.exists(database_name):
+        os.remove(database_name)
+    fvObject = NanoscopeForceVolumeObject()
+    start = time.perf_counter()
+    fvObject.fvToSQL(file_name, database_name, bulk=bulk)
+    return time.perf_counter() - start
+
+
+def timeBaselineIngest(file_name, database_name):
+    '''
+    Returns the time (s) taken to ingest file_name as the first version of
+    fvToSQL did: the whole force volume read and scaled at once, and one
+    INSERT per curve, stored as .npy (into the tables of this version)
+    '''
+    if os.path.exists(database_name):
+        os.remove(database_name)
+    fvObject = NanoscopeForceVolumeObject()
+    start = time.perf_counter()
+    headerParameters = fvObject.readHeader(file_name)
+    fvParameters = fvObject.headerToParameters(headerParameters)
+    topographyArray = fvObject.readTopography(file_name, headerParameters, fvParameters)
+    fvDataArray = fvObject.readFV(file_name, headerParameters, fvParameters)
+
+    fvObject.connectToDataBase(database_name)
+    fvObject.createTables()
+    fvObject.cursor.execute("""
+            INSERT INTO ExperimentalParametersTable
+            (ExperimentName, sourcePath, nRows, nColumns, nRampPoints, scanSize, rampLength,
+            curveEncoding, curveDtype)
+            values (?, ?, ?, ?, ?, ?, ?, 'npy', '<f8')
+            """, (
+            os.path.basename(file_name),
+            os.path.abspath(file_name),
+            fvParameters['numberOfMapRows'][0],
+            fvParameters['numberOfMapColumns'][0],
+            fvParameters['rampPoints'][0],
+            fvParameters['scanSize'][0],
+            fvParameters['rampLength'][0]
+            ))
+    ExperimentID = fvObject.cursor.lastrowid
+    for i in range(fvParameters['numberOfMapRows'][0]):
+        for j in range(fvParameters['numberOfMapColumns'][0]):
+            fvObject.cursor.execute(
+                    """INSERT INTO RawDataTable
+                       (ExperimentID, NX, NY,
+                       ForceForward, ForceBackward, Height)
+                       values (?, ?, ?, ?, ?, ?)""",
+                    (ExperimentID, i, j, fvDataArray[i, j, 0, :],
+                     fvDataArray[i, j, 1, :],
+                     topographyArray[i, j])
+                    )
+    fvObject.connector.commit()
+    fvObject.closeDataBaseConnection()
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=64)
+    parser.add_argument('--columns', type=int, default=64)
+    parser.add_argument('--points', type=int, default=512)
+    args = parser.parse_args()
+
+    nCurves = args.rows * args.columns
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, 'synthetic.fv')
+        writeForceVolume(file_name, args.rows, args.columns, args.points)
+        for label in ('baseline', 'per-curve', 'bulk'):
+            database_name = os.path.join(directory, f'{label}.db')
+            if label == 'baseline':
+                elapsed = timeBaselineIngest(file_name, database_name)
+            else:
+                elapsed = timeIngest(file_name, database_name, bulk=label == 'bulk')
+            print(f"{label:9}: {nCurves} rows in {elapsed:.2f} s "
+                  f"({nCurves/elapsed:.0f} rows/s), "
+                  f"{os.path.getsize(database_name)/2**20:.1f} MiB")
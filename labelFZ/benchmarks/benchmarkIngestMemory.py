@@ -0,0 +1,59 @@
+"""
+Benchmark of the peak memory (RSS) of the ingest of a Force Volume file
+into a sqlite database, for several memory ceilings (fvToSQL maxMemory).
+Each ingest runs in a new process, so that its peak is measured alone.
+
+Run from the main directory of the repository with:
+    python -m labelFZ.benchmarks.benchmarkIngestMemory --rows 256 --columns 256
+"""
+
+###############################################################################
+# Imports
+###############################################################################
+import os
+import time
+import resource
+import argparse
+import tempfile
+import multiprocessing
+from ..local_classes.classNanoscopeForceVolume import *
+from .syntheticFiles import writeForceVolume
+
+
+def ingest(file_name, database_name, maxMemory):
+    '''
+    Ingests file_name, and returns (time (s), peak RSS (MiB) of the process)
+    '''
+    fvObject = NanoscopeForceVolumeObject()
+    start = time.perf_counter()
+    fvObject.fvToSQL(file_name, database_name, maxMemory=maxMemory)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in KiB on Linux (bytes on macOS)
+    return elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=128)
+    parser.add_argument('--columns', type=int, default=128)
+    parser.add_argument('--points', type=int, default=512)
+    parser.add_argument('--max-memory', type=int, nargs='+', default=[16, 64, 256],
+                        help="memory ceilings to try, in MiB")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, 'synthetic.fv')
+        writeForceVolume(file_name, args.rows, args.columns, args.points, returnData=False)
+        print(f"File: {os.path.getsize(file_name)/2**20:.1f} MiB")
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            baseline = pool.apply(resource.getrusage, (resource.RUSAGE_SELF,)).ru_maxrss / 2**10
+        print(f"Idle process: {baseline:.0f} MiB")
+        for maxMemory in args.max_memory:
+            database_name = os.path.join(directory, f'ingest{maxMemory}.db')
+            # A new process for each ingest
+            with context.Pool(1, maxtasksperchild=1) as pool:
+                elapsed, peak = pool.apply(ingest, (file_name, database_name, maxMemory * 2**20))
+            print(f"maxMemory={maxMemory:5} MiB: {elapsed:.2f} s, peak RSS {peak:.0f} MiB")
+            os.remove(database_name)
@@ -0,0 +1,91 @@
+"""
+Benchmark of the storage backends of Force Volumes (classForceVolumeStores):
+the sqlite database, the memory map of the file itself (no ingest) and the
+chunked .npy array store. For each backend it measures the time to prepare
+the store (ingest), to open it, to read single force ramps at random and
+batches of them, and its footprint on disk.
+
+Run from the main directory of the repository with:
+    python -m labelFZ.benchmarks.benchmarkStorage --rows 128 --columns 128
+"""
+
+###############################################################################
+# Imports
+###############################################################################
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+from ..local_classes.classNanoscopeForceVolume import *
+from ..local_classes.classForceVolumeStores import *
+from .syntheticFiles import writeForceVolume
+
+
+def prepareStore(backend, file_name, directory):
+    '''
+    Prepares the store of file_name for backend, and returns
+    (path of the store, experimentID (None but for sqlite), time (s) taken)
+    '''
+    start = time.perf_counter()
+    experimentID = None
+    if backend == 'sqlite':
+        path = os.path.join(directory, 'store.db')
+        experimentID = NanoscopeForceVolumeObject().fvToSQL(file_name, path)
+    elif backend == 'chunked':
+        path = os.path.join(directory, 'store')
+        writeChunkedArrayStore(file_name, path)
+    else:
+        path = file_name
+    return path, experimentID, time.perf_counter() - start
+
+
+def timeStore(path, experimentID, ids, batchSize):
+    '''
+    Returns the times (s) to open the store at path (and experimentID), and the mean latencies
+    (s) of reading one force ramp and a batch of batchSize force ramps
+    (the ids, in random order)
+    '''
+    start = time.perf_counter()
+    store = openStore(path, experimentID)
+    openTime = time.perf_counter() - start
+    try:
+        start = time.perf_counter()
+        for idx in ids:
+            store.getForceRamp(int(idx))
+        singleTime = (time.perf_counter() - start) / len(ids)
+        batches = [ids[i:i+batchSize] for i in range(0, len(ids) - batchSize + 1, batchSize)]
+        start = time.perf_counter()
+        for batch in batches:
+            store.getForceRamps(ids=batch)
+        batchTime = (time.perf_counter() - start) / max(len(batches), 1)
+    finally:
+        store.close()
+    return openTime, singleTime, batchTime
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=64)
+    parser.add_argument('--columns', type=int, default=64)
+    parser.add_argument('--points', type=int, default=512)
+    parser.add_argument('--reads', type=int, default=2000,
+                        help="force ramps read at random from each store")
+    parser.add_argument('--batch', type=int, default=64)
+    args = parser.parse_args()
+
+    nCurves = args.rows * args.columns
+    ids = np.random.default_rng(0).integers(0, nCurves, size=args.reads)
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, 'synthetic.fv')
+        writeForceVolume(file_name, args.rows, args.columns, args.points, returnData=False)
+        print(f"File: {nCurves} force ramps, {os.path.getsize(file_name)/2**20:.1f} MiB")
+        for backend in STORAGE_BACKENDS:
+            path, experimentID, prepareTime = prepareStore(backend, file_name, directory)
+            # The memory map reads the file itself, and takes no extra space
+            footprint = 0 if backend == 'memmap' else directorySize(path)
+            openTime, singleTime, batchTime = timeStore(path, experimentID, ids, args.batch)
+            print(f"{backend:8}: prepare {prepareTime:6.2f} s, open {openTime*1e3:7.2f} ms, "
+                  f"single {singleTime*1e6:7.1f} us, batch of {args.batch} {batchTime*1e3:6.2f} ms, "
+                  f"disk {footprint/2**20:6.1f} MiB")
@@ -0,0 +1,67 @@
+"""
+Benchmark of windowed reads of long force ramps (getForceRampWindow), as
+done when zooming into them, against reading them whole (getForceRamp),
+for each storage backend of Force Volumes.
+
+Run from the main directory of the repository with:
+    python -m labelFZ.benchmarks.benchmarkWindowedReads --points 4194304
+"""
+
+###############################################################################
+# Imports
+###############################################################################
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+from ..local_classes.classForceVolumeStores import *
+from .benchmarkStorage import prepareStore
+from .syntheticFiles import writeForceVolume
+
+
+def timeReads(store, ids, read, repeats):
+    '''
+    Returns the mean time (s) of read(store, idx), over ids repeats times
+    '''
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for idx in ids:
+            read(store, int(idx))
+    return (time.perf_counter() - start) / (repeats * len(ids))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=4)
+    parser.add_argument('--columns', type=int, default=4)
+    parser.add_argument('--points', type=int, default=2**20)
+    parser.add_argument('--windows', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help="samples of the windows read")
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    ids = np.arange(args.rows * args.columns)
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, 'synthetic.fv')
+        writeForceVolume(file_name, args.rows, args.columns, args.points, returnData=False)
+        print(f"File: {ids.size} force ramps of {args.points} samples, "
+              f"{os.path.getsize(file_name)/2**20:.1f} MiB")
+        for backend in STORAGE_BACKENDS:
+            path, experimentID, prepareTime = prepareStore(backend, file_name, directory)
+            store = openStore(path, experimentID)
+            try:
+                whole = timeReads(store, ids, lambda store, idx: store.getForceRamp(idx), args.repeats)
+                print(f"{backend:8}: whole {whole*1e3:8.3f} ms")
+                for window in args.windows:
+                    start = (args.points - window) // 2
+
+                    def readWindow(store, idx):
+                        store.getForceRampWindow(idx, start, start + window)
+
+                    elapsed = timeReads(store, ids, readWindow, args.repeats)
+                    print(f"{'':8}  window of {window:7}: {elapsed*1e3:8.3f} ms "
+                          f"({whole/elapsed:6.1f}x)")
+            finally:
+                store.close()
@@ -0,0 +1,137 @@
+###############################################################################
+# Imports
+###############################################################################
+import numpy as np
+
+###############################################################################
+# Writers of synthetic Nanoscope 9 files, with the same header layout as the
+# one expected by the readers in local_classes, so that the benchmarks can
+# be run without real experimental data.
+###############################################################################
+
+HEADER_LENGTH = 40960
+
+
+def forceVolumeHeader(nRows, nColumns, nRampPoints):
+    '''
+    Returns the header (bytes, not padded) of a synthetic Force Volume file
+    with a Height image followed by the Deflection Error force data
+    '''
+    topographyOffset = HEADER_LENGTH
+    topographyLength = nRows*nColumns*4
+    fvOffset = topographyOffset + topographyLength
+    fvLength = nRows*nColumns*2*nRampPoints*4
+    lines = [
+        '\\*Force file list',
+        '\\Version: 0x09200000',
+        f'\\Data length: {HEADER_LENGTH}',
+        '\\*Scanner list',
+        '\\@Sens. Zsens: V 28.00000 nm/V',
+        '\\*Ciao scan list',
+        '\\Scan Size: 500 500 nm',
+        f'\\Samps/line: {nColumns}',
+        '\\*Ciao force list',
+        '\\@4:Image Data: S [DeflectionError] "Deflection Error"',
+        '\\*Ciao force image list',
+        '\\@4:Ramp Size: V [Sens. Zsens] (0.0003750000 V/LSB) 10.00000 V',
+        '\\*Ciao image list',
+        f'\\Data offset: {topographyOffset}',
+        f'\\Data length: {topographyLength}',
+        '\\Bytes/pixel: 4',
+        f'\\Samps/line: {nRampPoints} {nColumns}',
+        f'\\Number of lines: {nRows}',
+        '\\@2:Image Data: S [Height] "Height"',
+        '\\@2:Z scale: V [Sens. Zsens] (0.006713867 V/LSB) 26.20000 V',
+        '\\*Ciao force image list',
+        f'\\Data offset: {fvOffset}',
+        f'\\Data length: {fvLength}',
+        '\\Bytes/pixel: 4',
+        f'\\Samps/line: {nRampPoints} {nColumns}',
+        f'\\Number of lines: {nRows}',
+        '\\@4:Image Data: S [DeflectionError] "Deflection Error"',
+        '\\*File list end',
+    ]
+    return ('\r\n'.join(lines) + '\r\n').encode('cp1252')
+
+
+def syntheticCurves(shape, nRampPoints, rng):
+    '''
+    Returns int32 deflection counts with shape shape + (nRampPoints,):
+    a flat baseline, a linear contact region and some noise
+    '''
+    z = np.linspace(0., 1., nRampPoints)
+    contact = rng.uniform(0.3, 0.7, size=shape + (1,))
+    curves = np.clip(z - contact, 0., None) * 2e5
+    curves += rng.normal(0., 20., size=shape + (nRampPoints,))
+    return curves.astype('<i4')
+
+
+def writeForceVolume(file_name, nRows=32, nColumns=32, nRampPoints=512, seed=0,
+                     returnData=True):
+    '''
+    Writes a synthetic Force Volume file, and returns the raw int32
+    (topography, force volume) arrays written to it. With returnData
+    False, the file is written row by row without keeping the force
+    volume in memory (for files larger than it), and None is returned.
+    '''
+    rng = np.random.default_rng(seed)
+    topography = rng.integers(-2**20, 2**20, size=(nRows, nColumns), dtype='<i4')
+    header = forceVolumeHeader(nRows, nColumns, nRampPoints)
+    with open(file_name, 'wb') as file:
+        file.write(header.ljust(HEADER_LENGTH, b'\x00'))
+        file.write(topography.tobytes())
+        fvData = np.empty((nRows, nColumns, 2, nRampPoints), dtype='<i4') if returnData else None
+        for i in range(nRows):
+            rowData = syntheticCurves((nColumns, 2), nRampPoints, rng)
+            if returnData:
+                fvData[i] = rowData
+            file.write(rowData.tobytes())
+
+    return (topography, fvData) if returnData else None
+
+
+def forceRampHeader(nRampPoints, channels=('Deflection Error', 'Height Sensor')):
+    '''
+    Returns the header (bytes, not padded) of a synthetic single force ramp
+    file, with one data section (approach and retract) per channel
+    '''
+    channelLength = 2*nRampPoints*4
+    lines = [
+        '\\*Force file list',
+        '\\Version: 0x09200000',
+        f'\\Data length: {HEADER_LENGTH}',
+        '\\*Scanner list',
+        '\\@Sens. Zsens: V 28.00000 nm/V',
+        '\\*Ciao scan list',
+        '\\Scan Size: 500 500 nm',
+        '\\*Ciao force list',
+        '\\@4:Image Data: S [DeflectionError] "Deflection Error"',
+    ]
+    for i, channel in enumerate(channels):
+        lines += [
+            '\\*Ciao force image list',
+            f'\\Data offset: {HEADER_LENGTH + i*channelLength}',
+            f'\\Data length: {channelLength}',
+            '\\Bytes/pixel: 2',
+            f'\\Samps/line: {nRampPoints} {nRampPoints}',
+            '\\@4:Ramp Size: V [Sens. Zsens] (0.0003750000 V/LSB) 10.00000 V',
+            '\\@4:Z scale: V [Sens. DeflSens] (0.0003750000 V/LSB) 24.57600 V',
+            f'\\@4:Image Data: S [{channel.replace(" ", "")}] "{channel}"',
+        ]
+    lines.append('\\*File list end')
+    return ('\r\n'.join(lines) + '\r\n').encode('cp1252')
+
+
+def writeForceRamp(file_name, nRampPoints=512, channels=('Deflection Error', 'Height Sensor'), seed=0):
+    '''
+    Writes a synthetic single force ramp file, and returns the raw int32
+    data written to it, with shape (channels, 2, nRampPoints)
+    '''
+    rng = np.random.default_rng(seed)
+    header = forceRampHeader(nRampPoints, channels)
+    rampData = syntheticCurves((len(channels), 2), nRampPoints, rng)
+    with open(file_name, 'wb') as file:
+        file.write(header.ljust(HEADER_LENGTH, b'\x00'))
+        file.write(rampData.tobytes())
+
+    return rampData
@@ -0,0 +1,134 @@
+###############################################################################
+# Imports
+###############################################################################
+import numpy as np
+from .classWindowedCurve import WindowedCurve
+
+# Samples of the curve decimated at a time, in whole bins
+BLOCK_SAMPLES = 2**20
+
+###############################################################################
+# A class named CurveDecimator is declared, which reduces a long curve to the
+# few points that can actually be seen at the resolution of the plot
+###############################################################################
+
+
+class CurveDecimator():
+    '''
+    Min/max decimation of a curve (x, y).
+    The part of the curve within a view (xStart, xStop) is split into
+    nBins bins of consecutive samples, and only the minimum and maximum of
+    each bin are kept, in their original order. The decimated curve has
+    then the same envelope as the original one at that resolution: peaks
+    and sharp events (e.g. the breakthrough of a membrane) are never
+    averaged out. Views with less than 2*nBins samples are not decimated.
+    The samples within a view are found by bisection when x is in
+    increasing order (e.g. Z), and by a scan of x otherwise (e.g. the
+    tip-sample separation, which goes backwards with the deflection).
+    y can be a WindowedCurve: only the samples within the view are then
+    read, BLOCK_SAMPLES at most at a time, and the decimation of the whole
+    curve is kept, so that zooming out does not read it again.
+
+    Attributes:
+        x, y: the full resolution curve
+
+    Methods:
+        __init__(x, y)
+        window(xStart=None, xStop=None)
+        decimate(xStart=None, xStop=None, nBins=1000)
+        bounds(nBins=1000)
+    '''
+
+    def __init__(self, x, y):
+        self.x = np.atleast_1d(x)
+        self.y = y if isinstance(y, WindowedCurve) else np.atleast_1d(y)
+        self.ascending = bool(np.all(self.x[1:] >= self.x[:-1]))
+        # Decimations of the whole curve, by nBins
+        self.wholeCurve = {}
+
+    def window(self, xStart=None, xStop=None):
+        '''
+        Returns the (start, stop) indices of the samples within
+        [xStart, xStop], plus one more on each side, so that the curve
+        reaches the borders of the view. For x not in increasing order,
+        these are the first and last samples within the view.
+        '''
+        n = self.x.shape[0]
+        if not self.ascending:
+            inside = np.ones(n, dtype=bool)
+            if xStart is not None:
+                inside &= self.x >= xStart
+            if xStop is not None:
+                inside &= self.x <= xStop
+            if not inside.any():
+                return 0, 0
+            first = int(inside.argmax())
+            last = n - 1 - int(inside[::-1].argmax())
+            return max(first - 1, 0), min(last + 2, n)
+        start = 0 if xStart is None else max(int(np.searchsorted(self.x, xStart)) - 1, 0)
+        stop = n if xStop is None else min(int(np.searchsorted(self.x, xStop, side='right')) + 1, n)
+        return start, max(start, stop)
+
+    def decimate(self, xStart=None, xStop=None, nBins=1000):
+        '''
+        Returns the decimated (x, y) of the curve within the view
+        [xStart, xStop] (the whole curve, if not given)
+        '''
+        start, stop = self.window(xStart, xStop)
+        if (start, stop) == (0, self.x.shape[0]):
+            if nBins not in self.wholeCurve:
+                self.wholeCurve[nBins] = self.decimateWindow(start, stop, nBins)
+            return self.wholeCurve[nBins]
+        return self.decimateWindow(start, stop, nBins)
+
+    def decimateWindow(self, start, stop, nBins):
+        '''
+        Returns the decimated (x, y) of the samples [start, stop)
+        '''
+        n = stop - start
+        if n <= 2*nBins:
+            return self.x[start:stop], np.asarray(self.y[start:stop])
+
+        binSize = -(-n // nBins)
+        blockSize = max(BLOCK_SAMPLES // binSize, 1) * binSize
+        indices = []
+        values = []
+        for blockStart in range(0, n, blockSize):
+            y = np.asarray(self.y[start+blockStart:start+min(blockStart+blockSize, n)])
+            nFull = y.shape[0] // binSize
+            bins = y[:nFull*binSize].reshape(nFull, binSize)
+            offsets = np.arange(nFull) * binSize
+            iMin = bins.argmin(axis=1) + offsets
+            iMax = bins.argmax(axis=1) + offsets
+            if nFull*binSize < y.shape[0]:
+                rest = y[nFull*binSize:]
+                iMin = np.append(iMin, rest.argmin() + nFull*binSize)
+                iMax = np.append(iMax, rest.argmax() + nFull*binSize)
+
+            # Both extremes of each bin, in the order they appear
+            blockIndices = np.empty(2*iMin.shape[0], dtype=np.intp)
+            blockIndices[0::2] = np.minimum(iMin, iMax)
+            blockIndices[1::2] = np.maximum(iMin, iMax)
+            if blockStart == 0:
+                # and the first sample, so that the curve still reaches
+                # the border of the view
+                blockIndices = np.concatenate(([0], blockIndices))
+            if blockStart + y.shape[0] == n:
+                # and the last one
+                blockIndices = np.concatenate((blockIndices, [y.shape[0]-1]))
+            indices.append(blockIndices + blockStart)
+            values.append(y[blockIndices])
+
+        indices = np.concatenate(indices) + start
+        return self.x[indices], np.concatenate(values)
+
+    def bounds(self, nBins=1000):
+        '''
+        Returns the (xMin, xMax, yMin, yMax) of the whole curve, or None
+        if it is empty. The extremes of y are those of its decimation,
+        which keeps the minimum and maximum of every bin.
+        '''
+        if not self.x.size or not len(self.y):
+            return None
+        x, y = self.decimate(nBins=nBins)
+        return (self.x.min(), self.x.max(), y.min(), y.max())
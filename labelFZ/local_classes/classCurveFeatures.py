@@ -0,0 +1,253 @@
+###############################################################################
+# Imports
+###############################################################################
+import sqlite3
+import numpy as np
+
+###############################################################################
+# Summary features of force ramps, computed at once (vectorized) for a whole
+# block of them, and stored per force ramp so that interesting ones can be
+# found with a query instead of looking at every one
+###############################################################################
+
+# Names (and order) of the features, which are also the names of their
+# columns in CurveFeaturesTable
+FEATURE_NAMES = ('baselineOffset', 'baselineNoise', 'maxDeflection', 'minDeflection',
+                 'adhesion', 'slope', 'nDiscontinuities')
+
+# Comparison operators allowed in the queries on the features
+FEATURE_OPERATORS = ('<', '<=', '>', '>=', '=', '!=')
+
+
+def countJumps(curves, noise, jumpThreshold=10.):
+    '''
+    Returns, for each row of curves, the number of discontinuities
+    (jumps): runs of consecutive samples whose second difference is
+    larger than jumpThreshold times noise (the standard deviation of the
+    second differences away from jumps, one per row).
+    Second differences are used so that a smooth slope is not a jump.
+    '''
+    secondDifference = np.abs(np.diff(curves, n=2, axis=1))
+    jumps = secondDifference > jumpThreshold * np.maximum(noise, np.finfo(np.float64).tiny)[:, None]
+    # A jump shows up as a run of (two) large second differences
+    starts = jumps[:, 1:] & ~jumps[:, :-1]
+    return starts.sum(axis=1) + jumps[:, 0]
+
+
+def computeFeatures(forward, backward, x=None, baselineFraction=0.2, contactFraction=0.1,
+                    jumpThreshold=10.):
+    '''
+    Returns a (n, len(FEATURE_NAMES)) array with the features of n force
+    ramps, given by their (n, nRampPoints) approach (forward) and retract
+    (backward) curves, against x (sample indices, if not given):
+        baselineOffset, baselineNoise: mean and standard deviation of the
+            first baselineFraction of the approach (far from the surface)
+        maxDeflection: maximum of the approach
+        minDeflection: minimum of the retract
+        adhesion: depth of the retract below the baseline
+        slope: least squares slope of the last contactFraction of the
+            approach (in contact), in deflection per unit of x
+        nDiscontinuities: number of jumps (see countJumps) in the approach
+            and the retract, relative to the noise of the baseline
+    '''
+    forward = np.atleast_2d(np.asarray(forward, dtype=np.float64))
+    backward = np.atleast_2d(np.asarray(backward, dtype=np.float64))
+    nRamps, nRampPoints = forward.shape
+    if x is None:
+        x = np.arange(nRampPoints, dtype=np.float64)
+
+    features = np.empty((nRamps, len(FEATURE_NAMES)))
+    nBaseline = max(int(nRampPoints * baselineFraction), 2)
+    baseline = forward[:, :nBaseline]
+    features[:, 0] = baseline.mean(axis=1)
+    features[:, 1] = baseline.std(axis=1)
+    features[:, 2] = forward.max(axis=1)
+    features[:, 3] = backward.min(axis=1)
+    features[:, 4] = features[:, 0] - features[:, 3]
+
+    nContact = max(int(nRampPoints * contactFraction), 2)
+    xContact = x[-nContact:] - x[-nContact:].mean()
+    yContact = forward[:, -nContact:] - forward[:, -nContact:].mean(axis=1, keepdims=True)
+    features[:, 5] = (yContact @ xContact) / (xContact @ xContact)
+
+    # The baseline has no jumps, so its second differences are just noise
+    noise = np.diff(baseline, n=2, axis=1).std(axis=1)
+    features[:, 6] = countJumps(forward, noise, jumpThreshold) + countJumps(backward, noise, jumpThreshold)
+
+    return features
+
+###############################################################################
+# Storage of the features in CurveFeaturesTable
+###############################################################################
+
+
+def createFeaturesTable(cursor):
+    '''
+    Creates, if it does not exist already, CurveFeaturesTable: a row for
+    each force ramp (ExperimentID, NX, NY) with a column per feature, and
+    an index on (ExperimentID, feature) for each of them
+    '''
+    sql_command = f"""
+    CREATE TABLE IF NOT EXISTS CurveFeaturesTable (
+    ExperimentID INTEGER NOT NULL,
+    NX INTEGER,
+    NY INTEGER,
+    {', '.join(f'{name} REAL' for name in FEATURE_NAMES)},
+    PRIMARY KEY (ExperimentID, NX, NY)
+    );
+    """
+    cursor.execute(sql_command)
+    for name in FEATURE_NAMES:
+        cursor.execute(f"""
+        CREATE INDEX IF NOT EXISTS CurveFeatures{name[0].upper()}{name[1:]}Index
+        ON CurveFeaturesTable (ExperimentID, {name});
+        """)
+
+
+def insertFeatures(cursor, experimentID, NX, NY, features):
+    '''
+    Inserts (or replaces) the features of the force ramps at positions
+    NX, NY (sequences) of experiment experimentID
+    '''
+    sql_command = f"""
+    INSERT OR REPLACE INTO CurveFeaturesTable
+    (ExperimentID, NX, NY, {', '.join(FEATURE_NAMES)})
+    values ({', '.join(['?'] * (3 + len(FEATURE_NAMES)))})
+    """
+    cursor.executemany(sql_command, (
+        (experimentID, int(i), int(j)) + tuple(row)
+        for i, j, row in zip(NX, NY, features.tolist())
+    ))
+
+
+def deleteFeatures(cursor, experimentID):
+    '''
+    Deletes the features of the force ramps of experiment experimentID
+    '''
+    try:
+        cursor.execute("DELETE FROM CurveFeaturesTable WHERE ExperimentID = ?;", (experimentID,))
+    except sqlite3.OperationalError:
+        # No CurveFeaturesTable yet
+        pass
+
+
+def memoryFeatureIndex(features, nColumns=1):
+    '''
+    Returns a CurveFeatureIndex on features, the (nRamps, len(FEATURE_NAMES))
+    features of force ramps 0 to nRamps-1 of a map with nColumns columns,
+    kept in an in-memory database (as experiment 0)
+    '''
+    # The index may be queried from another thread than this one
+    connector = sqlite3.connect(':memory:', check_same_thread=False)
+    NX, NY = np.divmod(np.arange(features.shape[0]), nColumns)
+    with connector:
+        cursor = connector.cursor()
+        createFeaturesTable(cursor)
+        insertFeatures(cursor, 0, NX, NY, features)
+
+    return CurveFeatureIndex(connector, 0, nColumns)
+
+###############################################################################
+# A class named CurveFeatureIndex is declared, which queries the features
+# stored in a CurveFeaturesTable
+###############################################################################
+
+
+class CurveFeatureIndex():
+    '''
+    Query API on the features (see FEATURE_NAMES) of the force ramps of an
+    experiment, stored in the CurveFeaturesTable of a database (one row per
+    (ExperimentID, NX, NY), indexed on ExperimentID and every feature).
+    Force ramps are given by their number idx = NX*nColumns + NY.
+
+    Conditions are sequences of (name, operator, value), e.g.
+    [('adhesion', '>', 0.1), ('nDiscontinuities', '>=', 1)], which must
+    all hold. Names and operators are checked against FEATURE_NAMES and
+    FEATURE_OPERATORS, and values are always query parameters.
+
+    Methods:
+        __init__(connector, experimentID, nColumns)
+        hasFeatures()
+        findCurves(conditions=(), orderBy=None, descending=False, limit=None)
+        getFeatures(ids=None)
+    '''
+
+    def __init__(self, connector, experimentID, nColumns):
+        self.connector = connector
+        self.experimentID = experimentID
+        self.nColumns = nColumns
+
+    def hasFeatures(self):
+        '''
+        Whether the features of the experiment have been computed
+        '''
+        sql_command = """
+                      SELECT 1 FROM CurveFeaturesTable
+                      WHERE ExperimentID = ? LIMIT 1;
+                      """
+        try:
+            return self.connector.execute(sql_command, (self.experimentID,)).fetchone() is not None
+        except sqlite3.OperationalError:
+            # No CurveFeaturesTable (database created by an older version)
+            return False
+
+    def featureColumn(self, name):
+        if name not in FEATURE_NAMES:
+            raise ValueError(f"Unknown feature {name!r}, must be one of {FEATURE_NAMES}")
+        return name
+
+    def whereClause(self, conditions):
+        '''
+        Returns the SQL WHERE clause and its parameters for conditions
+        '''
+        clauses = ['ExperimentID = ?']
+        parameters = [self.experimentID]
+        for name, operator, value in conditions:
+            if operator not in FEATURE_OPERATORS:
+                raise ValueError(f"Unknown operator {operator!r}, must be one of {FEATURE_OPERATORS}")
+            clauses.append(f"{self.featureColumn(name)} {operator} ?")
+            parameters.append(value)
+        return ' AND '.join(clauses), parameters
+
+    def findCurves(self, conditions=(), orderBy=None, descending=False, limit=None):
+        '''
+        Returns the list of numbers of the force ramps that satisfy
+        conditions, sorted by feature orderBy (by position, if not given)
+        and at most limit of them
+        '''
+        where, parameters = self.whereClause(conditions)
+        order = 'NX, NY' if orderBy is None else self.featureColumn(orderBy)
+        if descending:
+            order = order.replace(',', ' DESC,') + ' DESC'
+        sql_command = f"""
+                      SELECT NX, NY FROM CurveFeaturesTable
+                      WHERE {where}
+                      ORDER BY {order}
+                      """
+        if limit is not None:
+            sql_command += " LIMIT ?"
+            parameters.append(int(limit))
+        return [NX*self.nColumns + NY for NX, NY in self.connector.execute(sql_command, parameters)]
+
+    def getFeatures(self, ids=None):
+        '''
+        Returns a (len(ids), len(FEATURE_NAMES)) array with the features of
+        force ramps ids (all of them, in order, if not given). Rows of
+        force ramps without features are nan.
+        '''
+        sql_command = f"""
+                      SELECT NX, NY, {', '.join(FEATURE_NAMES)} FROM CurveFeaturesTable
+                      WHERE ExperimentID = ?;
+                      """
+        data = np.array(self.connector.execute(sql_command, (self.experimentID,)).fetchall(),
+                        dtype=np.float64).reshape(-1, 2 + len(FEATURE_NAMES))
+        rampIDs = (data[:, 0] * self.nColumns + data[:, 1]).astype(np.int64)
+        if ids is None:
+            ids = np.arange(rampIDs.max() + 1 if rampIDs.size else 0)
+        ids = np.asarray(ids, dtype=np.int64)
+        features = np.full((ids.shape[0], len(FEATURE_NAMES)), np.nan)
+        rows = {idx: row for row, idx in enumerate(rampIDs.tolist())}
+        for slot, idx in enumerate(ids.tolist()):
+            if idx in rows:
+                features[slot] = data[rows[idx], 2:]
+        return features
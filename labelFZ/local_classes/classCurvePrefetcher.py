@@ -0,0 +1,431 @@
+###############################################################################
+# Imports
+###############################################################################
+import threading
+from collections import OrderedDict
+import numpy as np
+from .classWindowedCurve import WindowedCurve
+
+# Force ramps with more samples than this are not read whole: they are
+# shown as WindowedCurves, read a window of samples at a time
+WINDOWED_RAMP_POINTS = 2**20
+
+###############################################################################
+# Sources of force ramps for the CurvePrefetcher. A source returns, for a
+# list of force ramp numbers and a direction, the list of their (xData, yData).
+# getForceRampArray returns the same force ramps as a single (n, nRampPoints)
+# array. Sources on force volumes also return maps (a value per force ramp).
+# getCurveWindow returns only the samples [start, stop) of a force ramp,
+# with getRampLength its number of samples and getXData its whole x axis (None
+# when it depends on the force ramp itself, i.e. it cannot be known without
+# reading the whole ramp).
+# open() returns a source that can be used from another thread: sqlite
+# connections cannot be shared between threads, so sources on a database
+# open their own session, while the rest can be shared as they are.
+###############################################################################
+
+
+class SessionCurveSource():
+    '''
+    Force ramps of a force volume in a store: a ForceVolumeSession, on an
+    experiment in a database, or any other store (see
+    classForceVolumeStores)
+    '''
+
+    def __init__(self, session, ownsSession=False):
+        self.session = session
+        self.ownsSession = ownsSession
+
+    def open(self):
+        return SessionCurveSource(self.session.reopen(), ownsSession=True)
+
+    def getCurves(self, ids, direction):
+        forceRamps = self.getForceRampArray(ids, direction)
+        xData = self.session.getXData(xDimensions=True)
+        return [(xData, yData) for yData in forceRamps]
+
+    def getForceRampArray(self, ids, direction):
+        # A single batch query for all of them
+        return self.session.getForceRamps(ids=ids, direction=direction)
+
+    def getRampLength(self, idx):
+        return self.session.nRampPoints
+
+    def getXData(self, idx):
+        return self.session.getXData(xDimensions=True)
+
+    def getCurveWindow(self, idx, direction, start, stop):
+        return self.session.getForceRampWindow(idx, start, stop, direction=direction)
+
+    def getPhysicalForceRamps(self, ids, direction):
+        '''
+        Returns (separation, force) of the force ramps ids from the cache
+        of the experiment in physical units (see
+        ForceVolumeSession.getPhysicalForceRamps), or None if the store
+        has no such cache, or the experiment does not fit in it
+        '''
+        if not hasattr(self.session, 'getPhysicalForceRamps') or not self.session.fitsPhysicalCache():
+            return None
+        return self.session.getPhysicalForceRamps(ids, direction)
+
+    def getMapNames(self):
+        return self.session.getMapNames()
+
+    def getMap(self, name):
+        return self.session.getMap(name)
+
+    def close(self):
+        if self.ownsSession:
+            self.session.close()
+
+
+class MapCurveSource():
+    '''
+    Force ramps of a force volume file opened with
+    NanoscopeForceVolumeObject.openMemoryMap
+    '''
+
+    def __init__(self, fvObject):
+        self.fvObject = fvObject
+        # x axis, the same for all the force ramps (built when first used)
+        self.xData = None
+
+    def open(self):
+        return self
+
+    def getCurves(self, ids, direction):
+        return [self.fvObject.getForceRampFromMap(idx, direction=direction, xDimensions=True)
+                for idx in ids]
+
+    def getForceRampArray(self, ids, direction):
+        return self.fvObject.getForceRampsFromMap(ids, direction=direction)
+
+    def getRampLength(self, idx):
+        return self.fvObject.fvParameters['rampPoints'][0]
+
+    def getXData(self, idx):
+        if self.xData is None:
+            self.xData = np.linspace(0., self.fvObject.fvParameters['rampLength'][0],
+                                     self.getRampLength(idx))
+            self.xData.setflags(write=False)
+        return self.xData
+
+    def getCurveWindow(self, idx, direction, start, stop):
+        return self.fvObject.getForceRampWindowFromMap(idx, start, stop, direction=direction)
+
+    def getMapNames(self):
+        return ['Height']
+
+    def getMap(self, name):
+        if name != 'Height':
+            raise ValueError(f"No map {name!r} before the file is ingested")
+        return self.fvObject.getTopographyFromMap()
+
+    def close(self):
+        pass
+
+
+class SeriesCurveSource():
+    '''
+    Force ramps (first channel) of a ForceRampSeries, against the index
+    of their samples
+    '''
+
+    def __init__(self, series):
+        self.series = series
+
+    def open(self):
+        return self
+
+    def getCurves(self, ids, direction):
+        k = 0 if direction == 'ForceForward' else 1
+        curves = []
+        for idx in ids:
+            yData = self.series[idx].getRawY(0)[k]
+            curves.append((np.arange(yData.shape[0]), yData))
+        return curves
+
+    def getForceRampArray(self, ids, direction):
+        return np.array([yData for xData, yData in self.getCurves(ids, direction)])
+
+    def getRampLength(self, idx):
+        return self.series[idx].getRawY(0)[0].shape[0]
+
+    def getXData(self, idx):
+        return np.arange(self.getRampLength(idx))
+
+    def getCurveWindow(self, idx, direction, start, stop):
+        xData, yData = self.getCurves([idx], direction)[0]
+        return xData[start:stop], yData[start:stop]
+
+    def getMapNames(self):
+        # A series of force ramps has no map
+        return []
+
+    def close(self):
+        pass
+
+
+class PhysicalCurveSource():
+    '''
+    Force ramps of another source in physical units: force (nN) against
+    tip-sample separation (nm), given its x axis z (nm) and a
+    UnitConverter. On an sqlite session, the whole experiment is converted
+    once and kept (see ForceVolumeSession.getPhysicalForceRamps), shared by
+    the sessions of every thread; otherwise each batch of force ramps is
+    converted at once, in a single broadcasted pass. Either way the
+    CurvePrefetcher caches them converted.
+    '''
+
+    def __init__(self, source, converter, z):
+        self.source = source
+        self.converter = converter
+        self.z = z
+
+    def open(self):
+        return PhysicalCurveSource(self.source.open(), self.converter, self.z)
+
+    def getPhysicalForceRamps(self, ids, direction):
+        '''
+        Returns (separation, force) of the force ramps ids: from the cache
+        of the whole experiment in physical units, on an sqlite session
+        (its converter is then the one of the session), or converted
+        '''
+        if isinstance(self.source, SessionCurveSource):
+            physical = self.source.getPhysicalForceRamps(ids, direction)
+            if physical is not None:
+                return physical
+        return self.converter.convert(self.z, self.source.getForceRampArray(ids, direction))
+
+    def getCurves(self, ids, direction):
+        separation, force = self.getPhysicalForceRamps(ids, direction)
+        return list(zip(separation, force))
+
+    def getForceRampArray(self, ids, direction):
+        return self.getPhysicalForceRamps(ids, direction)[1]
+
+    def getRampLength(self, idx):
+        return self.source.getRampLength(idx)
+
+    def getXData(self, idx):
+        # The separation depends on the deflection of the force ramp
+        return None
+
+    def getCurveWindow(self, idx, direction, start, stop):
+        z, deflection = self.source.getCurveWindow(idx, direction, start, stop)
+        return self.converter.convert(z, deflection)
+
+    def getMapNames(self):
+        return self.source.getMapNames()
+
+    def getMap(self, name):
+        return self.source.getMap(name)
+
+    def close(self):
+        self.source.close()
+
+###############################################################################
+# A class named CurvePrefetcher is declared, which keeps the force ramps next
+# to the one shown decoded in memory, reading them in a background thread
+###############################################################################
+
+
+class CurvePrefetcher():
+    '''
+    Bounded cache of decoded force ramps, filled in the background.
+    Every time a force ramp is asked for with getForceRamp, the
+    neighbours ramps (idx-neighbours to idx+neighbours), in both
+    directions, are read into the cache by a background thread, nearest
+    first and in batches of batchSize. Moving to the next or previous
+    force ramp is then served from memory.
+    The cache keeps the cacheSize least recently used (idx, direction).
+    Force ramps with more than windowedPoints samples are neither cached
+    nor prefetched: they are returned as (xData, WindowedCurve), read from
+    the source a window at a time (unless their x axis depends on the
+    ramp itself, see getWindowedForceRamp).
+
+    Attributes:
+        source: SessionCurveSource, MapCurveSource, SeriesCurveSource or
+            PhysicalCurveSource
+        nRamps: number of force ramps of the source
+        neighbours, cacheSize, batchSize, windowedPoints
+        hits, misses: getForceRamp calls served from the cache or not
+        lastError: last exception raised while prefetching, if any
+
+    Methods:
+        getForceRamp(idx, direction='ForceForward')
+        getForceRamps(ids, direction='ForceForward')
+        getWindowedForceRamp(idx, direction='ForceForward')
+        request(idx, direction='ForceForward')
+        isCached(idx, direction='ForceForward')
+        hitRate()
+        close()
+    '''
+
+    def __init__(self, source, nRamps, neighbours=8, cacheSize=128, batchSize=8,
+                 windowedPoints=WINDOWED_RAMP_POINTS):
+        self.source = source
+        self.nRamps = nRamps
+        self.neighbours = neighbours
+        self.windowedPoints = windowedPoints
+        # The cache must hold, at least, every force ramp prefetched
+        # around the one shown
+        self.cacheSize = max(cacheSize, 2*(2*neighbours + 1))
+        self.batchSize = batchSize
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lastError = None
+
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self.target = None
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def getForceRamp(self, idx, direction='ForceForward'):
+        '''
+        Returns the (xData, yData) force ramp number idx, from the cache if
+        possible, and starts prefetching its neighbours
+        '''
+        curve = self.getWindowedForceRamp(idx, direction)
+        if curve is not None:
+            self.request(idx, direction)
+            return curve
+
+        with self.lock:
+            curve = self.cache.get((idx, direction))
+            if curve is not None:
+                self.cache.move_to_end((idx, direction))
+                self.hits += 1
+            else:
+                self.misses += 1
+        if curve is None:
+            curve = self.source.getCurves([idx], direction)[0]
+            self.store([idx], direction, [curve])
+        self.request(idx, direction)
+
+        return curve
+
+    def getForceRamps(self, ids, direction='ForceForward'):
+        '''
+        Returns the whole (xData, yData) force ramps ids: the cached ones
+        from the cache, and the rest read from the source in a single
+        batch. Neither the cache nor its hit rate change, and nothing is
+        prefetched (e.g. to export force ramps other than the one shown).
+        '''
+        with self.lock:
+            curves = [self.cache.get((idx, direction)) for idx in ids]
+        missing = [idx for idx, curve in zip(ids, curves) if curve is None]
+        if missing:
+            read = iter(self.source.getCurves(missing, direction))
+            curves = [next(read) if curve is None else curve for curve in curves]
+        return curves
+
+    def getWindowedForceRamp(self, idx, direction='ForceForward'):
+        '''
+        Returns the force ramp number idx as (xData, WindowedCurve) if it
+        is windowed (see isWindowed), or None
+        '''
+        if not self.isWindowed(self.source, idx):
+            return None
+        source = self.source
+
+        def readWindow(start, stop):
+            return source.getCurveWindow(idx, direction, start, stop)[1]
+
+        dtype = readWindow(0, 1).dtype
+        return (self.source.getXData(idx),
+                WindowedCurve(readWindow, self.source.getRampLength(idx), dtype))
+
+    def isWindowed(self, source, idx):
+        '''
+        Whether the force ramp idx of source is read a window at a time:
+        it has more than windowedPoints samples, and its x axis is known
+        without reading it
+        '''
+        return (source.getRampLength(idx) > self.windowedPoints
+                and source.getXData(idx) is not None)
+
+    def request(self, idx, direction='ForceForward'):
+        '''
+        Asks the background thread to prefetch around idx. Only the latest
+        request is kept.
+        '''
+        with self.condition:
+            self.target = (idx, direction)
+            self.condition.notify()
+
+    def isCached(self, idx, direction='ForceForward'):
+        with self.lock:
+            return (idx, direction) in self.cache
+
+    def hitRate(self):
+        '''
+        Fraction of getForceRamp calls served from the cache
+        '''
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.
+
+    def store(self, ids, direction, curves):
+        with self.lock:
+            for idx, curve in zip(ids, curves):
+                self.cache[(idx, direction)] = curve
+                self.cache.move_to_end((idx, direction))
+            while len(self.cache) > self.cacheSize:
+                self.cache.popitem(last=False)
+
+    def neighbourIDs(self, idx):
+        '''
+        Returns idx and its neighbours within the source, nearest first
+        '''
+        ids = [idx]
+        for step in range(1, self.neighbours+1):
+            ids.extend(i for i in (idx+step, idx-step) if 0 <= i < self.nRamps)
+        return ids
+
+    def run(self):
+        # Executed in the background thread, with its own source
+        source = self.source.open()
+        try:
+            while True:
+                with self.condition:
+                    while self.target is None and not self.stopped:
+                        self.condition.wait()
+                    if self.stopped:
+                        return
+                    idx, direction = self.target
+                    self.target = None
+                try:
+                    self.prefetch(source, idx, direction)
+                except Exception as error:
+                    self.lastError = error
+        finally:
+            source.close()
+
+    def prefetch(self, source, idx, direction):
+        '''
+        Reads into the cache the neighbours of idx, first in direction and
+        then in the other one. It gives up as soon as there is a newer
+        request.
+        '''
+        otherDirection = 'ForceBackward' if direction == 'ForceForward' else 'ForceForward'
+        ids = [i for i in self.neighbourIDs(idx) if not self.isWindowed(source, i)]
+        for prefetchDirection in (direction, otherDirection):
+            missing = [i for i in ids if not self.isCached(i, prefetchDirection)]
+            for start in range(0, len(missing), self.batchSize):
+                with self.lock:
+                    if self.stopped or self.target is not None:
+                        return
+                batch = missing[start:start+self.batchSize]
+                self.store(batch, prefetchDirection, source.getCurves(batch, prefetchDirection))
+
+    def close(self):
+        '''
+        Stops the background thread
+        '''
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        self.thread.join()
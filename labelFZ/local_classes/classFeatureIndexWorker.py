@@ -0,0 +1,51 @@
+###############################################################################
+# Imports
+###############################################################################
+import threading
+from PyQt5.QtCore import QThread, pyqtSignal
+from .classNanoscopeForceVolume import IngestCancelled
+
+###############################################################################
+# A class named FeatureIndexWorker is declared, which runs
+# ForceRampSeries.buildFeatureIndex in a background thread, so that the GUI
+# keeps responding while every file of a series of force ramps is read
+###############################################################################
+
+
+class FeatureIndexWorker(QThread):
+    '''
+    Thread building the CurveFeatureIndex of the ForceRampSeries series
+    (see ForceRampSeries.buildFeatureIndex).
+
+    Signals:
+        built(featureIndex): emitted when the index is ready
+        cancelled(): emitted if the building was cancelled
+        failed(message): emitted if the building raised an exception
+            (e.g. the force ramps of the series differ in length)
+
+    Methods:
+        run(): executed in the thread, started with start()
+        cancel(): asks the building to stop, after the file being read
+    '''
+
+    built = pyqtSignal(object)
+    cancelled = pyqtSignal()
+    failed = pyqtSignal(str)
+
+    def __init__(self, series, parent=None):
+        super().__init__(parent)
+        self.series = series
+        self.cancelEvent = threading.Event()
+
+    def run(self):
+        try:
+            featureIndex = self.series.buildFeatureIndex(cancelEvent=self.cancelEvent)
+        except IngestCancelled:
+            self.cancelled.emit()
+        except Exception as error:
+            self.failed.emit(f"{type(error).__name__}: {error}")
+        else:
+            self.built.emit(featureIndex)
+
+    def cancel(self):
+        self.cancelEvent.set()
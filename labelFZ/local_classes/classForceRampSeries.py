@@ -0,0 +1,200 @@
+###############################################################################
+# Imports
+###############################################################################
+import threading
+import multiprocessing
+from functools import partial
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from .classNanoscopeForceRamp import NanoscopeForceRamp
+from .classCurveFeatures import computeFeatures, memoryFeatureIndex
+from .classNanoscopeForceVolume import IngestCancelled
+
+###############################################################################
+# Parallel reading of force ramp files. The workers must be module level
+# functions, so that they can be pickled and sent to the worker processes.
+# These are spawned, not forked: the GUI runs several threads, whose locks
+# a forked process would inherit in whatever state they were.
+###############################################################################
+
+
+def readForceRamp(file_name):
+    '''
+    Returns the NanoscopeForceRamp of file_name, with header and ramps read
+    '''
+    forceRamp = NanoscopeForceRamp(file_name)
+    forceRamp.read()
+    return forceRamp
+
+
+def readForceRampData(file_name, channel=0):
+    '''
+    Returns only the (2, nRampPoints) integer counts of channel of
+    file_name and their scale, which are much cheaper to send back from a
+    worker process than the whole NanoscopeForceRamp (or its scaled data)
+    '''
+    ramp = readForceRamp(file_name).Ramp[channel]
+    return ramp['Counts'], ramp['YScale']
+
+
+def mapInOrder(function, arguments, workers=None, chunksize=16):
+    '''
+    Yields function(argument) for each of arguments, in order, computed by
+    a pool of workers processes (None: as many as CPUs). With workers=1
+    everything runs in this process. If the caller stops early, the
+    arguments not started yet are not computed.
+    '''
+    if workers == 1:
+        yield from map(function, arguments)
+        return
+    executor = ProcessPoolExecutor(max_workers=workers,
+                                   mp_context=multiprocessing.get_context('spawn'))
+    try:
+        yield from executor.map(function, arguments, chunksize=chunksize)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def readForceRampsParallel(filenames, workers=None, chunksize=16):
+    '''
+    Reads (header and ramps) all filenames with a pool of workers
+    processes, and returns the list of NanoscopeForceRamp in the order of
+    filenames
+    '''
+    return list(mapInOrder(readForceRamp, filenames, workers, chunksize))
+
+
+def readForceRampsArray(filenames, channel=0, workers=None, chunksize=16, dtype=np.float64,
+                        cancelEvent=None):
+    '''
+    Reads all filenames with a pool of workers processes, and returns the
+    scaled data of channel as a single (len(filenames), 2, nRampPoints)
+    array of dtype, in the order of filenames. All files must have the
+    same number of ramp points (ValueError otherwise). The counts of
+    every file are scaled at once, when all of them have been read.
+    If cancelEvent (e.g. a threading.Event) is set, the reading stops and
+    IngestCancelled is raised.
+    '''
+    forceRamps = None
+    scales = np.empty(len(filenames))
+    results = mapInOrder(partial(readForceRampData, channel=channel),
+                         filenames, workers, chunksize)
+    for i, (counts, scale) in enumerate(results):
+        if cancelEvent is not None and cancelEvent.is_set():
+            results.close()
+            raise IngestCancelled(f"Reading cancelled after {i} of {len(filenames)} files")
+        if forceRamps is None:
+            forceRamps = np.empty((len(filenames),) + counts.shape, dtype=dtype)
+        elif counts.shape != forceRamps.shape[1:]:
+            results.close()
+            raise ValueError(f"{filenames[i]} has {counts.shape[-1]} ramp points, "
+                             f"instead of {forceRamps.shape[-1]}")
+        forceRamps[i] = counts
+        scales[i] = scale
+
+    if forceRamps is not None:
+        forceRamps *= scales.astype(dtype)[:, None, None]
+    return forceRamps
+
+###############################################################################
+# A class named ForceRampSeries is declared, which gives access to a series
+# of force ramp files, reading each of them only when it is needed
+###############################################################################
+
+
+class ForceRampSeries():
+    '''
+    Lazy collection of the force ramps in a list of Nanoscope files.
+    A file is only read (header and ramps) when its force ramp is asked
+    for, with series[idx], or prefetched. The decoded NanoscopeForceRamp
+    objects are kept in a least recently used cache of at most cacheSize
+    of them, so that both the time to show the first force ramp and the
+    memory used do not grow with the length of the series.
+
+    Attributes:
+        filenames
+        cacheSize
+        nReads: number of files read so far
+
+    Methods:
+        __len__()
+        __getitem__(idx)
+        prefetch(indices)
+        isCached(idx)
+        clear()
+        toArray(channel=0, workers=None, dtype=np.float64)
+        buildFeatureIndex(channel=0, workers=None, cancelEvent=None)
+    '''
+
+    def __init__(self, filenames, cacheSize=128):
+        self.filenames = list(filenames)
+        self.cacheSize = cacheSize
+        self.cache = OrderedDict()
+        self.nReads = 0
+        # The series can be read from a background thread (prefetch)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def __getitem__(self, idx):
+        '''
+        Returns the NanoscopeForceRamp of file idx, reading it if it is
+        not in the cache
+        '''
+        with self.lock:
+            if idx in self.cache:
+                self.cache.move_to_end(idx)
+                return self.cache[idx]
+
+        forceRamp = NanoscopeForceRamp(self.filenames[idx])
+        forceRamp.read()
+
+        with self.lock:
+            self.nReads += 1
+            self.cache[idx] = forceRamp
+            self.cache.move_to_end(idx)
+            while len(self.cache) > self.cacheSize:
+                self.cache.popitem(last=False)
+
+        return forceRamp
+
+    def isCached(self, idx):
+        with self.lock:
+            return idx in self.cache
+
+    def prefetch(self, indices):
+        '''
+        Reads into the cache the files indices (those within the series)
+        '''
+        for idx in indices:
+            if 0 <= idx < len(self.filenames) and not self.isCached(idx):
+                self[idx]
+
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
+
+    def toArray(self, channel=0, workers=None, dtype=np.float64, cancelEvent=None):
+        '''
+        Reads every file of the series in parallel (see readForceRampsArray)
+        and returns a compact (len(self), 2, nRampPoints) array of dtype
+        with the force ramps of channel
+        '''
+        return readForceRampsArray(self.filenames, channel, workers, dtype=dtype,
+                                   cancelEvent=cancelEvent)
+
+    def buildFeatureIndex(self, channel=0, workers=None, cancelEvent=None):
+        '''
+        Reads every file of the series (see toArray), computes the features
+        of their force ramps, and returns a CurveFeatureIndex on them, kept
+        in an in-memory database. Force ramp idx of the series is stored as
+        (NX, NY) = (idx, 0) of experiment 0.
+        It takes as long as reading the whole series: run it in the
+        background (see FeatureIndexWorker).
+        '''
+        forceRamps = self.toArray(channel, workers, cancelEvent=cancelEvent)
+        features = computeFeatures(forceRamps[:, 0, :], forceRamps[:, 1, :])
+
+        return memoryFeatureIndex(features, nColumns=1)
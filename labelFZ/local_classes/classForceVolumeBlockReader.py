@@ -0,0 +1,100 @@
+###############################################################################
+# Imports
+###############################################################################
+import numpy as np
+
+###############################################################################
+# Memory used by the ingest of a force volume file, besides the block of rows
+# being read: the scaled float64 copy of the row being inserted and the
+# temporaries of its features take about 4-5 times the int32 row itself
+###############################################################################
+
+# Default ceiling (bytes) of the memory used to ingest a force volume file
+INGEST_MEMORY_LIMIT = 256 * 2**20
+
+# Working memory of the ingest, in int32 rows of the map
+ROW_WORKING_MEMORY = 5
+
+###############################################################################
+# A class named ForceVolumeBlockReader is declared, which reads the force
+# ramps of a force volume file in blocks of rows, for out-of-core ingest
+###############################################################################
+
+
+class ForceVolumeBlockReader():
+    '''
+    Sequential access, row by row, to the (rows, columns, 2, rampPoints)
+    int32 Deflection Error data of an open force volume file (a
+    NanoscopeFile), for files of any size.
+    Rows are read in blocks of blockRows whole rows of the map, each with
+    a single positioned read into the same buffer, allocated once: reading
+    row i outside the current block overwrites it with the block starting
+    at i. blockRows is the largest number of rows such that the buffer and
+    the working memory of the ingest (ROW_WORKING_MEMORY rows) stay under
+    maxMemory bytes, and at least 1. Unlike a memory map, the rows already
+    read do not stay resident in the memory of the process.
+    It can be indexed as the array itself, with the row first:
+    reader[i], reader[i, j, 0, :]
+    The arrays returned are read-only views of the buffer: they are only
+    valid until a row outside the current block is read (copy them to
+    keep them longer).
+
+    Attributes:
+        shape, dtype, blockRows
+        nReads: number of blocks read so far
+
+    Methods:
+        __init__(nanoscopeFile, shape, channel='Deflection Error', dtype='<i4',
+                 maxMemory=INGEST_MEMORY_LIMIT)
+        __len__()
+        __getitem__(key)
+        getRow(i)
+    '''
+
+    def __init__(self, nanoscopeFile, shape, channel='Deflection Error', dtype='<i4',
+                 maxMemory=INGEST_MEMORY_LIMIT):
+        self.nanoscopeFile = nanoscopeFile
+        self.channel = nanoscopeFile.getChannel(channel)
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.rowSize = int(np.prod(self.shape[1:]))
+        rowBytes = self.rowSize * self.dtype.itemsize
+        self.blockRows = min(max(maxMemory // rowBytes - ROW_WORKING_MEMORY, 1), self.shape[0])
+        self.buffer = np.empty((self.blockRows,) + self.shape[1:], dtype=self.dtype)
+        self.block = None
+        self.blockStart = 0
+        self.nReads = 0
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            return self.getRow(key[0])[key[1:]]
+        return self.getRow(key)
+
+    def getRow(self, i):
+        '''
+        Returns row i of the map, as a read-only (columns, 2, rampPoints)
+        view of the buffer
+        '''
+        if not 0 <= i < self.shape[0]:
+            raise IndexError(f"Row {i} is out of the map, with {self.shape[0]} rows")
+        if self.block is None or not self.blockStart <= i < self.blockStart + self.block.shape[0]:
+            self.readBlock(i)
+        return self.block[i - self.blockStart]
+
+    def readBlock(self, rowStart):
+        '''
+        Reads the block of rows starting at rowStart
+        '''
+        nRows = min(self.blockRows, self.shape[0] - rowStart)
+        block = self.buffer[:nRows]
+        offset = self.channel['offset'] + rowStart*self.rowSize*self.dtype.itemsize
+        if self.nanoscopeFile.readInto(offset, block) != block.nbytes:
+            raise EOFError(f"Rows {rowStart} to {rowStart+nRows-1} are beyond the end of "
+                           f"{self.nanoscopeFile.file_name}")
+        self.block = block.view()
+        self.block.setflags(write=False)
+        self.blockStart = rowStart
+        self.nReads += 1
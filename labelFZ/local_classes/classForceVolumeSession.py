@@ -0,0 +1,511 @@
+###############################################################################
+# Imports
+###############################################################################
+import io
+import sqlite3
+import threading
+import numpy as np
+from .classNanoscopeForceVolume import (NanoscopeForceVolumeObject, convert_array, decodeCurve,
+                                        isCountsDtype, CURVE_CODECS)
+from .classCurveFeatures import FEATURE_NAMES, CurveFeatureIndex
+from .classUnitConversion import UnitConverter
+
+# Columns of RawDataTable with a value per force ramp, which can be shown
+# as a map of the experiment
+MAP_COLUMNS = ('Height',)
+
+# Bytes read to parse the header of a .npy blob (np.save pads it to a
+# multiple of 64 bytes, 128 for 1-D curves)
+NPY_HEADER_BYTES = 1024
+
+# Ceiling (bytes) of the force ramps of an experiment kept in physical
+# units, in both directions (see getPhysicalForceRamps)
+PHYSICAL_CACHE_LIMIT = 512 * 2**20
+
+###############################################################################
+# A class named ForceVolumeSession is declared, which keeps a database
+# created by NanoscopeForceVolumeObject.fvToSQL open, for fast access to the
+# force ramps of one of its experiments
+###############################################################################
+
+
+class ForceVolumeSession():
+    '''
+    Long-lived access to the force ramps of one experiment in a force
+    volume database.
+    A single connection is kept open for the whole session, all queries
+    are parameterized (so sqlite reuses their prepared statements), and the
+    metadata of the experiment and the x axis of the ramps are read once.
+    Getting a force ramp then costs a single indexed blob fetch.
+    A window of the samples of a force ramp (e.g. the part of it in a
+    zoomed view) of an uncompressed curve is read with incremental blob
+    I/O: only its bytes are read from the database.
+    Curves stored as integer counts are scaled as they are read, into
+    arrays of dtype (np.float32 halves the memory of the force ramps): a
+    whole batch of them with a single multiplication.
+
+    Attributes:
+        database_name, experimentID
+        connector to the database
+        nRows, nColumns, nRampPoints, rampLength, curveEncoding, curveDtype,
+        curveScale: metadata of the experiment, from ExperimentalParametersTable
+        dtype: of the force ramps returned
+        photodiodeSensitivity, forceConstant, probeRadius: calibration of
+            the experiment, from ExperimentalParametersTable
+        converter: UnitConverter with that calibration
+        xDimensions, xIndices:
+            (read-only) x axis of the ramps, in nm or as sample indices
+        features: CurveFeatureIndex, to find force ramps by their features
+
+    Methods:
+        getNumberForceRamps()
+        getForceRamp(idx, direction='ForceForward', xDimensions=True)
+        getForceRamps(ids=None, row=None, rectangle=None, direction='ForceForward')
+        getForceRampWindow(idx, start, stop, direction='ForceForward', xDimensions=True)
+        iterRows(direction='ForceForward', readAhead=8)
+        getMapNames()
+        getMap(name='Height')
+        getXData(xDimensions=True)
+        setCalibration(photodiodeSensitivity=None, forceConstant=None, probeRadius=None)
+        getPhysicalForceRamps(ids=None, direction='ForceForward')
+        fitsPhysicalCache()
+        decode(blob)
+        reopen()
+        close()
+
+    It can be used as a context manager, which closes the connection on exit.
+    '''
+
+    def __init__(self, database_name, experimentID, dtype=np.float64):
+        '''
+        Opens the connection to database_name and reads the metadata
+        of experiment experimentID (the id returned by fvToSQL)
+        '''
+        self.database_name = database_name
+        self.experimentID = experimentID
+        self.dtype = np.dtype(dtype)
+        # Databases created by older versions miss some of the columns read
+        NanoscopeForceVolumeObject().upgradeDataBase(database_name)
+        self.connector = sqlite3.connect(database_name)
+
+        sql_command = """
+                      SELECT nRows, nColumns, nRampPoints, rampLength, curveEncoding, curveDtype,
+                             curveScale, photodiodeSensitivity, forceConstant, probeRadius
+                      FROM ExperimentalParametersTable
+                      WHERE id = ?;
+                      """
+        data = self.connector.execute(sql_command, (experimentID,)).fetchone()
+        if data is None:
+            self.connector.close()
+            raise ValueError(f"No experiment with id {experimentID} in {database_name}")
+        (self.nRows, self.nColumns, self.nRampPoints, self.rampLength,
+         self.curveEncoding, self.curveDtype, self.curveScale) = data[:7]
+        (self.photodiodeSensitivity, self.forceConstant, self.probeRadius) = data[7:]
+        self.storesCounts = isCountsDtype(self.curveDtype)
+        self.converter = self.newConverter()
+
+        self.xDimensions = np.linspace(0., self.rampLength, self.nRampPoints)
+        self.xIndices = np.linspace(0, self.nRampPoints-1, self.nRampPoints)
+        self.xDimensions.setflags(write=False)
+        self.xIndices.setflags(write=False)
+
+        # One SQL string per direction, so that each of them is prepared
+        # only once (column names cannot be parameters)
+        self.sql_ramp = {
+            direction: f"""
+                      SELECT {direction}
+                      FROM RawDataTable
+                      WHERE ExperimentID = ? AND NX = ? AND NY = ?;
+                      """
+            for direction in ('ForceForward', 'ForceBackward')
+        }
+        self.sql_rectangle = {
+            direction: f"""
+                      SELECT NX, NY, {direction}
+                      FROM RawDataTable
+                      WHERE ExperimentID = ? AND NX BETWEEN ? AND ? AND NY BETWEEN ? AND ?;
+                      """
+            for direction in ('ForceForward', 'ForceBackward')
+        }
+        # Joining on a VALUES list of (NX, NY) pairs lets sqlite look every
+        # pair up through the (ExperimentID, NX, NY) index. The placeholders
+        # of the pairs are filled in with pairsCommand.
+        self.sql_pairs = {
+            direction: f"""
+                      SELECT NX, NY, {direction}
+                      FROM (VALUES {{pairs}}) AS pairs
+                      JOIN RawDataTable
+                      ON ExperimentID = ? AND NX = pairs.column1 AND NY = pairs.column2;
+                      """
+            for direction in ('ForceForward', 'ForceBackward')
+        }
+        self.sql_rowid = """
+                      SELECT rowid
+                      FROM RawDataTable
+                      WHERE ExperimentID = ? AND NX = ? AND NY = ?;
+                      """
+        # (offset, dtype) of the data in the .npy blobs, the same for all
+        # the force ramps of the experiment (see readBlobWindow)
+        self.npyLayout = None
+        # Maps read so far, by name
+        self.maps = {}
+        # Force ramps of the whole experiment in physical units, by
+        # direction, shared with the sessions reopened from this one
+        self.physicalForceRamps = {}
+        self.physicalLock = threading.Lock()
+        self.features = CurveFeatureIndex(self.connector, experimentID, self.nColumns)
+
+    def reopen(self):
+        '''
+        Returns a new session on the same experiment, with its own
+        connection (e.g. to be used from another thread). Both sessions
+        share the force ramps converted to physical units, until the
+        calibration of either of them changes.
+        '''
+        session = ForceVolumeSession(self.database_name, self.experimentID, self.dtype)
+        session.physicalForceRamps = self.physicalForceRamps
+        session.physicalLock = self.physicalLock
+        return session
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        '''
+        Closes the connection to the database
+        '''
+        self.connector.close()
+
+    def getNumberForceRamps(self):
+        return self.nRows * self.nColumns
+
+    def getXData(self, xDimensions=True):
+        '''
+        Returns the (cached) x axis of the force ramps
+        '''
+        return self.xDimensions if xDimensions == True else self.xIndices
+
+    def newConverter(self):
+        return UnitConverter(self.photodiodeSensitivity, self.forceConstant,
+                             self.probeRadius, self.rampLength)
+
+    def setCalibration(self, photodiodeSensitivity=None, forceConstant=None, probeRadius=None):
+        '''
+        Saves the calibration parameters given (the rest keep their values)
+        in ExperimentalParametersTable, and discards the force ramps
+        converted with the previous ones
+        '''
+        calibration = {'photodiodeSensitivity': photodiodeSensitivity,
+                       'forceConstant': forceConstant,
+                       'probeRadius': probeRadius}
+        calibration = {name: float(value) for name, value in calibration.items()
+                       if value is not None}
+        if not calibration:
+            return
+        sql_command = f"""
+                      UPDATE ExperimentalParametersTable
+                      SET {', '.join(f'{name} = ?' for name in calibration)}
+                      WHERE id = ?;
+                      """
+        self.connector.execute(sql_command, tuple(calibration.values()) + (self.experimentID,))
+        self.connector.commit()
+        for name, value in calibration.items():
+            setattr(self, name, value)
+        self.converter = self.newConverter()
+        self.physicalForceRamps = {}
+
+    def getPhysicalForceRamps(self, ids=None, direction='ForceForward', readAhead=64,
+                              dtype=np.float32):
+        '''
+        Returns (separation, force), two (n, nRampPoints) arrays with the
+        force ramps ids (all of them, in row-major order, if not given)
+        converted to tip-sample separation (nm) and force (nN) with the
+        calibration of the experiment (see UnitConverter).
+        The whole experiment is converted the first time, readAhead rows of
+        the map per query and per broadcasted pass, and kept (read-only, as
+        dtype) until the calibration changes: later calls just index it.
+        Sessions sharing the cache (see reopen) convert it only once.
+        '''
+        with self.physicalLock:
+            if direction not in self.physicalForceRamps:
+                self.convertPhysicalForceRamps(direction, readAhead, dtype)
+            separation, force = self.physicalForceRamps[direction]
+        if ids is None:
+            return separation, force
+        ids = np.asarray(ids, dtype=np.intp)
+        return separation[ids], force[ids]
+
+    def convertPhysicalForceRamps(self, direction, readAhead, dtype):
+        '''
+        Converts all the force ramps of the experiment in direction to
+        physical units, into the cache of getPhysicalForceRamps
+        '''
+        nRamps = self.getNumberForceRamps()
+        separation = np.empty((nRamps, self.nRampPoints), dtype=dtype)
+        force = np.empty((nRamps, self.nRampPoints), dtype=dtype)
+        for rowStart in range(0, self.nRows, readAhead):
+            rowStop = min(rowStart + readAhead, self.nRows)
+            block = slice(rowStart*self.nColumns, rowStop*self.nColumns)
+            forceRamps = self.getForceRamps(
+                    rectangle=(rowStart, rowStop, 0, self.nColumns), direction=direction
+                    )
+            separation[block], force[block] = self.converter.convert(self.xDimensions, forceRamps)
+        separation.setflags(write=False)
+        force.setflags(write=False)
+        self.physicalForceRamps[direction] = (separation, force)
+
+    def fitsPhysicalCache(self, dtype=np.float32):
+        '''
+        Whether the force ramps of the experiment, in both directions, fit
+        in PHYSICAL_CACHE_LIMIT bytes once converted to physical units
+        '''
+        nBytes = 2 * 2 * self.getNumberForceRamps() * self.nRampPoints * np.dtype(dtype).itemsize
+        return nBytes <= PHYSICAL_CACHE_LIMIT
+
+    def decode(self, blob):
+        '''
+        Returns the force ramp stored in blob as a numpy array
+        '''
+        if self.curveEncoding not in CURVE_CODECS:
+            blob = convert_array(blob)
+        return decodeCurve(blob, self.curveEncoding, self.curveDtype, self.curveScale, self.dtype)
+
+    def sqlFor(self, sqlCommands, direction):
+        '''
+        Returns the SQL command of sqlCommands (one of the dictionaries
+        sql_ramp, sql_rectangle or sql_pairs) for direction
+        '''
+        if direction not in sqlCommands:
+            raise ValueError(f"Unknown direction {direction!r}")
+        return sqlCommands[direction]
+
+    def pairsCommand(self, direction, nPairs):
+        '''
+        Returns the SQL command of sql_pairs for direction (checked with
+        sqlFor), with the placeholders of nPairs (NX, NY) pairs
+        '''
+        return self.sql_pairs[direction].format(pairs=', '.join(['(?, ?)'] * nPairs))
+
+    def decodeUnscaled(self, blob):
+        '''
+        Returns the force ramp stored in blob as a numpy array, without
+        scaling integer counts (see scale)
+        '''
+        if self.curveEncoding in CURVE_CODECS:
+            return CURVE_CODECS[self.curveEncoding][1](blob, self.curveDtype)
+        return convert_array(blob)
+
+    def scale(self, forceRamps):
+        '''
+        Scales, in place, an array of force ramps filled by decodeUnscaled
+        '''
+        if self.storesCounts:
+            forceRamps *= self.curveScale
+        return forceRamps
+
+    def getForceRamp(self, idx, direction='ForceForward', xDimensions=True):
+        '''
+        Returns the (xData, yData) force ramp number idx (starting at 0,
+        row-major order) of the experiment.
+        xData is shared by all the ramps of the session, and is read-only.
+        '''
+        NX, NY = divmod(idx, self.nColumns)
+        data = self.connector.execute(
+                self.sqlFor(self.sql_ramp, direction), (self.experimentID, NX, NY)
+                ).fetchone()
+        if data is None:
+            raise IndexError(f"No force ramp {idx} in experiment {self.experimentID}")
+
+        return (self.getXData(xDimensions), self.decode(data[0]))
+
+    def getForceRampWindow(self, idx, start, stop, direction='ForceForward', xDimensions=True):
+        '''
+        Returns the samples [start, stop) of the (xData, yData) force ramp
+        number idx (as in getForceRamp). Curves stored as raw bytes or as
+        .npy are read with incremental blob I/O, so that only the bytes of
+        the window are read; curves with any other encoding are decoded
+        whole and sliced (compressed curves, see CURVE_CODECS).
+        '''
+        sql_command = self.sqlFor(self.sql_ramp, direction)
+        start, stop, _ = slice(start, stop).indices(self.nRampPoints)
+        stop = max(start, stop)
+        NX, NY = divmod(idx, self.nColumns)
+        data = self.connector.execute(self.sql_rowid, (self.experimentID, NX, NY)).fetchone()
+        if data is None:
+            raise IndexError(f"No force ramp {idx} in experiment {self.experimentID}")
+        xData = self.getXData(xDimensions)[start:stop]
+
+        if self.curveEncoding not in ('raw', 'npy'):
+            blob = self.connector.execute(
+                    sql_command, (self.experimentID, NX, NY)
+                    ).fetchone()[0]
+            return xData, self.decode(blob)[start:stop]
+
+        window = self.readBlobWindow(data[0], direction, start, stop)
+        return xData, decodeCurve(window, 'npy', self.curveDtype, self.curveScale, self.dtype)
+
+    def readBlobWindow(self, rowid, column, start, stop):
+        '''
+        Returns the samples [start, stop) of the curve in column of row
+        rowid of RawDataTable, reading only their bytes (and, once per
+        session, the header of the .npy blobs)
+        '''
+        if self.curveEncoding == 'raw':
+            offset, dtype = 0, np.dtype(self.curveDtype)
+        else:
+            if self.npyLayout is None:
+                header = io.BytesIO(self.readBlob(rowid, column, 0, NPY_HEADER_BYTES))
+                if np.lib.format.read_magic(header) == (1, 0):
+                    shape, fortranOrder, dtype = np.lib.format.read_array_header_1_0(header)
+                else:
+                    shape, fortranOrder, dtype = np.lib.format.read_array_header_2_0(header)
+                self.npyLayout = (header.tell(), dtype)
+            offset, dtype = self.npyLayout
+        data = self.readBlob(rowid, column, offset + start*dtype.itemsize,
+                             (stop-start) * dtype.itemsize)
+        return np.frombuffer(data, dtype=dtype)
+
+    def readBlob(self, rowid, column, offset, length):
+        '''
+        Returns length bytes (or up to the end of the blob) from offset of
+        the blob in column of row rowid of RawDataTable
+        '''
+        if length <= 0:
+            return b''
+        if hasattr(self.connector, 'blobopen'):
+            with self.connector.blobopen('RawDataTable', column, rowid) as blob:
+                blob.seek(min(offset, len(blob)))
+                return blob.read(length)
+        # sqlite3 of Python < 3.11: substr of a blob is in bytes, from 1
+        sql_command = f"SELECT substr({column}, ?, ?) FROM RawDataTable WHERE rowid = ?;"
+        return bytes(self.connector.execute(sql_command, (offset+1, length, rowid)).fetchone()[0])
+
+    def newForceRampsArray(self, nRamps):
+        '''
+        Returns an empty (nRamps, nRampPoints) array of dtype for decoded
+        force ramps
+        '''
+        return np.empty((nRamps, self.nRampPoints), dtype=self.dtype.newbyteorder('='))
+
+    def getForceRamps(self, ids=None, row=None, rectangle=None, direction='ForceForward'):
+        '''
+        Returns a (n, nRampPoints) array with many force ramps of the
+        experiment, fetched with a single query (or a few, for long lists of
+        ids) and decoded straight into the array. The ramps are given by
+        exactly one of:
+            ids: sequence of force ramp numbers (starting at 0, row-major
+                 order), returned in the same order
+            row: a row of the map (NX), returned by column (NY)
+            rectangle: (rowStart, rowStop, columnStart, columnStop), the
+                 ramps with rowStart <= NX < rowStop and
+                 columnStart <= NY < columnStop, in row-major order
+        '''
+        if sum(argument is not None for argument in (ids, row, rectangle)) != 1:
+            raise ValueError("Exactly one of ids, row or rectangle must be given")
+
+        if ids is not None:
+            return self.getForceRampsFromIDs(ids, direction)
+
+        if row is not None:
+            rectangle = (row, row+1, 0, self.nColumns)
+        rowStart, rowStop, columnStart, columnStop = rectangle
+        width = columnStop - columnStart
+        forceRamps = self.newForceRampsArray((rowStop-rowStart) * width)
+
+        cursor = self.connector.execute(
+                self.sqlFor(self.sql_rectangle, direction),
+                (self.experimentID, rowStart, rowStop-1, columnStart, columnStop-1)
+                )
+        nFetched = 0
+        for NX, NY, blob in cursor:
+            forceRamps[(NX-rowStart)*width + NY-columnStart] = self.decodeUnscaled(blob)
+            nFetched += 1
+        if nFetched != forceRamps.shape[0]:
+            raise IndexError(f"Rectangle {rectangle} is out of the map of experiment {self.experimentID}")
+
+        return self.scale(forceRamps)
+
+    def getForceRampsFromIDs(self, ids, direction='ForceForward', chunkSize=400):
+        '''
+        Returns a (len(ids), nRampPoints) array with the force ramps ids.
+        The ramps are fetched with one query per chunkSize ids, so that the
+        number of SQL parameters stays under the limit of sqlite.
+        '''
+        self.sqlFor(self.sql_pairs, direction)
+        ids = np.asarray(ids, dtype=np.int64).ravel()
+        forceRamps = self.newForceRampsArray(ids.shape[0])
+        # A ramp might be asked for more than once
+        slots = {}
+        for slot, idx in enumerate(ids.tolist()):
+            slots.setdefault(divmod(idx, self.nColumns), []).append(slot)
+        pairs = list(slots)
+
+        for start in range(0, len(pairs), chunkSize):
+            chunk = pairs[start:start+chunkSize]
+            sql_command = self.pairsCommand(direction, len(chunk))
+            parameters = []
+            for NX, NY in chunk:
+                parameters.extend((NX, NY))
+            parameters.append(self.experimentID)
+            for NX, NY, blob in self.connector.execute(sql_command, parameters):
+                forceRamps[slots.pop((NX, NY))] = self.decodeUnscaled(blob)
+
+        if slots:
+            missing = [NX*self.nColumns + NY for NX, NY in slots]
+            raise IndexError(f"No force ramps {missing} in experiment {self.experimentID}")
+
+        return self.scale(forceRamps)
+
+    def iterRows(self, direction='ForceForward', readAhead=8):
+        '''
+        Iterates over the rows of the map, yielding (NX, forceRamps) with
+        forceRamps a (nColumns, nRampPoints) array. readAhead rows are
+        fetched at once, so that scanning the whole map takes
+        nRows/readAhead queries.
+        '''
+        for rowStart in range(0, self.nRows, readAhead):
+            rowStop = min(rowStart + readAhead, self.nRows)
+            forceRamps = self.getForceRamps(
+                    rectangle=(rowStart, rowStop, 0, self.nColumns), direction=direction
+                    ).reshape(rowStop-rowStart, self.nColumns, self.nRampPoints)
+            for NX in range(rowStart, rowStop):
+                yield NX, forceRamps[NX-rowStart]
+
+    def getMapNames(self):
+        '''
+        Returns the names of the maps of the experiment: the columns of
+        RawDataTable in MAP_COLUMNS, and its features, if computed
+        '''
+        if self.features.hasFeatures():
+            return list(MAP_COLUMNS) + list(FEATURE_NAMES)
+        return list(MAP_COLUMNS)
+
+    def getMap(self, name='Height'):
+        '''
+        Returns the (nRows, nColumns) array with the value of column (or
+        feature) name for every force ramp of the experiment, read with a
+        single query the first time it is asked for. Missing ramps are nan.
+        '''
+        if name not in self.maps:
+            if name in MAP_COLUMNS:
+                table = 'RawDataTable'
+            elif name in FEATURE_NAMES:
+                table = 'CurveFeaturesTable'
+            else:
+                raise ValueError(f"No map {name!r}, must be one of {MAP_COLUMNS + FEATURE_NAMES}")
+            sql_command = f"""
+                      SELECT NX, NY, {name}
+                      FROM {table}
+                      WHERE ExperimentID = ?;
+                      """
+            data = np.array(self.connector.execute(sql_command, (self.experimentID,)).fetchall(),
+                            dtype=np.float64).reshape(-1, 3)
+            mapArray = np.full((self.nRows, self.nColumns), np.nan)
+            mapArray[data[:, 0].astype(int), data[:, 1].astype(int)] = data[:, 2]
+            mapArray.setflags(write=False)
+            self.maps[name] = mapArray
+
+        return self.maps[name]
@@ -0,0 +1,422 @@
+###############################################################################
+# Imports
+###############################################################################
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+from .classNanoscopeForceVolume import (NanoscopeForceVolumeObject, fileFingerprint, directionIndex,
+                                        DEFLECTION_SCALE)
+from .classForceVolumeBlockReader import INGEST_MEMORY_LIMIT
+from .classForceVolumeSession import ForceVolumeSession
+from .classCurveFeatures import FEATURE_NAMES, memoryFeatureIndex
+from .classUnitConversion import UnitConverter, calibrationFromHeader
+
+###############################################################################
+# Storage backends of force volumes. A store gives access to the force ramps
+# of one force volume with the API of ForceVolumeSession (the SQLite store):
+#   nRows, nColumns, nRampPoints, rampLength, xDimensions, converter,
+#   features (CurveFeatureIndex, or None), dtype
+#   getNumberForceRamps(), getXData(xDimensions=True)
+#   getForceRamp(idx, direction='ForceForward', xDimensions=True)
+#   getForceRamps(ids=None, row=None, rectangle=None, direction='ForceForward')
+#   getForceRampWindow(idx, start, stop, direction='ForceForward', xDimensions=True)
+#   getMapNames(), getMap(name), reopen(), close()
+# reopen() returns a new store on the same data, to be used from another
+# thread. The stores are:
+#   sqlite: ForceVolumeSession, on a database written by fvToSQL
+#   memmap: MemoryMapStore, straight on the force volume file, no ingest
+#   chunked: ChunkedArrayStore, on a directory of .npy chunks written by
+#       writeChunkedArrayStore
+###############################################################################
+
+STORAGE_BACKENDS = ('sqlite', 'memmap', 'chunked')
+
+SQLITE_MAGIC = b'SQLite format 3\x00'
+
+# Number of force ramps per chunk of a ChunkedArrayStore
+CHUNK_CURVES = 4096
+
+CHUNKED_METADATA = 'metadata.json'
+
+# Directory where the GUI keeps chunked stores
+CHUNKED_STORES_DIRECTORY = 'temporalChunks'
+
+
+def storageBackend(path):
+    '''
+    Returns the storage backend of path: a directory is a chunked store, an
+    sqlite database an sqlite store, and any other file a force volume
+    file, read with a memory map
+    '''
+    if os.path.isdir(path):
+        return 'chunked'
+    with open(path, 'rb') as file:
+        if file.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC:
+            return 'sqlite'
+    return 'memmap'
+
+
+def openStore(path, experimentID=None, dtype=np.float64):
+    '''
+    Returns the store of the force volume in path (see storageBackend).
+    experimentID, the id returned by fvToSQL, is needed by sqlite stores
+    (which hold many force volumes), and ignored by the others.
+    '''
+    backend = storageBackend(path)
+    if backend == 'sqlite':
+        if experimentID is None:
+            raise ValueError(f"{path} is an sqlite database: an experimentID is needed")
+        return ForceVolumeSession(path, experimentID, dtype)
+    if backend == 'chunked':
+        return ChunkedArrayStore(path, dtype)
+    return MemoryMapStore(path, dtype)
+
+
+def directorySize(path):
+    '''
+    Returns the size in bytes of the file path, or of all the files in the
+    directory path
+    '''
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+def selectedIDs(nRows, nColumns, ids=None, row=None, rectangle=None):
+    '''
+    Returns the force ramp numbers (row-major order) given by exactly one
+    of ids, row or rectangle, as in ForceVolumeSession.getForceRamps
+    '''
+    if sum(argument is not None for argument in (ids, row, rectangle)) != 1:
+        raise ValueError("Exactly one of ids, row or rectangle must be given")
+    if ids is not None:
+        return np.asarray(ids, dtype=np.int64).ravel()
+
+    if row is not None:
+        rectangle = (row, row+1, 0, nColumns)
+    rowStart, rowStop, columnStart, columnStop = rectangle
+    if not (0 <= rowStart <= rowStop <= nRows and 0 <= columnStart <= columnStop <= nColumns):
+        raise IndexError(f"Rectangle {tuple(rectangle)} out of the {nRows}x{nColumns} map")
+    return (np.arange(rowStart, rowStop)[:, None]*nColumns + np.arange(columnStart, columnStop)).ravel()
+
+###############################################################################
+# A class named MemoryMapStore is declared, a store reading the force ramps
+# straight from the force volume file
+###############################################################################
+
+
+class MemoryMapStore():
+    '''
+    Store on a force volume file, opened with
+    NanoscopeForceVolumeObject.openMemoryMap: nothing is ingested, and
+    each batch of force ramps is read from the file (through the page
+    cache) with a single fancy indexing of the memory map. There are no
+    features, and the only map is Height.
+
+    Attributes:
+        file_name, fvObject, dtype
+        nRows, nColumns, nRampPoints, rampLength, xDimensions, xIndices
+        converter: UnitConverter with the calibration in the header
+        features: None
+    '''
+
+    def __init__(self, file_name, dtype=np.float64):
+        self.file_name = file_name
+        self.dtype = np.dtype(dtype)
+        self.fvObject = NanoscopeForceVolumeObject()
+        self.fvObject.openMemoryMap(file_name)
+        fvParameters = self.fvObject.fvParameters
+        self.nRows = fvParameters['numberOfMapRows'][0]
+        self.nColumns = fvParameters['numberOfMapColumns'][0]
+        self.nRampPoints = fvParameters['rampPoints'][0]
+        self.rampLength = fvParameters['rampLength'][0]
+        self.xDimensions = np.linspace(0., self.rampLength, self.nRampPoints)
+        self.xIndices = np.linspace(0, self.nRampPoints-1, self.nRampPoints)
+        self.xDimensions.setflags(write=False)
+        self.xIndices.setflags(write=False)
+        self.converter = self.fvObject.getConverterFromMap()
+        self.features = None
+        self.maps = {}
+
+    def reopen(self):
+        return MemoryMapStore(self.file_name, self.dtype)
+
+    def close(self):
+        # The memory maps are closed when they are no longer referenced
+        pass
+
+    def getNumberForceRamps(self):
+        return self.nRows * self.nColumns
+
+    def getXData(self, xDimensions=True):
+        return self.xDimensions if xDimensions == True else self.xIndices
+
+    def getForceRamp(self, idx, direction='ForceForward', xDimensions=True):
+        return self.getXData(xDimensions), self.getForceRamps(ids=[idx], direction=direction)[0]
+
+    def getForceRamps(self, ids=None, row=None, rectangle=None, direction='ForceForward'):
+        '''
+        Returns a (n, nRampPoints) array with the force ramps given by
+        exactly one of ids, row or rectangle (see selectedIDs)
+        '''
+        ids = selectedIDs(self.nRows, self.nColumns, ids, row, rectangle)
+        return self.fvObject.getForceRampsFromMap(ids, direction).astype(self.dtype, copy=False)
+
+    def getForceRampWindow(self, idx, start, stop, direction='ForceForward', xDimensions=True):
+        '''
+        Returns the samples [start, stop) of the (xData, yData) force ramp
+        idx, sliced from the memory map
+        '''
+        if not 0 <= idx < self.getNumberForceRamps():
+            raise IndexError(f"No force ramp {idx} in {self.file_name}")
+        window = slice(start, stop)
+        yData = self.fvObject.getForceRampWindowFromMap(idx, start, stop, direction)[1]
+        return self.getXData(xDimensions)[window], yData.astype(self.dtype, copy=False)
+
+    def getMapNames(self):
+        return ['Height']
+
+    def getMap(self, name='Height'):
+        if name != 'Height':
+            raise ValueError(f"No map {name!r} in {self.file_name}")
+        if name not in self.maps:
+            mapArray = np.asarray(self.fvObject.getTopographyFromMap())
+            mapArray.setflags(write=False)
+            self.maps[name] = mapArray
+        return self.maps[name]
+
+###############################################################################
+# Writer and class of the chunked store: a directory with the metadata of
+# the force volume (metadata.json), its Height map and the features of its
+# force ramps (Height.npy, features.npy), and the int32 counts of its force
+# ramps in chunks of CHUNK_CURVES of them, one .npy file per direction
+# (ForceForward_00000.npy, ForceBackward_00000.npy, ...), with shape
+# (CHUNK_CURVES, nRampPoints) (the last ones may be shorter)
+###############################################################################
+
+
+def chunkName(direction, chunk):
+    return f"{direction}_{chunk:05d}.npy"
+
+
+def chunkedStoreDirectory(file_name, root=CHUNKED_STORES_DIRECTORY):
+    '''
+    Returns the directory, in root, of the chunked store of file_name: its
+    whole basename (Nanoscope files often differ only by their numbered
+    extension, e.g. sample.000 and sample.001) and a hash of its absolute
+    path, so that every file has its own store
+    '''
+    path = os.path.abspath(file_name)
+    digest = hashlib.blake2b(path.encode(), digest_size=4).hexdigest()
+    return os.path.join(root, f"{os.path.basename(path)}_{digest}")
+
+
+def readChunkedMetadata(directory):
+    '''
+    Returns the metadata of the chunked store in directory, or None if
+    there is none
+    '''
+    try:
+        with open(os.path.join(directory, CHUNKED_METADATA)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def writeChunkedArrayStore(file_name, directory, chunkCurves=CHUNK_CURVES,
+                           progressCallback=None, cancelEvent=None, maxMemory=INGEST_MEMORY_LIMIT):
+    '''
+    Writes the force volume file file_name as a chunked store in
+    directory (see ChunkedArrayStore). If directory already holds
+    file_name, and the file has not changed since (see fileFingerprint),
+    nothing is read or written.
+    The file is read in blocks of rows (see ForceVolumeBlockReader), and
+    whole chunks are written at once, each of them within half of
+    maxMemory bytes and the blocks within the other half (chunks of long
+    force ramps may then have fewer than chunkCurves of them). The
+    store is written in a temporary directory, which replaces directory
+    at the end; if cancelEvent is set, it is deleted and IngestCancelled
+    is raised. progressCallback is called as in fvToSQL.
+    Returns directory.
+    '''
+    fvObject = NanoscopeForceVolumeObject()
+    with fvObject.openFile(file_name) as nanoscopeFile:
+        fingerprint = list(fileFingerprint(file_name, nanoscopeFile))
+        metadata = readChunkedMetadata(directory)
+        if metadata is not None and metadata['fingerprint'] == fingerprint:
+            return directory
+
+        fvParameters = fvObject.headerToParameters(nanoscopeFile.headerParameters)
+        nRows = fvParameters['numberOfMapRows'][0]
+        nColumns = fvParameters['numberOfMapColumns'][0]
+        nRampPoints = fvParameters['rampPoints'][0]
+        fvDataArray = fvObject.readFVChannelBlocks(nanoscopeFile, fvParameters, maxMemory // 2)
+        # Chunks are made of whole rows of the map
+        rowBytes = nColumns * 2 * nRampPoints * np.dtype('<i4').itemsize
+        chunkRows = min(max(chunkCurves // nColumns, 1), max(maxMemory // (2*rowBytes), 1), nRows)
+        partial = directory.rstrip(os.sep) + '.partial'
+        shutil.rmtree(partial, ignore_errors=True)
+        os.makedirs(partial)
+        try:
+            np.save(os.path.join(partial, 'Height.npy'),
+                    fvObject.readTopographyChannel(nanoscopeFile, fvParameters))
+            features = np.empty((nRows, nColumns, len(FEATURE_NAMES)))
+            chunk = np.empty((chunkRows, nColumns, 2, nRampPoints), dtype='<i4')
+            for rowStart in range(0, nRows, chunkRows):
+                rowStop = min(rowStart + chunkRows, nRows)
+                for i in range(rowStart, rowStop):
+                    fvObject.checkIngest(i, nRows, progressCallback, cancelEvent)
+                    chunk[i-rowStart] = fvDataArray[i]
+                    features[i] = fvObject.rowFeatures(chunk[i-rowStart] * DEFLECTION_SCALE,
+                                                       fvParameters)
+                curves = chunk[:rowStop-rowStart].reshape(-1, 2, nRampPoints)
+                for k, direction in enumerate(('ForceForward', 'ForceBackward')):
+                    np.save(os.path.join(partial, chunkName(direction, rowStart // chunkRows)),
+                            np.ascontiguousarray(curves[:, k, :]))
+            fvObject.checkIngest(nRows, nRows, progressCallback, cancelEvent)
+            np.save(os.path.join(partial, 'features.npy'),
+                    features.reshape(nRows*nColumns, len(FEATURE_NAMES)))
+
+            calibration = calibrationFromHeader(nanoscopeFile.header)
+            metadata = {'nRows': nRows,
+                        'nColumns': nColumns,
+                        'nRampPoints': nRampPoints,
+                        'scanSize': fvParameters['scanSize'][0],
+                        'rampLength': fvParameters['rampLength'][0],
+                        'chunkCurves': chunkRows * nColumns,
+                        'curveDtype': '<i4',
+                        'curveScale': DEFLECTION_SCALE,
+                        'photodiodeSensitivity': calibration.get('photodiodeSensitivity', 1.),
+                        'forceConstant': calibration.get('forceConstant', 1.),
+                        'probeRadius': calibration.get('probeRadius', 1.),
+                        'fingerprint': fingerprint}
+            with open(os.path.join(partial, CHUNKED_METADATA), 'w') as file:
+                json.dump(metadata, file, indent=1)
+        except BaseException:
+            shutil.rmtree(partial, ignore_errors=True)
+            raise
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(partial, directory)
+
+    return directory
+
+
+class ChunkedArrayStore():
+    '''
+    Store on a directory written by writeChunkedArrayStore. The chunks
+    are opened (memory mapped) the first time one of their force ramps is
+    asked for, and a batch of force ramps costs a fancy indexing per
+    chunk it touches, plus a single multiplication by curveScale of the
+    whole batch. The features are kept in features.npy, and indexed (in
+    memory) the first time the attribute features is used.
+
+    Attributes:
+        directory, dtype
+        nRows, nColumns, nRampPoints, rampLength, chunkCurves, curveScale,
+        photodiodeSensitivity, forceConstant, probeRadius: from the metadata
+        xDimensions, xIndices, converter
+        features: CurveFeatureIndex on the features of the force ramps
+    '''
+
+    def __init__(self, directory, dtype=np.float64):
+        self.directory = directory
+        self.dtype = np.dtype(dtype)
+        self.metadata = readChunkedMetadata(directory)
+        if self.metadata is None:
+            raise ValueError(f"No chunked store in {directory}")
+        for name in ('nRows', 'nColumns', 'nRampPoints', 'rampLength', 'chunkCurves',
+                     'curveScale', 'photodiodeSensitivity', 'forceConstant', 'probeRadius'):
+            setattr(self, name, self.metadata[name])
+        self.xDimensions = np.linspace(0., self.rampLength, self.nRampPoints)
+        self.xIndices = np.linspace(0, self.nRampPoints-1, self.nRampPoints)
+        self.xDimensions.setflags(write=False)
+        self.xIndices.setflags(write=False)
+        self.converter = UnitConverter(self.photodiodeSensitivity, self.forceConstant,
+                                       self.probeRadius, self.rampLength)
+        self.chunks = {}
+        self.maps = {}
+        self.featureIndex = None
+
+    def reopen(self):
+        return ChunkedArrayStore(self.directory, self.dtype)
+
+    def close(self):
+        self.chunks = {}
+
+    def getNumberForceRamps(self):
+        return self.nRows * self.nColumns
+
+    def getXData(self, xDimensions=True):
+        return self.xDimensions if xDimensions == True else self.xIndices
+
+    def getChunk(self, direction, chunk):
+        '''
+        Returns the (memory mapped) counts of chunk number chunk
+        '''
+        if (direction, chunk) not in self.chunks:
+            self.chunks[(direction, chunk)] = np.load(
+                    os.path.join(self.directory, chunkName(direction, chunk)), mmap_mode='r'
+                    )
+        return self.chunks[(direction, chunk)]
+
+    def getForceRamp(self, idx, direction='ForceForward', xDimensions=True):
+        return self.getXData(xDimensions), self.getForceRamps(ids=[idx], direction=direction)[0]
+
+    def getForceRamps(self, ids=None, row=None, rectangle=None, direction='ForceForward'):
+        '''
+        Returns a (n, nRampPoints) array with the force ramps given by
+        exactly one of ids, row or rectangle (see selectedIDs)
+        '''
+        directionIndex(direction)
+        ids = selectedIDs(self.nRows, self.nColumns, ids, row, rectangle)
+        if ids.size and (ids.min() < 0 or ids.max() >= self.getNumberForceRamps()):
+            raise IndexError(f"Force ramps out of the map, with {self.getNumberForceRamps()} of them")
+        chunks, offsets = np.divmod(ids, self.chunkCurves)
+        forceRamps = np.empty((ids.shape[0], self.nRampPoints), dtype=self.dtype)
+        for chunk in np.unique(chunks).tolist():
+            inChunk = chunks == chunk
+            forceRamps[inChunk] = self.getChunk(direction, chunk)[offsets[inChunk]]
+        forceRamps *= self.curveScale
+        return forceRamps
+
+    def getForceRampWindow(self, idx, start, stop, direction='ForceForward', xDimensions=True):
+        '''
+        Returns the samples [start, stop) of the (xData, yData) force ramp
+        idx, sliced from its (memory mapped) chunk
+        '''
+        directionIndex(direction)
+        if not 0 <= idx < self.getNumberForceRamps():
+            raise IndexError(f"Force ramp {idx} out of the map, with {self.getNumberForceRamps()} of them")
+        chunk, offset = divmod(idx, self.chunkCurves)
+        window = slice(start, stop)
+        yData = np.multiply(self.getChunk(direction, chunk)[offset, window], self.curveScale,
+                            dtype=self.dtype)
+        return self.getXData(xDimensions)[window], yData
+
+    def getMapNames(self):
+        return ['Height'] + list(FEATURE_NAMES)
+
+    def getMap(self, name='Height'):
+        if name not in self.maps:
+            if name == 'Height':
+                mapArray = np.load(os.path.join(self.directory, 'Height.npy'))
+            elif name in FEATURE_NAMES:
+                mapArray = np.array(self.getFeatures()[:, FEATURE_NAMES.index(name)]).reshape(
+                        self.nRows, self.nColumns)
+            else:
+                raise ValueError(f"No map {name!r}, must be one of {self.getMapNames()}")
+            mapArray.setflags(write=False)
+            self.maps[name] = mapArray
+        return self.maps[name]
+
+    def getFeatures(self):
+        return np.load(os.path.join(self.directory, 'features.npy'), mmap_mode='r')
+
+    @property
+    def features(self):
+        if self.featureIndex is None:
+            self.featureIndex = memoryFeatureIndex(np.asarray(self.getFeatures()), self.nColumns)
+        return self.featureIndex
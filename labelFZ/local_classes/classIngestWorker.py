@@ -0,0 +1,72 @@
+###############################################################################
+# Imports
+###############################################################################
+import threading
+from PyQt5.QtCore import QThread, pyqtSignal
+from .classNanoscopeForceVolume import NanoscopeForceVolumeObject, IngestCancelled
+from .classForceVolumeStores import writeChunkedArrayStore
+
+###############################################################################
+# A class named IngestWorker is declared, which runs
+# NanoscopeForceVolumeObject.fvToSQL (or writeChunkedArrayStore) in a
+# background thread, so that the GUI keeps responding while a force volume
+# file is being ingested
+###############################################################################
+
+
+class IngestWorker(QThread):
+    '''
+    Thread ingesting the force volume file file_name into the store
+    database_name: an sqlite database (backend 'sqlite'), with the
+    curves encoded with curveEncoding (see CURVE_CODECS), or a directory
+    of chunks (backend 'chunked', see classForceVolumeStores).
+
+    Signals:
+        progress(rowsDone, nRows): emitted after each row of the map
+        ingested(experimentID): emitted when the ingest has finished
+            (None for chunked stores, with a single force volume)
+        cancelled(): emitted if the ingest was cancelled (and rolled back)
+        failed(message): emitted if the ingest raised an exception
+
+    Methods:
+        run(): executed in the thread, started with start()
+        cancel(): asks the ingest to stop, at the end of the current row
+    '''
+
+    progress = pyqtSignal(int, int)
+    ingested = pyqtSignal(object)
+    cancelled = pyqtSignal()
+    failed = pyqtSignal(str)
+
+    def __init__(self, file_name, database_name, parent=None, backend='sqlite',
+                 curveEncoding='raw'):
+        super().__init__(parent)
+        self.file_name = file_name
+        self.database_name = database_name
+        self.backend = backend
+        self.curveEncoding = curveEncoding
+        self.cancelEvent = threading.Event()
+
+    def run(self):
+        # The object (and its sqlite connection) is only used in this thread
+        fvObject = NanoscopeForceVolumeObject()
+        try:
+            if self.backend == 'chunked':
+                writeChunkedArrayStore(self.file_name, self.database_name,
+                                       progressCallback=self.progress.emit,
+                                       cancelEvent=self.cancelEvent)
+                experimentID = None
+            else:
+                experimentID = fvObject.fvToSQL(self.file_name, self.database_name,
+                                                progressCallback=self.progress.emit,
+                                                cancelEvent=self.cancelEvent,
+                                                curveEncoding=self.curveEncoding)
+        except IngestCancelled:
+            self.cancelled.emit()
+        except Exception as error:
+            self.failed.emit(f"{type(error).__name__}: {error}")
+        else:
+            self.ingested.emit(experimentID)
+
+    def cancel(self):
+        self.cancelEvent.set()
@@ -0,0 +1,136 @@
+###############################################################################
+# Imports
+###############################################################################
+import numpy as np
+from PyQt5.QtCore import pyqtSignal
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QComboBox, QLabel
+from matplotlib.backends.backend_qt5agg import FigureCanvas
+from matplotlib.figure import Figure
+
+###############################################################################
+# A class named MapView is declared, a window showing a map of a force volume
+# (the topography, or any value per force ramp) to navigate it by position
+###############################################################################
+
+
+class MapView(QWidget):
+    '''
+    Window with a map of a force volume, one pixel per force ramp: row
+    NX and column NY of the image is the force ramp (NX, NY) of the map.
+    The maps are read from a curve source (see classCurvePrefetcher), once
+    per name, and kept as 2D arrays; the image is only created once, and
+    switching maps just changes its data. Clicking on a pixel emits
+    pixelSelected with its (NX, NY).
+
+    Signals:
+        pixelSelected(NX, NY)
+
+    Methods:
+        setSource(source)
+        showMap(name)
+        showCurve(NX, NY)
+    '''
+
+    pixelSelected = pyqtSignal(int, int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Map")
+        self.source = None
+        self.maps = {}
+        self.name = None
+        self.image = None
+
+        self.canvas = FigureCanvas(Figure(figsize=(6, 5)))
+        self.axes = self.canvas.figure.add_subplot()
+        self.axes.set_xlabel('NY')
+        self.axes.set_ylabel('NX')
+        self.marker, = self.axes.plot([], [], 'r+', markersize=12)
+        self.colorbar = None
+        self.canvas.mpl_connect('button_press_event', self.onclick)
+
+        self.mapComboBox = QComboBox()
+        self.mapComboBox.currentTextChanged.connect(self.showMap)
+        self.valueLabel = QLabel("-")
+        controls = QHBoxLayout()
+        controls.addWidget(QLabel("Map:"))
+        controls.addWidget(self.mapComboBox)
+        controls.addWidget(self.valueLabel)
+        controls.addStretch()
+        layout = QVBoxLayout()
+        layout.addLayout(controls)
+        layout.addWidget(self.canvas)
+        self.setLayout(layout)
+
+    def setSource(self, source):
+        '''
+        Sets the source of the maps (an object with methods getMapNames()
+        and getMap(name)), and shows its first map (or the one shown, if
+        the source has it too)
+        '''
+        self.source = source
+        self.maps = {}
+        names = source.getMapNames()
+        name = self.name if self.name in names else (names[0] if names else None)
+        self.name = None
+        self.mapComboBox.blockSignals(True)
+        self.mapComboBox.clear()
+        self.mapComboBox.addItems(names)
+        if name is not None:
+            self.mapComboBox.setCurrentText(name)
+        self.mapComboBox.blockSignals(False)
+        self.showMap(name)
+
+    def getMap(self, name):
+        if name not in self.maps:
+            self.maps[name] = self.source.getMap(name)
+        return self.maps[name]
+
+    def showMap(self, name):
+        '''
+        Shows the map called name
+        '''
+        if not name or self.source is None or name == self.name:
+            return
+        self.name = name
+        mapArray = self.getMap(name)
+        if self.image is None:
+            self.image = self.axes.imshow(mapArray, origin='upper', interpolation='nearest',
+                                          cmap='viridis')
+            self.colorbar = self.canvas.figure.colorbar(self.image, ax=self.axes)
+        else:
+            self.image.set_data(mapArray)
+            self.image.set_extent((-0.5, mapArray.shape[1] - 0.5, mapArray.shape[0] - 0.5, -0.5))
+            self.axes.set_xlim(-0.5, mapArray.shape[1] - 0.5)
+            self.axes.set_ylim(mapArray.shape[0] - 0.5, -0.5)
+        finite = mapArray[np.isfinite(mapArray)]
+        if finite.size:
+            self.image.set_clim(finite.min(), finite.max())
+        self.colorbar.set_label(name)
+        self.updateValueLabel()
+        self.canvas.draw_idle()
+
+    def showCurve(self, NX, NY):
+        '''
+        Marks the pixel of force ramp (NX, NY)
+        '''
+        self.marker.set_data([NY], [NX])
+        self.updateValueLabel()
+        self.canvas.draw_idle()
+
+    def updateValueLabel(self):
+        if self.name is None or len(self.marker.get_xdata()) == 0:
+            return
+        NY, NX = self.marker.get_xdata()[0], self.marker.get_ydata()[0]
+        mapArray = self.getMap(self.name)
+        if 0 <= NX < mapArray.shape[0] and 0 <= NY < mapArray.shape[1]:
+            self.valueLabel.setText(f"({NX}, {NY}): {mapArray[NX, NY]:.4g}")
+
+    def onclick(self, event):
+        if event.inaxes is not self.axes or self.image is None:
+            return
+        NX = int(round(event.ydata))
+        NY = int(round(event.xdata))
+        nRows, nColumns = self.image.get_array().shape
+        if 0 <= NX < nRows and 0 <= NY < nColumns:
+            self.pixelSelected.emit(NX, NY)
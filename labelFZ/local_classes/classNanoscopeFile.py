@@ -0,0 +1,180 @@
+###############################################################################
+# Imports
+###############################################################################
+import os
+import threading
+import numpy as np
+from .classNanoscopeHeader import NanoscopeHeader, FORCE_VOLUME_KEYS
+
+###############################################################################
+# A class named NanoscopeFile is declared, which opens a Nanoscope file once,
+# parses its header and gives access by name to its data channels
+###############################################################################
+
+HEADER_END = b'\\*File list end'
+HEADER_CHUNK = 8192
+
+
+class NanoscopeFile():
+    '''
+    A Nanoscope 9 file (force volume or force ramp), opened once in binary
+    mode for all its sections.
+    The header is read from the binary stream, up to the end of the file
+    list, and parsed by NanoscopeHeader. Every section of the header with
+    a Data offset and an Image Data parameter becomes an entry of the
+    channel table, but no data is read until a channel is asked for by
+    name; it is then fetched with a single positioned read (pread).
+
+    Attributes:
+        file_name
+        file: the open (binary) file
+        header: the NanoscopeHeader
+        headerParameters: the parameters of the header for the keys given
+        channels: list of dictionaries with keys 'name', 'offset',
+            'length', 'bytesPerPixel' and 'section', in file order
+
+    Methods:
+        __init__(file_name, keys=FORCE_VOLUME_KEYS)
+        readAt(offset, length)
+        readInto(offset, buffer)
+        getChannel(name)
+        readChannel(name, dtype='<i4', shape=None, start=0, count=None)
+        readChannelData(channel, dtype='<i4', shape=None, start=0, count=None)
+        mapChannel(name, dtype='<i4', shape=None)
+        close()
+
+    It can be used as a context manager, which closes the file on exit.
+    '''
+
+    def __init__(self, file_name, keys=FORCE_VOLUME_KEYS):
+        '''
+        Opens file_name and parses its header
+        '''
+        self.file_name = file_name
+        self.file = open(file_name, 'rb')
+        # Only needed where os.pread is not available (Windows)
+        self.lock = threading.Lock()
+        try:
+            self.header = NanoscopeHeader(self.readHeaderLines(), keys)
+        except Exception:
+            self.file.close()
+            raise
+        self.headerParameters = self.header.parameters
+        self.channels = self.channelTable()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def readAt(self, offset, length):
+        '''
+        Returns length bytes of the file, starting at offset, without
+        moving the file position
+        '''
+        if hasattr(os, 'pread'):
+            return os.pread(self.file.fileno(), length, offset)
+        with self.lock:
+            self.file.seek(offset)
+            return self.file.read(length)
+
+    def readInto(self, offset, buffer):
+        '''
+        Fills buffer (any writable buffer, e.g. a numpy array) with the
+        bytes of the file starting at offset, without moving the file
+        position, and returns the number of bytes read
+        '''
+        if hasattr(os, 'preadv'):
+            return os.preadv(self.file.fileno(), [buffer], offset)
+        with self.lock:
+            self.file.seek(offset)
+            return self.file.readinto(buffer)
+
+    def readHeaderLines(self):
+        '''
+        Returns the lines of the header, decoded from the binary stream
+        '''
+        headerBytes = b''
+        while True:
+            chunk = self.readAt(len(headerBytes), HEADER_CHUNK)
+            headerBytes += chunk
+            end = headerBytes.find(HEADER_END)
+            if end >= 0:
+                headerBytes = headerBytes[:end + len(HEADER_END)]
+                break
+            if len(chunk) < HEADER_CHUNK:
+                break
+
+        # Same newline translation as a file opened in text mode
+        text = headerBytes.decode('cp1252', errors='replace')
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+
+        return text.splitlines(keepends=True)
+
+    def channelTable(self):
+        '''
+        Returns the list of data channels described in the header
+        '''
+        channels = []
+        for sectionName, parameters in self.header.sections:
+            channel = {'name': None, 'offset': None, 'length': None,
+                       'bytesPerPixel': None, 'section': sectionName}
+            for parameter in parameters:
+                if parameter.name == 'Data offset':
+                    channel['offset'] = int(parameter.numbers[0])
+                elif parameter.name == 'Data length':
+                    channel['length'] = int(parameter.numbers[0])
+                elif parameter.name == 'Bytes/pixel':
+                    channel['bytesPerPixel'] = int(parameter.numbers[0])
+                elif parameter.name == 'Image Data':
+                    channel['name'] = parameter.text
+            if channel['offset'] is not None and channel['name'] is not None:
+                channels.append(channel)
+
+        return channels
+
+    def getChannel(self, name):
+        '''
+        Returns the (last) channel of the file called name
+        '''
+        for channel in reversed(self.channels):
+            if channel['name'] == name:
+                return channel
+        raise KeyError(f"No channel {name!r} in {self.file_name}")
+
+    def readChannel(self, name, dtype='<i4', shape=None, start=0, count=None):
+        '''
+        Returns the data of channel name as a numpy array, read with a
+        single pread. Only the items [start, start+count) of the channel
+        are read, if given. The array is reshaped to shape, if given.
+        '''
+        return self.readChannelData(self.getChannel(name), dtype, shape, start, count)
+
+    def readChannelData(self, channel, dtype='<i4', shape=None, start=0, count=None):
+        '''
+        Same as readChannel, for an entry channel of the channel table
+        '''
+        itemSize = np.dtype(dtype).itemsize
+        if count is None:
+            count = channel['length'] // itemSize - start
+        data = np.frombuffer(
+                self.readAt(channel['offset'] + start*itemSize, count*itemSize),
+                dtype=dtype, count=count
+                )
+
+        return data if shape is None else data.reshape(shape)
+
+    def mapChannel(self, name, dtype='<i4', shape=None):
+        '''
+        Returns a read-only np.memmap view of channel name, with shape
+        shape (or flat, if not given), using the already open file
+        '''
+        channel = self.getChannel(name)
+        if shape is None:
+            shape = (channel['length'] // np.dtype(dtype).itemsize,)
+
+        return np.memmap(self.file, dtype=dtype, mode='r', offset=channel['offset'], shape=shape)
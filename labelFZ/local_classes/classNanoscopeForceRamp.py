@@ -7,6 +7,29 @@ import argparse
 import io
 import matplotlib.pyplot as plt
 from scipy.optimize import curve_fit
+from .classNanoscopeHeader import FORCE_RAMP_KEYS
+from . import classNanoscopeHeader
+from .classNanoscopeFile import NanoscopeFile
+
+###############################################################################
+# A class named RampChannel is declared, with the data of a channel of a
+# force ramp file, which scales its integer counts only when asked for
+###############################################################################
+
+
+class RampChannel(dict):
+    '''
+    Dictionary with the data of a channel of a force ramp (an element of
+    NanoscopeForceRamp.Ramp): 'Channel', 'RawX', 'Counts' and 'YScale'.
+    'RawY', the scaled data ('Counts' times 'YScale', float64), is computed
+    and kept the first time it is looked up.
+    '''
+
+    def __missing__(self, key):
+        if key != 'RawY':
+            raise KeyError(key)
+        self['RawY'] = np.multiply(self['Counts'], self['YScale'], dtype=np.float64)
+        return self['RawY']
 
 
 class NanoscopeForceRamp():
@@ -16,16 +39,7 @@ class NanoscopeForceRamp():
         Initialization of attributes
         when creating an instance of the class
         '''
-        self.headerParameters = {'Sens. Zsens:': [],
-                                 'Data offset': [],
-                                 'Data length:': [],
-                                 'Z magnify': [],
-                                 '4:Ramp Size:': [],
-                                 'Samps/line:': [],
-                                 '4:Image Data:': [],
-                                 'Bytes/pixel':[],
-                                 '@4:Z scale': []
-                                 }
+        self.headerParameters = {key: [] for key in FORCE_RAMP_KEYS}
         # At the beginning we are not at the end of the header
         # or at the endof the file
         self.header_end = 0
@@ -33,20 +47,31 @@ class NanoscopeForceRamp():
         self.file_name = file_name
         self.Ramp = []
 
+    def read(self):
+        '''
+        Reads the header and the ramps of the file, opening it only once
+        '''
+        with NanoscopeFile(self.file_name, FORCE_RAMP_KEYS) as nanoscopeFile:
+            self.setHeader(nanoscopeFile.header)
+            self.readRamps(nanoscopeFile)
+
     def readHeader(self):
         '''
-        Reads the header of the file line by line
-        '''
-        file = open(self.file_name, 'r', encoding='cp1252')
-        while (not self.header_end) and (not self.eof):
-            for line in file:
-                self.searchForParameters(line)
-                self.searchForHeaderEnd(line, r'\*File list end')
-                if self.header_end == 1:
-                    break
-                else:
-                    self.eof = 1
-        file.close()
+        Reads the header of the file, in a single pass, with NanoscopeHeader
+        (saved, with all the header sections, in the attribute header)
+        '''
+        with NanoscopeFile(self.file_name, FORCE_RAMP_KEYS) as nanoscopeFile:
+            self.setHeader(nanoscopeFile.header)
+
+    def setHeader(self, header):
+        '''
+        Populates the attributes header and headerParameters from a
+        NanoscopeHeader
+        '''
+        self.header = header
+        self.headerParameters = self.header.parameters
+        self.header_end = self.header.header_end
+        self.eof = 1 - self.header_end
 
     def searchForParameters(self, _line):
         '''
@@ -54,27 +79,7 @@ class NanoscopeForceRamp():
         keys of headParameters. If so, pupulates its values with numbers
         contained in _line as well.
         '''
-        for key in self.headerParameters:
-            if re.search(re.escape(key), _line):
-                if key == '4:Image Data:':
-                    searchString = re.split(r'"', _line)
-                    searchString = searchString[-2]
-                    self.headerParameters[key].append(searchString)
-                elif key == 'Bytes/pixel':
-                    numbers = re.findall(r'\d+$', _line)
-                    self.headerParameters[key].append(int(numbers[0]))
-                else:
-                    numbers = re.findall(r'-?\d+\.?\d+', _line)
-                    # If _line contains the strings 'LSB' or '@', only populate
-                    # the key value with the last number from _line. If not,
-                    # populate it with all numbers.
-                    if key == '@4:Z scale':
-                        self.headerParameters[key].append(float(numbers[0]))
-                    elif re.search(r'LSB', _line) or re.search(r'@', _line):
-                        self.headerParameters[key].append(float(numbers[-1]))
-                    else:
-                        for number in numbers:
-                            self.headerParameters[key].append(float(number))
+        classNanoscopeHeader.searchForParameters(_line, self.headerParameters, FORCE_RAMP_KEYS)
 
     def searchForHeaderEnd(self, _line, _string):
         '''
@@ -85,34 +90,47 @@ class NanoscopeForceRamp():
         else:
             self.header_end = 0
 
-    def readRamps(self):
+    def readRamps(self, nanoscopeFile=None):
         '''
         Reads binary data contained in the file
-        Populates the attribute Ramp with it
+        Populates the attribute Ramp with it.
+        Each channel is read with a single pread from nanoscopeFile, if
+        given, or from the file opened (once) for all channels.
+        The integer counts of each channel are kept as they are read
+        ('Counts'), with their scale ('YScale', from '@4:Z scale'), and
+        only scaled when asked for, with getRawY or by looking up 'RawY'
+        (see RampChannel).
         '''
-        file = open(self.file_name, 'rb')
-        for i in range(len(self.headerParameters['Data offset'])):
-            self.Ramp.append({
-                'Channel': self.headerParameters['4:Image Data:'][i+1],
+        if nanoscopeFile is None:
+            with NanoscopeFile(self.file_name, FORCE_RAMP_KEYS) as nanoscopeFile:
+                return self.readRamps(nanoscopeFile)
+
+        nSamples = int(self.headerParameters['Samps/line:'][-1])
+        for i, channel in enumerate(nanoscopeFile.channels):
+            self.Ramp.append(RampChannel({
+                'Channel': channel['name'],
                 'RawX': np.linspace(
                     0,
                     1,
-                    int(self.headerParameters['Samps/line:'][-1])
+                    nSamples
                 ),
-                'RawY': np.empty([
-                    2, int(self.headerParameters['Samps/line:'][-1])
-                ])
-            })
-            file.seek(int(self.headerParameters['Data offset'][i]))
-            s = file.read(int(self.headerParameters['Data length:'][i+1]))
-            s = np.frombuffer(
-                s,
-                dtype='<i{}'.format(2*self.headerParameters['Bytes/pixel'][i]),
-                count=int(2*self.headerParameters['Samps/line:'][-1])
-                ).reshape((
-                    2,
-                    int(self.headerParameters['Samps/line:'][-1])
-                ))*self.headerParameters['@4:Z scale'][i]
-            self.Ramp[i]['RawY'] = s
+                'Counts': nanoscopeFile.readChannelData(
+                    channel,
+                    dtype='<i{}'.format(2*self.headerParameters['Bytes/pixel'][i]),
+                    count=2*nSamples
+                    ).reshape((
+                        2,
+                        nSamples
+                    )),
+                'YScale': self.headerParameters['@4:Z scale'][i]
+            }))
             self.Ramp[i]['RawX'] *= self.headerParameters['4:Ramp Size:'][i]
             self.Ramp[i]['RawX'] *= self.headerParameters['Sens. Zsens:']
+
+    def getRawY(self, channel=0, dtype=np.float64):
+        '''
+        Returns the (2, nSamples) scaled data of channel (approach and
+        retract), as an array of dtype
+        '''
+        ramp = self.Ramp[channel]
+        return np.multiply(ramp['Counts'], ramp['YScale'], dtype=dtype)
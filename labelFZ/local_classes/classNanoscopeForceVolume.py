@@ -2,11 +2,21 @@
 # Imports
 ###############################################################################
 import re
+import os
+import hashlib
 import numpy as np
 import argparse
 import sqlite3
 import io
+import zlib
 import matplotlib.pyplot as plt
+from .classNanoscopeHeader import NanoscopeHeader, FORCE_VOLUME_KEYS
+from . import classNanoscopeHeader
+from .classNanoscopeFile import NanoscopeFile
+from .classCurveFeatures import (FEATURE_NAMES, computeFeatures, createFeaturesTable,
+                                 insertFeatures, deleteFeatures, CurveFeatureIndex)
+from .classForceVolumeBlockReader import ForceVolumeBlockReader, INGEST_MEMORY_LIMIT
+from .classUnitConversion import CALIBRATION_PARAMETERS, calibrationFromHeader, UnitConverter
 
 ###############################################################################
 # numpy arrays are not supported by sqlite. We need to register them as new
@@ -14,6 +24,9 @@ import matplotlib.pyplot as plt
 ###############################################################################
 
 
+NPY_MAGIC = b'\x93NUMPY'
+
+
 def adapt_array(arr):
     out = io.BytesIO()
     np.save(out, arr)
@@ -22,10 +35,188 @@ def adapt_array(arr):
 
 
 def convert_array(text):
+    # Curves ingested in bulk are stored as raw bytes, without the .npy
+    # header. Those are returned as they are, and decoded with the dtype
+    # kept in ExperimentalParametersTable (see decodeCurve)
+    if not text.startswith(NPY_MAGIC):
+        return bytes(text)
     out = io.BytesIO(text)
     out.seek(0)
     return np.load(out)
 
+
+def encodeCurve(arr, curveDtype='<f8'):
+    '''
+    Returns the raw bytes of arr, as stored by the bulk ingest
+    '''
+    return np.ascontiguousarray(arr, dtype=curveDtype).tobytes()
+
+
+def decodeCurve(blob, curveEncoding='npy', curveDtype='<f8', curveScale=1., dtype=np.float64):
+    '''
+    Returns the curve stored in blob as a numpy array of dtype. Curves
+    stored as integer counts are multiplied by curveScale.
+    Blobs with a curveEncoding of CURVE_CODECS are decoded with it; any
+    other blob is expected to be already decoded (see convert_array).
+    '''
+    curve = CURVE_CODECS[curveEncoding][1](blob, curveDtype) if curveEncoding in CURVE_CODECS else blob
+    if isCountsDtype(curveDtype):
+        return np.multiply(curve, curveScale, dtype=dtype)
+    return np.asarray(curve, dtype=dtype)
+
+
+def isCountsDtype(curveDtype):
+    '''
+    Whether curves of dtype curveDtype are stored as raw integer counts,
+    to be scaled when they are read
+    '''
+    return np.issubdtype(np.dtype(curveDtype), np.integer)
+
+###############################################################################
+# Codecs of the curves ingested in bulk (curveEncoding), with the dtype of
+# the curves (curveDtype) kept once per experiment. Each of them is a pair
+# of functions encode(curve, curveDtype) -> bytes and
+# decode(blob, curveDtype) -> numpy array.
+# Deflection curves are smooth: the difference between consecutive counts
+# is a few bits wide. Zigzag encoded (0, -1, 1, -2, 2... as 0, 1, 2, 3,
+# 4...) and split into byte planes (all their lowest bytes, then all the
+# next ones...), the higher planes are almost only zeros, which zlib
+# compresses to nothing.
+###############################################################################
+
+# zlib level of the compressed codecs: compressing harder is much slower,
+# for a few percent smaller curves
+CURVE_COMPRESSION_LEVEL = 1
+
+
+def decodeRaw(blob, curveDtype='<f8'):
+    return np.frombuffer(blob, dtype=curveDtype)
+
+
+def encodeZlib(arr, curveDtype='<f8'):
+    '''
+    Returns the raw bytes of arr, compressed with zlib
+    '''
+    return zlib.compress(encodeCurve(arr, curveDtype), CURVE_COMPRESSION_LEVEL)
+
+
+def decodeZlib(blob, curveDtype='<f8'):
+    return np.frombuffer(zlib.decompress(blob), dtype=curveDtype)
+
+
+def encodeDeltaZlib(arr, curveDtype='<i4'):
+    '''
+    Returns the first sample of arr followed by the differences between
+    consecutive samples, zigzag encoded, split into byte planes and
+    compressed with zlib. Only for signed integer counts, which the
+    differences (wrapping around on overflow) restore exactly.
+    '''
+    dtype = np.dtype(curveDtype)
+    if dtype.kind != 'i':
+        raise ValueError(f"Delta encoding needs signed integer counts, not {curveDtype}")
+    curve = np.ascontiguousarray(arr, dtype=dtype)
+    delta = np.empty_like(curve)
+    delta[:1] = curve[:1]
+    np.subtract(curve[1:], curve[:-1], out=delta[1:])
+    zigzag = (delta << 1) ^ (delta >> (8*dtype.itemsize - 1))
+    planes = zigzag.view(np.uint8).reshape(-1, dtype.itemsize).T
+    return zlib.compress(planes.tobytes(), CURVE_COMPRESSION_LEVEL)
+
+
+def decodeDeltaZlib(blob, curveDtype='<i4'):
+    dtype = np.dtype(curveDtype)
+    planes = np.frombuffer(zlib.decompress(blob), dtype=np.uint8).reshape(dtype.itemsize, -1)
+    zigzag = np.ascontiguousarray(planes.T).view(dtype.str.replace('i', 'u')).ravel()
+    delta = (zigzag >> 1).view(dtype) ^ -(zigzag & 1).view(dtype)
+    return np.cumsum(delta, dtype=dtype)
+
+
+CURVE_CODECS = {
+    'raw': (encodeCurve, decodeRaw),
+    'zlib': (encodeZlib, decodeZlib),
+    'deltazlib': (encodeDeltaZlib, decodeDeltaZlib),
+}
+
+###############################################################################
+# Fingerprint of a force volume file, used to recognise files that have
+# already been ingested in the database
+###############################################################################
+
+FINGERPRINT_BLOCKS = 16
+FINGERPRINT_BLOCK_SIZE = 65536
+
+
+def fileFingerprint(file_name, nanoscopeFile=None):
+    '''
+    Returns (path, size, mtime, hash) for file_name.
+    Hashing a whole force volume would take as long as ingesting it, so the
+    hash is a blake2b digest of the size and of FINGERPRINT_BLOCKS blocks
+    evenly spaced over the file, the first one holding the header.
+    If the file is already open as nanoscopeFile, the blocks are read from it.
+    '''
+    path = os.path.abspath(file_name)
+    stat = os.stat(path)
+    digest = hashlib.blake2b(str(stat.st_size).encode(), digest_size=16)
+    step = max(stat.st_size // FINGERPRINT_BLOCKS, FINGERPRINT_BLOCK_SIZE)
+    if nanoscopeFile is not None:
+        for offset in range(0, stat.st_size, step):
+            digest.update(nanoscopeFile.readAt(offset, FINGERPRINT_BLOCK_SIZE))
+    else:
+        with open(path, 'rb') as file:
+            for offset in range(0, stat.st_size, step):
+                file.seek(offset)
+                digest.update(file.read(FINGERPRINT_BLOCK_SIZE))
+
+    return (path, stat.st_size, stat.st_mtime_ns, digest.hexdigest())
+
+###############################################################################
+# Exception raised when an ingest is cancelled (see fvToSQL)
+###############################################################################
+
+
+class IngestCancelled(Exception):
+    pass
+
+###############################################################################
+# Conversion factor (V/LSB) from the int32 counts stored in the Deflection
+# Error channel of a force volume file to Volts
+###############################################################################
+
+DEFLECTION_SCALE = 0.000375
+
+###############################################################################
+# Directions of a force ramp (approach and retract), in the order of their
+# curves in the force volume section of the file
+###############################################################################
+
+FORCE_RAMP_DIRECTIONS = ('ForceForward', 'ForceBackward')
+
+
+def directionIndex(direction):
+    '''
+    Returns the index of direction in FORCE_RAMP_DIRECTIONS (0 for the
+    approach, 1 for the retract)
+    '''
+    if direction not in FORCE_RAMP_DIRECTIONS:
+        raise ValueError(f"Unknown force ramp direction: {direction}")
+    return FORCE_RAMP_DIRECTIONS.index(direction)
+
+###############################################################################
+# Columns added to ExperimentalParametersTable after the first version, with
+# their definitions, added by upgradeTables to the tables that miss them
+###############################################################################
+
+ADDED_EXPERIMENT_COLUMNS = {'photodiodeSensitivity': 'REAL DEFAULT 1',
+                            'forceConstant': 'REAL DEFAULT 1',
+                            'probeRadius': 'REAL DEFAULT 1',
+                            'curveEncoding': "TEXT DEFAULT 'npy'",
+                            'curveDtype': "TEXT DEFAULT '<f8'",
+                            'curveScale': 'REAL DEFAULT 1',
+                            'sourcePath': 'TEXT',
+                            'sourceSize': 'INTEGER',
+                            'sourceMtime': 'INTEGER',
+                            'sourceHash': 'TEXT'}
+
 ###############################################################################
 # A class named NanoscopeForceVolumeObject is declared, which contains
 # all neccesary methods for reading data from force volume files and storing
@@ -50,23 +241,47 @@ class NanoscopeForceVolumeObject():
             and converter needed for sqlite to handle numpy arrays are called.
         fvToSQL(file_name, database_name):
             reads metadata and raw data from file_name and stores it in the
-            data base database_name
+            data base database_name, unless it is already there
+        ingestFile(nanoscopeFile, ExperimentName, database_name, fingerprint, bulk=True)
+        findExperiment(fingerprint)
+        checkIngest(rowsDone, nRows, progressCallback=None, cancelEvent=None)
+        openFile(file_name)
         readHeader(file_name):
         headerToParameters(headerParameters):
         readTopography(file_name, headerParameters, fvParameters):
         readFV(file_name, headerParameters, fvParameters):
+        mapTopography(file_name, headerParameters, fvParameters):
+        mapFV(file_name, headerParameters, fvParameters):
+        readTopographyChannel(nanoscopeFile, fvParameters)
+        mapFVChannel(nanoscopeFile, fvParameters)
+        openMemoryMap(file_name)
+        getForceRampFromMap(idx, direction='ForceForward', xDimensions=True)
+        getForceRampsFromMap(ids, direction='ForceForward')
+        checkMapIDs(ids)
         connectToDataBase(database_name)
         closeDataBaseConnection()
-        createTables(file_name2)
-        populateTables(file_name2, fvParameters, topographyArray, fvDataArray)
-        getForwardForceRampFromID(database_name, idx, xDimensions=True)
-        getNumberForceRamps(database_name)
+        createTables()
+        createExperimentsTable(tableName='ExperimentalParametersTable')
+        populateTables(ExperimentName, sourcePath, fvParameters, topographyArray, fvDataArray)
+        populateTablesBulk(ExperimentName, sourcePath, fvParameters, topographyArray, fvDataArray)
+        populateFeatures(ExperimentID, fvParameters, fvDataArray)
+        rowFeatures(rowData, fvParameters)
+        tuneDataBase()
+        upgradeDataBase(database_name)
+        tablesNeedUpgrade()
+        upgradeTables()
+        deleteExperiment(sourcePath)
+        deleteExperiments(ids)
+        getForceRampFromID(database_name, idx, direction='ForceForward', xDimensions=True, *, experimentID)
+        getNumberForceRamps(database_name, *, experimentID)
+        getExperiments(database_name)
         
-    Database: For a force volume file, fvToSQL creates 2 tables:
+    Database: fvToSQL creates (if needed) 3 tables, shared by all
+    the force volume files ingested in the same database:
         
         ExperimentalParametersTable. Columns:
-            id INTEGER
-            ExperimentName TEXT NOT NULL UNIQUE
+            id INTEGER PRIMARY KEY AUTOINCREMENT
+            ExperimentName TEXT NOT NULL
             nRows INTEGER
             nColumns INTEGER,
             nRampPoints INTEGER
@@ -75,6 +290,13 @@ class NanoscopeForceVolumeObject():
             photodiodeSensitivity REAL DEFAULT 1
             forceConstant REAL DEFAULT 1
             probeRadius REAL DEFAULT 1
+            curveEncoding TEXT DEFAULT 'npy'
+            curveDtype TEXT DEFAULT '<f8'
+            curveScale REAL DEFAULT 1
+            sourcePath TEXT UNIQUE
+            sourceSize INTEGER
+            sourceMtime INTEGER
+            sourceHash TEXT
 
         RawDataTable. Columns:
             id INTEGER,
@@ -86,6 +308,30 @@ class NanoscopeForceVolumeObject():
             Height REAL,
             PRIMARY KEY (id),
             FOREIGN KEY (ExperimentID) REFERENCES ExperimentalParametersTable(id)
+            INDEX on (ExperimentID, NX, NY)
+
+        ForceForward and ForceBackward are either .npy blobs (curveEncoding
+        'npy', see adapt_array) or, when ingested with bulk=True, the
+        curve with dtype curveDtype and nRampPoints elements encoded with
+        one of CURVE_CODECS: its raw bytes (curveEncoding 'raw', the
+        default) or compressed ('zlib', 'deltazlib').
+        Curves are stored as the int32 counts of the file (curveDtype
+        '<i4'), half the size of the deflection in float64: they are
+        multiplied by curveScale (V/LSB) when read (see decodeCurve).
+        Experiments ingested by older versions hold the deflection itself
+        (curveDtype '<f8', curveScale 1).
+
+        An experiment is identified by sourcePath, the absolute path of its
+        file: ingesting the file again replaces it, whatever its
+        ExperimentName (the basename of the file, only shown to the user).
+        Ids are never reused, so the id of a replaced experiment no longer
+        points at any force volume. The other source* columns hold the
+        rest of the fileFingerprint of the ingested file. They are only
+        written once all its curves have been committed.
+
+        CurveFeaturesTable: the summary features of every force ramp (see
+        classCurveFeatures), computed as the curves are inserted, with a
+        row per (ExperimentID, NX, NY) and indexed on every feature.
     '''
 
     def __init__(self):
@@ -104,121 +350,252 @@ class NanoscopeForceVolumeObject():
 
         
 
-    def fvToSQL(self, file_name, database_name):
+    def fvToSQL(self, file_name, database_name, bulk=True,
+                progressCallback=None, cancelEvent=None, maxMemory=INGEST_MEMORY_LIMIT,
+                curveEncoding='raw'):
         '''
         Method that handles the reading of the force volume 
         file file_name, and saves the raw and metadata in the
-        sqlite database database_name
+        sqlite database database_name.
+        If bulk is True, the curves are inserted with populateTablesBulk,
+        encoded with curveEncoding (one of CURVE_CODECS), otherwise one by
+        one with populateTables, as .npy blobs.
+        If the database already holds file_name, and the file has not
+        changed since it was ingested, nothing is read or written (the
+        experiment keeps the encoding it was ingested with).
+        Returns the id of the experiment in ExperimentalParametersTable.
+        The ingest can be run in a background thread: after each row of
+        the map, progressCallback(rowsDone, nRows) is called (if given),
+        and if cancelEvent (e.g. a threading.Event) is set, the ingest is
+        rolled back and IngestCancelled is raised.
+        The force ramps are read from the file in blocks of rows (see
+        ForceVolumeBlockReader) and inserted as they are read, so that
+        about maxMemory bytes are used whatever the size of the file.
         '''
 
-        # Name of the Force Volume file to be used in the database
-        # SQLite does not like dots...
-        file_name2 = file_name.replace('.', '_')
+        # Experiments are identified by the absolute path of their file
+        # (fingerprint[0]), the name is only shown to the user
+        ExperimentName = os.path.basename(file_name)
+
+        # The file is opened once, for the header, the fingerprint
+        # and the data sections
+        with self.openFile(file_name) as nanoscopeFile:
+            fingerprint = fileFingerprint(file_name, nanoscopeFile)
+
+            self.connectToDataBase(database_name)
+            if self.tablesNeedUpgrade():
+                self.createTables()
+            ExperimentID = self.findExperiment(fingerprint)
+            if ExperimentID is not None:
+                # Databases created by older versions miss some columns
+                # and tables, and their experiments have no features
+                self.createTables()
+                if not CurveFeatureIndex(self.connector, ExperimentID, 1).hasFeatures():
+                    fvParameters = self.headerToParameters(nanoscopeFile.headerParameters)
+                    self.populateFeatures(ExperimentID, fvParameters,
+                                          self.readFVChannelBlocks(nanoscopeFile, fvParameters,
+                                                                   maxMemory),
+                                          fvScale=DEFLECTION_SCALE)
+                self.closeDataBaseConnection()
+                return ExperimentID
+            self.closeDataBaseConnection()
 
-        headerParameters = self.readHeader(file_name)
+            ExperimentID = self.ingestFile(nanoscopeFile, ExperimentName, database_name,
+                                           fingerprint, bulk, progressCallback, cancelEvent,
+                                           maxMemory, curveEncoding)
+
+        return ExperimentID
+
+    def ingestFile(self, nanoscopeFile, ExperimentName, database_name, fingerprint, bulk=True,
+                   progressCallback=None, cancelEvent=None, maxMemory=INGEST_MEMORY_LIMIT,
+                   curveEncoding='raw'):
+        '''
+        Saves the raw and metadata of the open force volume file
+        nanoscopeFile in the database, as experiment ExperimentName of the
+        file in fingerprint[0], replacing the one of the same file (if any)
+        '''
+        headerParameters = nanoscopeFile.headerParameters
 
         fvParameters = self.headerToParameters(headerParameters)
 
-        topographyArray = self.readTopography(file_name, headerParameters, fvParameters)
+        # The force volume section is read in blocks of rows, so that only
+        # the curves being inserted are in memory at any given time
+        topographyArray = self.readTopographyChannel(nanoscopeFile, fvParameters)
 
-        fvDataArray = self.readFV(file_name, headerParameters, fvParameters)
+        fvDataArray = self.readFVChannelBlocks(nanoscopeFile, fvParameters, maxMemory)
 
         self.connectToDataBase(database_name)
 
-        self.createTables(file_name2)
+        if bulk == True:
+            self.tuneDataBase()
 
-        self.populateTables(file_name2, fvParameters, topographyArray, fvDataArray)
+        try:
+            self.createTables()
 
-        self.closeDataBaseConnection()
-
-    def getForceRampFromID(self, database_name, idx, direction='ForceForward', xDimensions=True):
+            if bulk == True:
+                ExperimentID = self.populateTablesBulk(ExperimentName, fingerprint[0], fvParameters, topographyArray, fvDataArray,
+                                                       fvScale=DEFLECTION_SCALE,
+                                                       curveEncoding=curveEncoding,
+                                                       progressCallback=progressCallback,
+                                                       cancelEvent=cancelEvent)
+            else:
+                ExperimentID = self.populateTables(ExperimentName, fingerprint[0], fvParameters, topographyArray, fvDataArray,
+                                                   fvScale=DEFLECTION_SCALE,
+                                                   progressCallback=progressCallback,
+                                                   cancelEvent=cancelEvent)
 
-        self.connectToDataBase(database_name)
+            self.storeCalibration(ExperimentID, calibrationFromHeader(nanoscopeFile.header))
+            self.storeFingerprint(ExperimentID, fingerprint)
+        except BaseException:
+            self.connector.rollback()
+            raise
+        finally:
+            self.closeDataBaseConnection()
 
-        sql_command0 = f"""
-                      SELECT {direction}
-                      FROM RawDataTable
-                      WHERE id = {idx};
-                      """
-        self.cursor.execute(sql_command0)
+        return ExperimentID
 
+    def findExperiment(self, fingerprint):
+        '''
+        Returns the id of the experiment whose source file matches
+        fingerprint (see fileFingerprint), or None if there is no such
+        experiment in the database
+        '''
+        sql_command = """
+        SELECT id FROM ExperimentalParametersTable
+        WHERE sourcePath = ? AND sourceSize = ? AND sourceMtime = ? AND sourceHash = ?;
+        """
+        try:
+            self.cursor.execute(sql_command, fingerprint)
+        except sqlite3.OperationalError:
+            # The tables do not exist yet, or were created by an older
+            # version without the source* columns
+            return None
         data = self.cursor.fetchone()
-        
-        yData = data[0]
 
-        sql_command1 = f"""
-                      SELECT rampLength, nRampPoints
-                      FROM ExperimentalParametersTable
-                      WHERE id = 1;
-                      """
-        self.cursor.execute(sql_command1)
-        data = self.cursor.fetchone()
-        
-        if xDimensions == True:
-            xData = np.linspace(0., data[0], data[1])
-        else:
-            xData = np.linspace(0, data[1]-1, data[1])
-            
-        return(xData, yData)
+        return None if data is None else data[0]
 
-        self.closeDataBaseConnection()
+    def storeFingerprint(self, ExperimentID, fingerprint):
+        '''
+        Saves the fingerprint of the source file of experiment ExperimentID
+        '''
+        sql_command = """
+        UPDATE ExperimentalParametersTable
+        SET sourcePath = ?, sourceSize = ?, sourceMtime = ?, sourceHash = ?
+        WHERE id = ?;
+        """
+        self.cursor.execute(sql_command, fingerprint + (ExperimentID,))
+        self.connector.commit()
 
-    def getNumberForceRamps(self, database_name):
+    def storeCalibration(self, ExperimentID, calibration):
+        '''
+        Saves the calibration parameters (a dictionary with some of
+        CALIBRATION_PARAMETERS) of experiment ExperimentID. The ones not
+        given keep their values (1, by default).
+        '''
+        calibration = {name: value for name, value in calibration.items()
+                       if name in CALIBRATION_PARAMETERS}
+        if not calibration:
+            return
+        sql_command = f"""
+        UPDATE ExperimentalParametersTable
+        SET {', '.join(f'{name} = ?' for name in calibration)}
+        WHERE id = ?;
+        """
+        self.cursor.execute(sql_command, tuple(calibration.values()) + (ExperimentID,))
+
+    def getForceRampFromID(self, database_name, idx, direction='ForceForward', xDimensions=True, *,
+                           experimentID):
+        '''
+        Returns the (xData, yData) force ramp number idx (starting at 1,
+        row-major order) of experiment experimentID, the id returned by
+        fvToSQL. It has no default: a database holds many experiments, and
+        the id of a replaced one is not reused (pass None for stores other
+        than sqlite databases, which hold a single force volume).
+        database_name can be any store of force volumes (see
+        classForceVolumeStores.openStore): an sqlite database written by
+        fvToSQL, a directory written by writeChunkedArrayStore, or the
+        force volume file itself.
+        Each call opens (and closes) the store: use a store (e.g. a
+        ForceVolumeSession) to get many force ramps.
+        '''
+        store = self.openStore(database_name, experimentID)
+        try:
+            return store.getForceRamp(idx-1, self.directionColumn(direction), xDimensions)
+        finally:
+            store.close()
+
+    def getNumberForceRamps(self, database_name, *, experimentID):
+        '''
+        Returns the number of force ramps of experiment experimentID of
+        database_name (any store and experimentID, as in getForceRampFromID)
+        '''
+        store = self.openStore(database_name, experimentID)
+        try:
+            return store.getNumberForceRamps()
+        finally:
+            store.close()
 
+    def openStore(self, database_name, experimentID):
+        # Imported here, as the stores are built on this module
+        from .classForceVolumeStores import openStore
+        return openStore(database_name, experimentID)
+
+    def getExperiments(self, database_name):
+        '''
+        Returns a list of (id, ExperimentName, sourcePath) with the
+        experiments stored in the database
+        '''
+        self.upgradeDataBase(database_name)
         self.connectToDataBase(database_name)
 
-        sql_command1 = f"""
-                      SELECT nRows, nColumns
+        try:
+            self.cursor.execute("""
+                      SELECT id, ExperimentName, sourcePath
                       FROM ExperimentalParametersTable
-                      WHERE id = 1;
-                      """
-        self.cursor.execute(sql_command1)
-        data = self.cursor.fetchone()
-        
-        nForceRamps = data[0] * data[1]
+                      ORDER BY id;
+                      """)
+            experiments = self.cursor.fetchall()
+        except sqlite3.OperationalError:
+            experiments = []
 
-        return nForceRamps
-        
         self.closeDataBaseConnection()
 
+        return experiments
+
+    def directionColumn(self, direction):
+        '''
+        Returns the column of RawDataTable for the ramp direction. Column
+        names cannot be passed as SQL parameters, so they are whitelisted.
+        '''
+        if direction not in ('ForceForward', 'ForceBackward'):
+            raise ValueError(f"Unknown force ramp direction: {direction}")
+        return direction
+
+    def openFile(self, file_name):
+        '''
+        Opens the Force Volume file file_name, and parses its header.
+        Returns a NanoscopeFile, from which any of its channels can be read
+        without opening the file again. Its header is also saved in the
+        attribute header.
+        '''
+        nanoscopeFile = NanoscopeFile(file_name, FORCE_VOLUME_KEYS)
+        self.header = nanoscopeFile.header
+
+        return nanoscopeFile
+
     def readHeader(self, file_name):
         '''
-        Reads the header of the Force Volume File file_name
-        '''
-        file = open(file_name, 'r', encoding='cp1252')
-
-        # At the beginning we are not at the end of the header
-        # or at the endof the file
-        header_end = 0
-        eof = 0
-
-        # We initialize the attribute headerParameters, a dictionary
-        # with keys corresponding to strings that identify the lines
-        # in the Force Volume file header with relevant information
-        headerParameters = {'Sens. Zsens': [], '2:Z scale': [],
-                            'Samps/line': [], 'Data offset': [],
-                            'Scan Size': [], 'Z magnify': [],
-                            '4:Ramp Size': [], 'Force Data Points': [],
-                            'Number of lines': [], 'Data length':[],
-                            'Bytes/pixel':[], 'Image Data':[]}
-
-        # Keep reading the file line by line until the end of
-        # the header (or the end of the file) is reached.
-        # For each line, check whether it contains the keys
-        # of headParameters, and if so populate their values, by
-        # calling to searchForParameters(). Then, check if the end
-        # of the header has been reached by calling searchForHeaderEnd()
-        while (not header_end) and (not eof):
-            for line in file:
-                headerParameters = self.searchForParameters(line, headerParameters)
-                header_end = self.searchForHeaderEnd(line, r'\*File list end')
-                if header_end == 1:
-                    break
-            else:
-                eof = 1
-        file.close()
+        Reads the header of the Force Volume File file_name.
+        The header is parsed in a single pass by NanoscopeHeader, which is
+        also saved (with all the header sections) in the attribute header.
+        '''
+        # The keys of headerParameters, FORCE_VOLUME_KEYS, are strings that
+        # identify the lines in the Force Volume file header with relevant
+        # information
+        with open(file_name, 'r', encoding='cp1252') as file:
+            self.header = NanoscopeHeader(file, FORCE_VOLUME_KEYS)
 
-        return headerParameters
+        return self.header.parameters
 
     def searchForParameters(self, _line, headerParameters):
         '''
@@ -226,23 +603,7 @@ class NanoscopeForceVolumeObject():
         keys of headParameters. If so, pupulates its values with numbers
         contained in _line as well.
         '''
-        for key in headerParameters:
-            if re.search(re.escape(key), _line):
-                if key == "Image Data":
-                    searchString = re.split(r'"', _line)
-                    searchString = searchString[-2]
-                    headerParameters[key].append(searchString)
-                else:
-                    numbers = re.findall(r'\d+\.?\d*', _line)
-                    # If _line contains the strings 'LSB' or '@', only populate
-                    # the key value with the last number from _line. If not,
-                    # populate it with all numbers.
-                    if re.search(r'LSB', _line) or re.search(r'@', _line):
-                        headerParameters[key].append(float(numbers[-1]))
-                    else:
-                        for number in numbers:
-                            headerParameters[key].append(float(number))
-        return headerParameters
+        return classNanoscopeHeader.searchForParameters(_line, headerParameters, FORCE_VOLUME_KEYS)
 
     def searchForHeaderEnd(self, _line, _string):
         '''
@@ -276,54 +637,215 @@ class NanoscopeForceVolumeObject():
 
         return fvParameters
 
+    def sectionOffset(self, headerParameters, channel):
+        '''
+        Returns the (offset, length) in bytes of the last data section of
+        the file whose Image Data matches channel
+        '''
+        index = next(
+            idx for idx in reversed(range(len(headerParameters['Image Data']))) if headerParameters['Image Data'][idx] == channel)
+
+        return (int(headerParameters['Data offset'][index-1]),
+                int(headerParameters['Data length'][index]))
+
+    def mapTopography(self, file_name, headerParameters, fvParameters):
+        '''
+        Returns a read-only np.memmap view, with shape (rows, columns), of
+        the raw int32 topography (Height) data of the Force Volume file.
+        Nothing is read from disk until the view is accessed.
+        '''
+        offset, length = self.sectionOffset(headerParameters, 'Height')
+        shape = (fvParameters['numberOfMapRows'][0],
+                 fvParameters['numberOfMapColumns'][0])
+
+        return np.memmap(file_name, dtype='<i4', mode='r', offset=offset, shape=shape)
+
+    def mapFV(self, file_name, headerParameters, fvParameters):
+        '''
+        Returns a read-only np.memmap view, with shape
+        (rows, columns, 2, rampPoints), of the raw int32 Deflection Error
+        data of the Force Volume file. Nothing is read from disk until
+        the view is accessed, and the data is not scaled: multiply the
+        curves actually needed by DEFLECTION_SCALE.
+        '''
+        offset, length = self.sectionOffset(headerParameters, 'Deflection Error')
+        shape = (fvParameters['numberOfMapRows'][0],
+                 fvParameters['numberOfMapColumns'][0],
+                 2,
+                 fvParameters['rampPoints'][0])
+
+        return np.memmap(file_name, dtype='<i4', mode='r', offset=offset, shape=shape)
+
+    def readTopographyChannel(self, nanoscopeFile, fvParameters):
+        '''
+        Returns the topography (Height) map, in nm, of the open Force
+        Volume file nanoscopeFile
+        '''
+        shape = (fvParameters['numberOfMapRows'][0],
+                 fvParameters['numberOfMapColumns'][0])
+        topographyArray = nanoscopeFile.readChannel('Height', dtype='<i4', shape=shape)
+
+        return topographyArray * self.topographyScale(nanoscopeFile.headerParameters)
+
+    def mapFVChannel(self, nanoscopeFile, fvParameters):
+        '''
+        Same as mapFV, for the open Force Volume file nanoscopeFile
+        '''
+        shape = (fvParameters['numberOfMapRows'][0],
+                 fvParameters['numberOfMapColumns'][0],
+                 2,
+                 fvParameters['rampPoints'][0])
+
+        return nanoscopeFile.mapChannel('Deflection Error', dtype='<i4', shape=shape)
+
+    def readFVChannelBlocks(self, nanoscopeFile, fvParameters, maxMemory=INGEST_MEMORY_LIMIT):
+        '''
+        Returns a ForceVolumeBlockReader on the raw int32 Deflection Error
+        data of the open Force Volume file nanoscopeFile, indexed as the
+        array of mapFVChannel, which reads it in blocks of rows within
+        maxMemory bytes
+        '''
+        shape = (fvParameters['numberOfMapRows'][0],
+                 fvParameters['numberOfMapColumns'][0],
+                 2,
+                 fvParameters['rampPoints'][0])
+
+        return ForceVolumeBlockReader(nanoscopeFile, shape, maxMemory=maxMemory)
+
+    def topographyScale(self, headerParameters):
+        '''
+        Conversion factor from the int32 topography counts to nm
+        '''
+        return ((headerParameters['Sens. Zsens'][0] *
+                 headerParameters['2:Z scale'][0]) /
+                (65535+1))
+
     def readTopography(self, file_name, headerParameters, fvParameters):
         '''
         Reads (binary) topography data contained in the Force Volume file
         and (temporally) saves it in the attribute topographyArray
         '''
+        topographyArray = self.mapTopography(file_name, headerParameters, fvParameters)
 
-        # Get index for the Data offset and Data length corresponding to the
-        # topography map
-        index = next(
-            idx for idx in reversed(range(len(headerParameters['Image Data']))) if headerParameters['Image Data'][idx] == 'Height')
-        file = open(file_name, 'rb')
-        file.seek(int(headerParameters['Data offset'][index-1]))
-        s = file.read(int(headerParameters['Data length'][index]))
-        topographyArray = np.frombuffer(s, dtype='int32').reshape(
-                (fvParameters['numberOfMapRows'][0], fvParameters['numberOfMapColumns'][0])
-        )
-        topographyArray = topographyArray * (
-                (headerParameters['Sens. Zsens'][0] *
-                 headerParameters['2:Z scale'][0]) /
-                (65535+1)
-        )
-        file.close()
-
-        return topographyArray
+        return topographyArray * self.topographyScale(headerParameters)
 
     def readFV(self, file_name, headerParameters, fvParameters):
         '''
         Reads (binary) force volume data contained in the Force Volume file
-        and (temporally) saves it in the attribute FVDataArray
+        and (temporally) saves it in the attribute FVDataArray.
+        Note that this loads, and scales, the whole data section: use mapFV
+        (or openMemoryMap) to access only some of the curves. The ingest
+        (fvToSQL) reads the file in blocks of rows instead.
         '''
-        # Get index for the Data offset and Data length corresponding to the
-        # force volume data
-        index = next(
-            idx for idx in reversed(range(len(headerParameters['Image Data']))) if headerParameters['Image Data'][idx] == 'Deflection Error')
-        file = open(file_name, 'rb')
-        file.seek(int(headerParameters['Data offset'][index-1]))
-        bufferedData = file.read(int(headerParameters['Data length'][index]))
-        fvDataArray = np.frombuffer(
-                bufferedData, dtype='int32', count=-1
-        ).reshape(
-                (fvParameters['numberOfMapRows'][0],
-                 fvParameters['numberOfMapColumns'][0],
-                 2,
-                 fvParameters['rampPoints'][0])
-        )*0.000375
-        file.close()
+        fvDataArray = self.mapFV(file_name, headerParameters, fvParameters)
+
+        return fvDataArray * DEFLECTION_SCALE
+
+    def openMemoryMap(self, file_name):
+        '''
+        Opens the Force Volume file file_name for direct access, without
+        going through the database. Only the header is parsed; the Height
+        and Deflection Error sections are memory mapped and saved in the
+        attributes topographyMap and fvMap.
+        '''
+        with self.openFile(file_name) as nanoscopeFile:
+            self.headerParameters = nanoscopeFile.headerParameters
+            self.fvParameters = self.headerToParameters(self.headerParameters)
+            self.topographyMap = nanoscopeFile.mapChannel(
+                    'Height', shape=(self.fvParameters['numberOfMapRows'][0],
+                                     self.fvParameters['numberOfMapColumns'][0])
+                    )
+            self.fvMap = self.mapFVChannel(nanoscopeFile, self.fvParameters)
 
-        return fvDataArray
+    def getForceRampFromMap(self, idx, direction='ForceForward', xDimensions=True):
+        '''
+        Returns the (xData, yData) force ramp number idx (starting at 0,
+        row-major order) of the file opened with openMemoryMap.
+        Only that curve is read from disk and scaled.
+        '''
+        nColumns = self.fvParameters['numberOfMapColumns'][0]
+        nRampPoints = self.fvParameters['rampPoints'][0]
+        self.checkMapIDs(idx)
+        i, j = divmod(idx, nColumns)
+        k = directionIndex(direction)
+
+        yData = self.fvMap[i, j, k, :] * DEFLECTION_SCALE
+
+        if xDimensions == True:
+            xData = np.linspace(0., self.fvParameters['rampLength'][0], nRampPoints)
+        else:
+            xData = np.linspace(0, nRampPoints-1, nRampPoints)
+
+        return(xData, yData)
+
+    def getForceRampWindowFromMap(self, idx, start, stop, direction='ForceForward', xDimensions=True):
+        '''
+        Returns the samples [start, stop) of the (xData, yData) force ramp
+        number idx (as in getForceRampFromMap) of the file opened with
+        openMemoryMap. Only the pages of the file with those samples are
+        read.
+        '''
+        nColumns = self.fvParameters['numberOfMapColumns'][0]
+        nRampPoints = self.fvParameters['rampPoints'][0]
+        rampLength = self.fvParameters['rampLength'][0]
+        self.checkMapIDs(idx)
+        i, j = divmod(idx, nColumns)
+        k = directionIndex(direction)
+        start, stop, _ = slice(start, stop).indices(nRampPoints)
+        stop = max(start, stop)
+
+        yData = self.fvMap[i, j, k, start:stop] * DEFLECTION_SCALE
+
+        # Only the window of the x axis, with the same values as the
+        # np.linspace of getForceRampFromMap
+        xData = np.arange(start, stop, dtype=np.float64)
+        if xDimensions == True and nRampPoints > 1:
+            xData *= rampLength / (nRampPoints-1)
+            if stop == nRampPoints:
+                xData[-1] = rampLength
+
+        return(xData, yData)
+
+    def getForceRampsFromMap(self, ids, direction='ForceForward'):
+        '''
+        Returns a (len(ids), nRampPoints) array with the force ramps ids
+        (as in getForceRampFromMap) of the file opened with openMemoryMap,
+        read with a single (fancy) indexing of the map
+        '''
+        nRampPoints = self.fvParameters['rampPoints'][0]
+        ids = np.asarray(ids, dtype=np.intp)
+        self.checkMapIDs(ids)
+        k = directionIndex(direction)
+        forceRamps = self.fvMap.reshape(-1, 2, nRampPoints)
+
+        return forceRamps[ids, k, :] * DEFLECTION_SCALE
+
+    def checkMapIDs(self, ids):
+        '''
+        Raises IndexError if any of the force ramp numbers ids is out of
+        the map opened with openMemoryMap (negative numbers would index
+        it from its end)
+        '''
+        ids = np.asarray(ids)
+        nRamps = self.fvParameters['numberOfMapRows'][0] * self.fvParameters['numberOfMapColumns'][0]
+        if ids.size and (ids.min() < 0 or ids.max() >= nRamps):
+            raise IndexError(f"Force ramps out of the map, with {nRamps} of them")
+
+    def getTopographyFromMap(self):
+        '''
+        Returns the topography (Height) map, in nm, of the file opened with
+        openMemoryMap
+        '''
+        return self.topographyMap * self.topographyScale(self.headerParameters)
+
+    def getConverterFromMap(self):
+        '''
+        Returns the UnitConverter of the file opened with openMemoryMap,
+        with the calibration found in its header (the defaults of
+        ExperimentalParametersTable, if not there)
+        '''
+        return UnitConverter(rampLength=self.fvParameters['rampLength'][0],
+                             **calibrationFromHeader(self.header))
 
     def connectToDataBase(self, database_name):
         '''
@@ -335,6 +857,20 @@ class NanoscopeForceVolumeObject():
         )
         self.cursor = self.connector.cursor()
 
+    def tuneDataBase(self, page_size=65536):
+        '''
+        Sets the pragmas used for bulk ingest:
+        - page_size: large enough for several curves to fit in a page,
+          instead of spilling each of them over a chain of overflow pages.
+          It only takes effect if set before the database is created.
+        - journal_mode=WAL: the ingest is appended to the write-ahead log,
+          and the database can still be read while it is being written.
+        - synchronous=NORMAL: no fsync on every commit (safe with WAL).
+        '''
+        self.cursor.execute(f"PRAGMA page_size = {int(page_size)};")
+        self.cursor.execute("PRAGMA journal_mode = WAL;")
+        self.cursor.execute("PRAGMA synchronous = NORMAL;")
+
     def closeDataBaseConnection(self):
         '''
         Closes the connection to the database
@@ -342,41 +878,22 @@ class NanoscopeForceVolumeObject():
         self.cursor.close()
         self.connector.close()
 
-    def createTables(self, file_name2):
+    def createTables(self):
         '''
-        Creates 2 tables in the database.
-        1- ExperimentsTable: a row for each force volume experiment
-        with columns associated with experimental parameters of relevance.
-        It is created only if it does not exists already.
-        2- A table named as the input file with columns for the Force
-        Volume and topography data of the specific loaded experiment. If
-        a table with the same name existed, the old one is previously
-        deleted.
+        Creates, if they do not exist already, 2 tables in the database.
+        1- ExperimentalParametersTable: a row for each force volume
+        experiment with columns associated with experimental parameters of
+        relevance (see createExperimentsTable).
+        2- RawDataTable: a row for each force ramp of every experiment,
+        with columns for the Force Volume and topography data, indexed on
+        (ExperimentID, NX, NY).
+        3- CurveFeaturesTable: the features of each force ramp (see
+        classCurveFeatures.createFeaturesTable).
+        The database therefore keeps every volume ingested in it. Tables
+        created by older versions are upgraded with upgradeTables.
         '''
 
-        sql_command0 = """
-        DROP TABLE IF EXISTS ExperimentalParametersTable
-        """
-
-        sql_command1 = """
-        CREATE TABLE IF NOT EXISTS ExperimentalParametersTable (
-        id INTEGER,
-        ExperimentName TEXT NOT NULL UNIQUE,
-        nRows INTEGER,
-        nColumns INTEGER,
-        nRampPoints INTEGER,
-        scanSize REAL,
-        rampLength REAL,
-        photodiodeSensitivity REAL DEFAULT 1,
-        forceConstant REAL DEFAULT 1,
-        probeRadius REAL DEFAULT 1,
-        PRIMARY KEY (id)
-        );
-        """
-        sql_command2 = f"""
-        DROP TABLE IF EXISTS RawDataTable
-        """
-        sql_command3 = f"""
+        sql_command3 = """
         CREATE TABLE IF NOT EXISTS RawDataTable (
         id INTEGER,
         ExperimentID INTEGER NOT NULL,
@@ -389,51 +906,311 @@ class NanoscopeForceVolumeObject():
         FOREIGN KEY (ExperimentID) REFERENCES ExperimentalParametersTable(id)
         );
         """
-        self.cursor.execute(sql_command0)
-        self.cursor.execute(sql_command1)
-        self.cursor.execute(sql_command2)
+        sql_command4 = """
+        CREATE INDEX IF NOT EXISTS RawDataTableExperimentIndex
+        ON RawDataTable (ExperimentID, NX, NY);
+        """
+        self.createExperimentsTable()
         self.cursor.execute(sql_command3)
+        createFeaturesTable(self.cursor)
+        self.upgradeTables()
+        self.cursor.execute(sql_command4)
         self.connector.commit()
 
-    def populateTables(self, file_name2, fvParameters, topographyArray, fvDataArray):
+    def createExperimentsTable(self, tableName='ExperimentalParametersTable'):
+        '''
+        Creates, if it does not exist already, the table of experiments
+        (ExperimentalParametersTable) as tableName. Its ids are
+        AUTOINCREMENT, so that the id of a deleted experiment is never
+        given to another one, and experiments are unique by sourcePath.
+        '''
+        sql_command = f"""
+        CREATE TABLE IF NOT EXISTS {tableName} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ExperimentName TEXT NOT NULL,
+        nRows INTEGER,
+        nColumns INTEGER,
+        nRampPoints INTEGER,
+        scanSize REAL,
+        rampLength REAL,
+        photodiodeSensitivity REAL DEFAULT 1,
+        forceConstant REAL DEFAULT 1,
+        probeRadius REAL DEFAULT 1,
+        curveEncoding TEXT DEFAULT 'npy',
+        curveDtype TEXT DEFAULT '<f8',
+        curveScale REAL DEFAULT 1,
+        sourcePath TEXT UNIQUE,
+        sourceSize INTEGER,
+        sourceMtime INTEGER,
+        sourceHash TEXT
+        );
+        """
+        self.cursor.execute(sql_command)
+
+    def upgradeDataBase(self, database_name):
+        '''
+        Upgrades the tables of database_name (see upgradeTables) if they
+        were created by an older version, so that it can be read. It is
+        called whenever a database is opened (e.g. by ForceVolumeSession).
+        '''
+        self.connectToDataBase(database_name)
+        try:
+            if self.tablesNeedUpgrade():
+                self.createTables()
+        finally:
+            self.closeDataBaseConnection()
+
+    def tablesNeedUpgrade(self):
+        '''
+        Whether the tables of the connected database were created by an
+        older version (there is nothing to upgrade in a new database)
+        '''
+        self.cursor.execute("""
+                  SELECT sql FROM sqlite_master
+                  WHERE type = 'table' AND name = 'ExperimentalParametersTable';
+                  """)
+        data = self.cursor.fetchone()
+        if data is None:
+            return False
+        if 'AUTOINCREMENT' not in data[0].upper():
+            return True
+        self.cursor.execute("PRAGMA table_info(ExperimentalParametersTable);")
+        columns = [data[1] for data in self.cursor.fetchall()]
+        if any(column not in columns for column in ADDED_EXPERIMENT_COLUMNS):
+            return True
+        self.cursor.execute("SELECT 1 FROM ExperimentalParametersTable WHERE sourcePath IS NULL LIMIT 1;")
+        return self.cursor.fetchone() is not None
+
+    def upgradeTables(self):
+        '''
+        Upgrades the tables of databases created by older versions: adds
+        to ExperimentalParametersTable the columns it misses, and rebuilds
+        it if it was keyed by ExperimentName, without AUTOINCREMENT ids.
+        Only the last experiment ingested from each sourcePath is kept.
+        Experiments without sourcePath (ingested before files were
+        fingerprinted) cannot be replaced nor found by their file, so they
+        are deleted: their files are ingested again when opened.
+        '''
+        self.cursor.execute("PRAGMA table_info(ExperimentalParametersTable);")
+        columns = [data[1] for data in self.cursor.fetchall()]
+        for column, definition in ADDED_EXPERIMENT_COLUMNS.items():
+            if column not in columns:
+                self.cursor.execute(
+                        f"ALTER TABLE ExperimentalParametersTable ADD COLUMN {column} {definition};"
+                        )
+
+        self.cursor.execute("SELECT MAX(id) FROM ExperimentalParametersTable;")
+        lastID = self.cursor.fetchone()[0] or 0
+        self.cursor.execute("SELECT id FROM ExperimentalParametersTable WHERE sourcePath IS NULL;")
+        self.deleteExperiments([data[0] for data in self.cursor.fetchall()])
+
+        self.cursor.execute("""
+                  SELECT sql FROM sqlite_master
+                  WHERE type = 'table' AND name = 'ExperimentalParametersTable';
+                  """)
+        if 'AUTOINCREMENT' in self.cursor.fetchone()[0].upper():
+            return
+        self.cursor.execute("""
+                  SELECT id FROM ExperimentalParametersTable
+                  WHERE id NOT IN
+                  (SELECT MAX(id) FROM ExperimentalParametersTable GROUP BY sourcePath);
+                  """)
+        self.deleteExperiments([data[0] for data in self.cursor.fetchall()])
+        # The key of a table cannot be changed in place: a new one is
+        # filled and renamed (references to the table keep its name)
+        self.cursor.execute("DROP TABLE IF EXISTS ExperimentalParametersTableUpgrade;")
+        self.createExperimentsTable('ExperimentalParametersTableUpgrade')
+        self.cursor.execute("PRAGMA table_info(ExperimentalParametersTableUpgrade);")
+        columns = ', '.join(data[1] for data in self.cursor.fetchall())
+        self.cursor.execute(f"""
+                  INSERT INTO ExperimentalParametersTableUpgrade ({columns})
+                  SELECT {columns} FROM ExperimentalParametersTable;
+                  """)
+        # The ids of the deleted experiments are not reused either
+        self.cursor.execute("DELETE FROM sqlite_sequence WHERE name = 'ExperimentalParametersTableUpgrade';")
+        self.cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('ExperimentalParametersTableUpgrade', ?);",
+                            (lastID,))
+        self.cursor.execute("DROP TABLE ExperimentalParametersTable;")
+        self.cursor.execute(
+                "ALTER TABLE ExperimentalParametersTableUpgrade RENAME TO ExperimentalParametersTable;"
+                )
+
+    def deleteExperiment(self, sourcePath):
+        '''
+        Deletes from the database the experiment of the file sourcePath
+        (an absolute path, as in fileFingerprint), if any, together with
+        all its force ramps and their features
         '''
-        Populates the tables ExperimentalParametersTable and the one named as
-        the input file.
-        If an entry with a similar ExperimentName already exists in
-        ExperimentsTable, thant entry is replaced.
+        self.cursor.execute("SELECT id FROM ExperimentalParametersTable WHERE sourcePath = ?;",
+                            (sourcePath,))
+        self.deleteExperiments([data[0] for data in self.cursor.fetchall()])
+
+    def deleteExperiments(self, ids):
+        '''
+        Deletes from the database the experiments with the given ids,
+        together with all their force ramps and their features
+        '''
+        for ExperimentID in ids:
+            self.cursor.execute("DELETE FROM RawDataTable WHERE ExperimentID = ?;", (ExperimentID,))
+            deleteFeatures(self.cursor, ExperimentID)
+            self.cursor.execute("DELETE FROM ExperimentalParametersTable WHERE id = ?;", (ExperimentID,))
+
+    def populateTables(self, ExperimentName, sourcePath, fvParameters, topographyArray, fvDataArray,
+                       fvScale=1., progressCallback=None, cancelEvent=None):
+        '''
+        Populates the tables ExperimentalParametersTable and RawDataTable
+        with the experiment ExperimentName of the file sourcePath (its
+        absolute path). If the file was already ingested, that experiment
+        (and its force ramps) is replaced by a new one, with a new id.
+        fvDataArray holds the raw int32 counts (memory mapped, or read in
+        blocks by a ForceVolumeBlockReader), which are stored as they are,
+        with fvScale as the curveScale of the experiment.
+        See fvToSQL for progressCallback and cancelEvent.
         '''
         sql_command = """
-        INSERT OR REPLACE INTO ExperimentalParametersTable
-        (ExperimentName, nRows, nColumns,
-        nRampPoints, scanSize, rampLength) values
-        (?, ?, ?, ?, ?, ?)
+        INSERT INTO ExperimentalParametersTable
+        (ExperimentName, sourcePath, nRows, nColumns,
+        nRampPoints, scanSize, rampLength,
+        curveDtype, curveScale) values
+        (?, ?, ?, ?, ?, ?, ?, ?, ?)
         """
+        self.deleteExperiment(sourcePath)
         self.cursor.execute(sql_command, (
-            file_name2,
+            ExperimentName,
+            sourcePath,
             fvParameters['numberOfMapRows'][0],
             fvParameters['numberOfMapColumns'][0],
             fvParameters['rampPoints'][0],
             fvParameters['scanSize'][0],
-            fvParameters['rampLength'][0]
+            fvParameters['rampLength'][0],
+            fvDataArray.dtype.str,
+            fvScale
         ))
-
-        sql_command2 = f"""
-        SELECT id FROM ExperimentalParametersTable
-        WHERE ExperimentName='{file_name2}';
-        """
-        self.cursor.execute(sql_command2)
-
-        ExperimentID = self.cursor.fetchone()[0]
+        ExperimentID = self.cursor.lastrowid
 
         for i in range(fvParameters['numberOfMapRows'][0]):
+            self.checkIngest(i, fvParameters['numberOfMapRows'][0], progressCallback, cancelEvent)
             for j in range(fvParameters['numberOfMapColumns'][0]):
                 self.cursor.execute(
-                        f"""INSERT INTO RawDataTable
+                        """INSERT INTO RawDataTable
                            (ExperimentID, NX, NY,
                            ForceForward, ForceBackward, Height)
                            values (?, ?, ?, ?, ?, ?)""",
-                        (ExperimentID, i, j, fvDataArray[i, j, 0, :],
-                         fvDataArray[i, j, 1, :],
+                        (ExperimentID, i, j, np.array(fvDataArray[i, j, 0, :]),
+                         np.array(fvDataArray[i, j, 1, :]),
                          topographyArray[i, j])
                         )
+            features = self.rowFeatures(np.asarray(fvDataArray[i]) * fvScale, fvParameters)
+            insertFeatures(self.cursor, ExperimentID, [i] * features.shape[0],
+                           range(features.shape[0]), features)
+        self.checkIngest(fvParameters['numberOfMapRows'][0], fvParameters['numberOfMapRows'][0],
+                         progressCallback, cancelEvent)
         self.connector.commit()
+
+        return ExperimentID
+
+    def populateTablesBulk(self, ExperimentName, sourcePath, fvParameters, topographyArray, fvDataArray,
+                           fvScale=1., curveDtype='<i4', curveEncoding='raw',
+                           progressCallback=None, cancelEvent=None):
+        '''
+        Same as populateTables, but all rows are inserted in a single
+        transaction with executemany, from a generator, and the curves are
+        stored encoded with curveEncoding, one of CURVE_CODECS (by default
+        'raw', their little-endian bytes). The encoding and the dtype of
+        the curves, curveDtype, are kept once in ExperimentalParametersTable.
+        With an integer curveDtype the counts are stored unscaled, and
+        fvScale is kept as curveScale; with a float one, they are scaled
+        before they are stored.
+        '''
+        sql_command = """
+        INSERT INTO ExperimentalParametersTable
+        (ExperimentName, sourcePath, nRows, nColumns,
+        nRampPoints, scanSize, rampLength,
+        curveEncoding, curveDtype, curveScale) values
+        (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """
+        if curveEncoding not in CURVE_CODECS:
+            raise ValueError(f"Unknown curve encoding {curveEncoding!r}, must be one of "
+                             f"{list(CURVE_CODECS)}")
+        encode = CURVE_CODECS[curveEncoding][0]
+        storeCounts = isCountsDtype(curveDtype)
+        nRows = fvParameters['numberOfMapRows'][0]
+        nColumns = fvParameters['numberOfMapColumns'][0]
+
+        with self.connector:
+            self.deleteExperiment(sourcePath)
+            self.cursor.execute(sql_command, (
+                ExperimentName,
+                sourcePath,
+                nRows,
+                nColumns,
+                fvParameters['rampPoints'][0],
+                fvParameters['scanSize'][0],
+                fvParameters['rampLength'][0],
+                curveEncoding,
+                curveDtype,
+                fvScale if storeCounts else 1.
+            ))
+            ExperimentID = self.cursor.lastrowid
+
+            # The features of each row are computed while it is in memory,
+            # and inserted once all the curves are
+            features = np.empty((nRows, nColumns, len(FEATURE_NAMES)))
+
+            def rows():
+                for i in range(nRows):
+                    self.checkIngest(i, nRows, progressCallback, cancelEvent)
+                    # Scale a whole row of the map at once
+                    rowCounts = np.asarray(fvDataArray[i])
+                    rowData = rowCounts * fvScale
+                    features[i] = self.rowFeatures(rowData, fvParameters)
+                    if not storeCounts:
+                        rowCounts = rowData
+                    for j in range(nColumns):
+                        yield (ExperimentID, i, j,
+                               encode(rowCounts[j, 0, :], curveDtype),
+                               encode(rowCounts[j, 1, :], curveDtype),
+                               float(topographyArray[i, j]))
+
+            self.cursor.executemany(
+                    """INSERT INTO RawDataTable
+                       (ExperimentID, NX, NY,
+                       ForceForward, ForceBackward, Height)
+                       values (?, ?, ?, ?, ?, ?)""",
+                    rows()
+                    )
+            NX, NY = np.divmod(np.arange(nRows*nColumns), nColumns)
+            insertFeatures(self.cursor, ExperimentID, NX, NY,
+                           features.reshape(nRows*nColumns, len(FEATURE_NAMES)))
+            self.checkIngest(nRows, nRows, progressCallback, cancelEvent)
+
+        return ExperimentID
+
+    def rowFeatures(self, rowData, fvParameters):
+        '''
+        Returns the (nColumns, len(FEATURE_NAMES)) features of a (scaled)
+        row of the map, rowData, with shape (nColumns, 2, nRampPoints)
+        '''
+        x = np.linspace(0., fvParameters['rampLength'][0], fvParameters['rampPoints'][0])
+        return computeFeatures(rowData[:, 0, :], rowData[:, 1, :], x)
+
+    def populateFeatures(self, ExperimentID, fvParameters, fvDataArray, fvScale=1.):
+        '''
+        Computes and saves the features of all the force ramps of experiment
+        ExperimentID, from fvDataArray (as in populateTables)
+        '''
+        with self.connector:
+            for i in range(fvParameters['numberOfMapRows'][0]):
+                features = self.rowFeatures(np.asarray(fvDataArray[i]) * fvScale, fvParameters)
+                insertFeatures(self.cursor, ExperimentID, [i] * features.shape[0],
+                               range(features.shape[0]), features)
+
+    def checkIngest(self, rowsDone, nRows, progressCallback=None, cancelEvent=None):
+        '''
+        Reports the progress of an ingest, and raises IngestCancelled if it
+        has been cancelled
+        '''
+        if cancelEvent is not None and cancelEvent.is_set():
+            raise IngestCancelled(f"Ingest cancelled after {rowsDone} of {nRows} rows")
+        if progressCallback is not None:
+            progressCallback(rowsDone, nRows)
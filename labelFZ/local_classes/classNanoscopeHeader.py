@@ -0,0 +1,283 @@
+###############################################################################
+# Imports
+###############################################################################
+import re
+from functools import partial
+
+###############################################################################
+# Precompiled regular expressions used to parse the lines of the header of
+# Nanoscope files. Header lines look like:
+#   \*Ciao force image list                      (start of a section)
+#   \Samps/line: 512 256                         (parameter)
+#   \@4:Z scale: V [Sens. Zsens] (0.000375 V/LSB) 24.576 V
+#                                                (scaled parameter, group 4)
+###############################################################################
+
+SECTION_REGEX = re.compile(r'\\\*(.*?)\s*$')
+PARAMETER_REGEX = re.compile(r'\\(@?)(?:(\d+):)?([^:]*):\s*(.*?)\s*$')
+SCALED_VALUE_REGEX = re.compile(r'(\w)\s*(?:\[(.*?)\])?\s*(?:\((.*?)\))?\s*(.*)$')
+NUMBER_REGEX = re.compile(r'-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?')
+HEADER_END = 'File list end'
+
+# Regular expressions for numbers used by the force volume and the force
+# ramp readers, respectively (they are kept apart, so that both readers
+# keep getting exactly the same values as they always did)
+FV_NUMBER_REGEX = re.compile(r'\d+\.?\d*')
+RAMP_NUMBER_REGEX = re.compile(r'-?\d+\.?\d+')
+TRAILING_INTEGER_REGEX = re.compile(r'\d+$')
+
+###############################################################################
+# Extractors: functions returning, from a header line, the list of values to
+# be appended to a key of the headerParameters dictionary
+###############################################################################
+
+
+def quotedString(_line):
+    '''
+    Returns the last quoted string in _line, e.g. the channel name in
+    \\@4:Image Data: S [DeflectionError] "Deflection Error"
+    '''
+    return [_line.split('"')[-2]]
+
+
+def trailingInteger(_line):
+    '''
+    Returns the integer at the end of _line
+    '''
+    return [int(TRAILING_INTEGER_REGEX.findall(_line)[0])]
+
+
+def firstNumber(_line, numberRegex=RAMP_NUMBER_REGEX):
+    '''
+    Returns the first number in _line
+    '''
+    return [float(numberRegex.findall(_line)[0])]
+
+
+def lastOrAllNumbers(_line, numberRegex=FV_NUMBER_REGEX):
+    '''
+    If _line contains the strings 'LSB' or '@', returns the last number
+    in _line (the hard value of a scaled parameter). If not, returns all
+    the numbers in _line.
+    '''
+    numbers = numberRegex.findall(_line)
+    if 'LSB' in _line or '@' in _line:
+        return [float(numbers[-1])]
+    return [float(number) for number in numbers]
+
+###############################################################################
+# Keys searched for in the headers of force volume and force ramp files,
+# with the extractor used for their values
+###############################################################################
+
+
+FORCE_VOLUME_KEYS = {'Sens. Zsens': lastOrAllNumbers,
+                     '2:Z scale': lastOrAllNumbers,
+                     'Samps/line': lastOrAllNumbers,
+                     'Data offset': lastOrAllNumbers,
+                     'Scan Size': lastOrAllNumbers,
+                     'Z magnify': lastOrAllNumbers,
+                     '4:Ramp Size': lastOrAllNumbers,
+                     'Force Data Points': lastOrAllNumbers,
+                     'Number of lines': lastOrAllNumbers,
+                     'Data length': lastOrAllNumbers,
+                     'Bytes/pixel': lastOrAllNumbers,
+                     'Image Data': quotedString}
+
+rampNumbers = partial(lastOrAllNumbers, numberRegex=RAMP_NUMBER_REGEX)
+
+FORCE_RAMP_KEYS = {'Sens. Zsens:': rampNumbers,
+                   'Data offset': rampNumbers,
+                   'Data length:': rampNumbers,
+                   'Z magnify': rampNumbers,
+                   '4:Ramp Size:': rampNumbers,
+                   'Samps/line:': rampNumbers,
+                   '4:Image Data:': quotedString,
+                   'Bytes/pixel': trailingInteger,
+                   '@4:Z scale': firstNumber}
+
+###############################################################################
+# Compiled matchers for a set of keys, so that each line is searched once for
+# all of them
+###############################################################################
+
+_keyMatchers = {}
+
+
+def keyMatcher(keys):
+    '''
+    Returns a compiled regular expression matching any of keys.
+    Longer keys are tried first, and matchers are cached per set of keys.
+    '''
+    keys = tuple(keys)
+    if keys not in _keyMatchers:
+        pattern = '|'.join(re.escape(key) for key in sorted(keys, key=len, reverse=True))
+        _keyMatchers[keys] = re.compile(pattern)
+    return _keyMatchers[keys]
+
+
+def searchForParameters(_line, headerParameters, keys):
+    '''
+    Identifies whether the input string, _line, contains some of the
+    keys of headerParameters. If so, populates their values with the
+    extractor given for them in keys.
+    '''
+    for key in set(keyMatcher(keys).findall(_line)):
+        headerParameters[key].extend(keys[key](_line))
+    return headerParameters
+
+###############################################################################
+# Classes for the structured (typed) representation of the header
+###############################################################################
+
+
+class NanoscopeParameter():
+    '''
+    A parameter (a line) of the header of a Nanoscope file.
+
+    Attributes:
+        name: e.g. 'Z scale' for \\@4:Z scale: ...
+        group: e.g. 4 for \\@4:Z scale: ... (None if there is no group)
+        scaled: True for parameters starting with '@'
+        value: the text after the colon
+    Properties (parsed from value the first time they are accessed):
+        numbers: list of all numbers in value
+        text: the quoted string in value, if any (e.g. the channel name
+            of an Image Data parameter)
+    and, for scaled parameters:
+        valueType: 'V' (value), 'C' (constant) or 'S' (select)
+        softScale: e.g. 'Sens. Zsens'
+        hardScale: e.g. 0.000375, from '(0.000375 V/LSB)'
+        hardValue: e.g. 24.576, the number after hardScale
+    '''
+
+    __slots__ = ('scaled', 'group', 'name', 'value', '_scaledValue')
+
+    def __init__(self, scaled, group, name, value):
+        self.scaled = scaled
+        self.group = None if group is None else int(group)
+        self.name = name
+        self.value = value
+        self._scaledValue = None
+
+    def __repr__(self):
+        return f"NanoscopeParameter({self.name!r}, {self.value!r})"
+
+    @property
+    def numbers(self):
+        return [float(number) for number in NUMBER_REGEX.findall(self.value)]
+
+    @property
+    def text(self):
+        if '"' not in self.value:
+            return None
+        return self.value.split('"')[-2]
+
+    def parseScaledValue(self):
+        '''
+        Returns (valueType, softScale, hardScale, hardValue) for scaled
+        parameters, and Nones for the rest
+        '''
+        if self._scaledValue is None:
+            self._scaledValue = (None, None, None, None)
+            match = SCALED_VALUE_REGEX.match(self.value) if self.scaled else None
+            if match is not None:
+                valueType, softScale, hardScale, rest = match.groups()
+                hardScale = NUMBER_REGEX.findall(hardScale or '')
+                hardValue = NUMBER_REGEX.findall(rest)
+                self._scaledValue = (valueType, softScale,
+                                     float(hardScale[0]) if hardScale else None,
+                                     float(hardValue[0]) if hardValue else None)
+        return self._scaledValue
+
+    @property
+    def valueType(self):
+        return self.parseScaledValue()[0]
+
+    @property
+    def softScale(self):
+        return self.parseScaledValue()[1]
+
+    @property
+    def hardScale(self):
+        return self.parseScaledValue()[2]
+
+    @property
+    def hardValue(self):
+        return self.parseScaledValue()[3]
+
+
+class NanoscopeHeader():
+    '''
+    Single-pass parser of the header of Nanoscope files, shared by the
+    force volume and force ramp readers.
+    Each line is matched once against precompiled regular expressions, to
+    build both:
+        sections: a list of (sectionName, parameters) in file order, where
+            parameters is a list of NanoscopeParameter
+        parameters: the headerParameters dictionary used by the readers,
+            with the values of the keys given (see FORCE_VOLUME_KEYS and
+            FORCE_RAMP_KEYS), in file order
+
+    Methods:
+        __init__(lines, keys=FORCE_VOLUME_KEYS)
+        parseLine(_line)
+        getSections(sectionName)
+        getParameter(name, sectionName=None)
+    '''
+
+    def __init__(self, lines, keys=FORCE_VOLUME_KEYS):
+        '''
+        Parses lines (any iterable of strings, such as a text file),
+        stopping at the end of the header
+        '''
+        self.keys = keys
+        self.matcher = keyMatcher(keys)
+        self.parameters = {key: [] for key in keys}
+        self.sections = []
+        self.header_end = 0
+        for line in lines:
+            self.parseLine(line)
+            if self.header_end == 1:
+                break
+
+    def parseLine(self, _line):
+        '''
+        Adds the information in a line of the header to the attributes
+        sections and parameters
+        '''
+        if _line.startswith('\\*'):
+            sectionName = SECTION_REGEX.match(_line).group(1)
+            if sectionName == HEADER_END:
+                self.header_end = 1
+            else:
+                self.sections.append((sectionName, []))
+        else:
+            match = PARAMETER_REGEX.match(_line)
+            if match is not None and self.sections:
+                scaled, group, name, value = match.groups()
+                self.sections[-1][1].append(
+                        NanoscopeParameter(scaled == '@', group, name, value)
+                        )
+        for key in set(self.matcher.findall(_line)):
+            self.parameters[key].extend(self.keys[key](_line))
+
+    def getSections(self, sectionName):
+        '''
+        Returns the list of parameter lists of all the sections named
+        sectionName
+        '''
+        return [parameters for name, parameters in self.sections if name == sectionName]
+
+    def getParameter(self, name, sectionName=None):
+        '''
+        Returns the first parameter called name (within the sections named
+        sectionName, if given), or None
+        '''
+        for section, parameters in self.sections:
+            if sectionName is not None and section != sectionName:
+                continue
+            for parameter in parameters:
+                if parameter.name == name:
+                    return parameter
+        return None
@@ -0,0 +1,282 @@
+###############################################################################
+# Imports
+###############################################################################
+import numpy as np
+from PyQt5.QtCore import pyqtSignal
+from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel,
+                             QComboBox, QLineEdit)
+from matplotlib.backends.backend_qt5agg import FigureCanvas
+from matplotlib.figure import Figure
+from matplotlib.collections import LineCollection
+from matplotlib.patches import Rectangle
+from .classCurveDecimator import CurveDecimator
+from .classCurveFeatures import FEATURE_NAMES, FEATURE_OPERATORS
+
+###############################################################################
+# Scaling of the force ramps into the cells of the grid
+###############################################################################
+
+
+def normalize(values):
+    '''
+    Returns values scaled to [0, 1]
+    '''
+    low = values.min()
+    span = values.max() - low
+    return (values - low) / span if span > 0 else np.full(values.shape, 0.5)
+
+###############################################################################
+# A class named OverviewGrid is declared, a window showing a whole page of
+# force ramps at once as small multiples, to find the interesting ones fast
+###############################################################################
+
+
+class OverviewGrid(QWidget):
+    '''
+    Window with a grid of nGridRows x nGridColumns thumbnails of
+    consecutive force ramps (a page), read with a single batch call to a
+    curve source (see classCurvePrefetcher) and drawn as a single
+    LineCollection. Each ramp is scaled to fill its own cell. Clicking
+    on a thumbnail emits curveSelected with the number of its ramp.
+    With a CurveFeatureIndex, the grid can be restricted to the force
+    ramps matching a condition on a feature (e.g. adhesion > 0.1),
+    sorted by that feature.
+
+    Signals:
+        curveSelected(idx)
+
+    Methods:
+        setSource(source, nRamps, direction='ForceForward', idx=None)
+        setFeatureIndex(getFeatureIndex)
+        applyFilter()
+        clearFilter()
+        showPage(page)
+        showCurve(idx)
+        refresh()
+    '''
+
+    curveSelected = pyqtSignal(int)
+
+    def __init__(self, parent=None, nGridRows=8, nGridColumns=8):
+        super().__init__(parent)
+        self.setWindowTitle("Overview")
+        self.nGridRows = nGridRows
+        self.nGridColumns = nGridColumns
+        self.pageSize = nGridRows * nGridColumns
+        self.source = None
+        self.nRamps = 0
+        self.direction = 'ForceForward'
+        self.page = None
+        self.pageIds = []
+        self.currentIdx = None
+        # Force ramps shown, if filtered by a feature (None: all of them)
+        self.ids = None
+        self.getFeatureIndex = None
+
+        self.canvas = FigureCanvas(Figure(figsize=(8, 8)))
+        self.axes = self.canvas.figure.add_axes([0, 0, 1, 1])
+        self.axes.set_axis_off()
+        self.axes.set_xlim(0, nGridColumns)
+        self.axes.set_ylim(0, nGridRows)
+        # All the thumbnails of the page are a single artist
+        self.lines = LineCollection([], linewidths=0.6)
+        self.axes.add_collection(self.lines)
+        self.labels = [self.axes.text(0, 0, '', fontsize=7, color='0.4', va='top')
+                       for i in range(self.pageSize)]
+        self.highlight = Rectangle((0, 0), 1, 1, fill=False, edgecolor='r', visible=False)
+        self.axes.add_patch(self.highlight)
+        for row in range(1, nGridRows):
+            self.axes.axhline(row, color='0.85', linewidth=0.5)
+        for column in range(1, nGridColumns):
+            self.axes.axvline(column, color='0.85', linewidth=0.5)
+        self.canvas.mpl_connect('button_press_event', self.onclick)
+
+        self.previousPushButton = QPushButton("Previous Page")
+        self.nextPushButton = QPushButton("Next Page")
+        self.pageLabel = QLabel("-")
+        self.previousPushButton.clicked.connect(lambda: self.showPage(self.page - 1))
+        self.nextPushButton.clicked.connect(lambda: self.showPage(self.page + 1))
+        buttons = QHBoxLayout()
+        buttons.addWidget(self.previousPushButton)
+        buttons.addWidget(self.pageLabel)
+        buttons.addWidget(self.nextPushButton)
+
+        self.featureComboBox = QComboBox()
+        self.featureComboBox.addItems(FEATURE_NAMES)
+        self.operatorComboBox = QComboBox()
+        self.operatorComboBox.addItems(FEATURE_OPERATORS)
+        self.operatorComboBox.setCurrentText('>')
+        self.valueLineEdit = QLineEdit("0")
+        self.filterPushButton = QPushButton("Filter")
+        self.clearFilterPushButton = QPushButton("All")
+        self.filterLabel = QLabel("")
+        self.filterPushButton.clicked.connect(self.applyFilter)
+        self.valueLineEdit.returnPressed.connect(self.applyFilter)
+        self.clearFilterPushButton.clicked.connect(self.clearFilter)
+        self.filterBar = QWidget()
+        filters = QHBoxLayout(self.filterBar)
+        filters.setContentsMargins(0, 0, 0, 0)
+        for widget in (self.featureComboBox, self.operatorComboBox, self.valueLineEdit,
+                       self.filterPushButton, self.clearFilterPushButton, self.filterLabel):
+            filters.addWidget(widget)
+        self.filterBar.setEnabled(False)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.filterBar)
+        layout.addWidget(self.canvas)
+        layout.addLayout(buttons)
+        self.setLayout(layout)
+
+    def rampIDs(self):
+        '''
+        Returns the numbers of the force ramps shown, in order
+        '''
+        return range(self.nRamps) if self.ids is None else self.ids
+
+    def numberOfPages(self):
+        return -(-len(self.rampIDs()) // self.pageSize)
+
+    def pageOf(self, idx):
+        '''
+        Returns the page with force ramp idx, or None if it is not shown
+        '''
+        if self.ids is None:
+            return idx // self.pageSize if 0 <= idx < self.nRamps else None
+        if idx not in self.ids:
+            return None
+        return self.ids.index(idx) // self.pageSize
+
+    def setSource(self, source, nRamps, direction='ForceForward', idx=None):
+        '''
+        Sets the source of the force ramps (an object with a method
+        getCurves(ids, direction), as the sources of CurvePrefetcher),
+        and shows the page of the current force ramp (idx, if given).
+        The filter is kept only if the source is the same.
+        '''
+        if source is not self.source:
+            self.ids = None
+            self.filterLabel.setText("")
+        self.source = source
+        self.nRamps = nRamps
+        self.direction = direction
+        if idx is not None:
+            self.currentIdx = idx
+        self.refresh()
+
+    def setFeatureIndex(self, getFeatureIndex):
+        '''
+        Enables filtering by features, with the CurveFeatureIndex returned
+        by getFeatureIndex() (called only when a filter is applied, as the
+        index might be expensive to build). None disables filtering.
+        '''
+        self.getFeatureIndex = getFeatureIndex
+        self.filterBar.setEnabled(getFeatureIndex is not None)
+
+    def applyFilter(self):
+        '''
+        Shows only the force ramps satisfying the condition of the filter
+        bar, sorted by its feature (in decreasing order for > and >=)
+        '''
+        if self.getFeatureIndex is None:
+            return
+        try:
+            value = float(self.valueLineEdit.text())
+        except ValueError:
+            self.filterLabel.setText("Invalid value")
+            return
+        featureIndex = self.getFeatureIndex()
+        if featureIndex is None or not featureIndex.hasFeatures():
+            self.filterLabel.setText("No features")
+            return
+        name = self.featureComboBox.currentText()
+        operator = self.operatorComboBox.currentText()
+        self.ids = featureIndex.findCurves([(name, operator, value)], orderBy=name,
+                                           descending=operator in ('>', '>='))
+        self.filterLabel.setText(f"{len(self.ids)} force ramps")
+        self.page = None
+        self.showPage(0)
+
+    def clearFilter(self):
+        self.ids = None
+        self.filterLabel.setText("")
+        self.refresh()
+
+    def refresh(self):
+        page = self.page
+        if self.currentIdx is not None and self.pageOf(self.currentIdx) is not None:
+            page = self.pageOf(self.currentIdx)
+        self.page = None
+        self.showPage(page or 0)
+
+    def cellOrigin(self, i):
+        '''
+        Returns the (x, y) of the bottom left corner of cell i of the page
+        (cell 0 is at the top left)
+        '''
+        row, column = divmod(i, self.nGridColumns)
+        return column, self.nGridRows - 1 - row
+
+    def showPage(self, page):
+        '''
+        Reads the force ramps of page with a single call to the source, and
+        draws them
+        '''
+        if self.source is None:
+            return
+        page = min(max(page, 0), max(self.numberOfPages() - 1, 0))
+        if page == self.page:
+            return
+        self.page = page
+        ids = list(self.rampIDs()[page*self.pageSize:(page+1)*self.pageSize])
+        self.pageIds = ids
+        curves = self.source.getCurves(ids, self.direction) if ids else []
+
+        # Each ramp is decimated to the resolution of a thumbnail and
+        # scaled into its cell, with a small margin
+        margin = 0.05
+        nBins = max(int(self.axes.bbox.width / self.nGridColumns), 20)
+        segments = []
+        for i, (xData, yData) in enumerate(curves):
+            x, y = CurveDecimator(xData, yData).decimate(nBins=nBins)
+            x0, y0 = self.cellOrigin(i)
+            segment = np.empty((x.shape[0], 2))
+            segment[:, 0] = x0 + margin + (1 - 2*margin) * normalize(x)
+            segment[:, 1] = y0 + margin + (1 - 2*margin) * normalize(y)
+            segments.append(segment)
+        self.lines.set_segments(segments)
+
+        for i, label in enumerate(self.labels):
+            x0, y0 = self.cellOrigin(i)
+            label.set_position((x0 + margin, y0 + 1 - margin))
+            label.set_text(str(ids[i]) if i < len(ids) else '')
+        self.pageLabel.setText(f"{page+1} / {self.numberOfPages()}")
+        self.updateHighlight()
+
+    def showCurve(self, idx):
+        '''
+        Shows the page of force ramp idx, with its thumbnail highlighted
+        '''
+        self.currentIdx = idx
+        page = self.pageOf(idx)
+        if page is not None and page != self.page:
+            self.showPage(page)
+        else:
+            self.updateHighlight()
+
+    def updateHighlight(self):
+        if self.currentIdx in self.pageIds:
+            self.highlight.set_xy(self.cellOrigin(self.pageIds.index(self.currentIdx)))
+            self.highlight.set_visible(True)
+        else:
+            self.highlight.set_visible(False)
+        self.canvas.draw_idle()
+
+    def onclick(self, event):
+        if event.inaxes is not self.axes or self.page is None:
+            return
+        column = int(event.xdata)
+        row = self.nGridRows - 1 - int(event.ydata)
+        if 0 <= column < self.nGridColumns and 0 <= row < self.nGridRows:
+            cell = row*self.nGridColumns + column
+            if cell < len(self.pageIds):
+                self.curveSelected.emit(self.pageIds[cell])
@@ -0,0 +1,207 @@
+###############################################################################
+# Imports
+###############################################################################
+import threading
+import numpy as np
+
+# Ceiling (bytes) of the memory used by suggestPoints on a block of force
+# ramps, and the bytes it needs per point of a force ramp: float64 copies
+# of the approach and retract, its steps and the int64 rank of the drops,
+# plus the boolean masks and the curves read from the source
+SUGGEST_MEMORY_LIMIT = 256 * 2**20
+SUGGEST_BYTES_PER_POINT = 8 * 7
+
+
+def suggestBlockSize(nRampPoints, maxMemory=SUGGEST_MEMORY_LIMIT):
+    '''
+    Returns the number of force ramps of nRampPoints points that
+    suggestPoints can take at once within maxMemory bytes (at least 1)
+    '''
+    return max(1, maxMemory // (max(nRampPoints, 1) * SUGGEST_BYTES_PER_POINT))
+
+###############################################################################
+# Detection of candidate points of force ramps (contact point, breakthrough
+# events of the indentation and adhesion pull-off), vectorized over a whole
+# block of force ramps at once
+###############################################################################
+
+
+def firstTrue(mask, default=-1):
+    '''
+    Returns, for each row of the boolean array mask, the index of its first
+    True element (default if there is none)
+    '''
+    first = mask.argmax(axis=1)
+    return np.where(mask.any(axis=1), first, default)
+
+
+def suggestPoints(forward, backward, baselineFraction=0.2, contactThreshold=5.,
+                  jumpThreshold=8., adhesionThreshold=5., maxBreakthroughs=3):
+    '''
+    Returns the candidate points of n force ramps, given by their
+    (n, nRampPoints) approach (forward) and retract (backward) curves, as
+    a dictionary of index arrays (-1 where there is no such point):
+        contact: (n,) index of the approach where the deflection leaves
+            the baseline for good: the sample after the last one within
+            contactThreshold times the noise of the baseline
+        breakthrough: (n, maxBreakthroughs) indices of the approach, after
+            the contact, just before a drop of the deflection larger than
+            jumpThreshold times the noise of the steps of the baseline
+        pullOff: (n,) index of the retract at its minimum, if it is more
+            than adhesionThreshold times the noise below the baseline
+    The baseline is the first baselineFraction of the approach.
+    '''
+    forward = np.atleast_2d(np.asarray(forward, dtype=np.float64))
+    backward = np.atleast_2d(np.asarray(backward, dtype=np.float64))
+    nRamps, nRampPoints = forward.shape
+    nBaseline = max(int(nRampPoints * baselineFraction), 3)
+    baseline = forward[:, :nBaseline]
+    offset = baseline.mean(axis=1, keepdims=True)
+    noise = np.maximum(baseline.std(axis=1, keepdims=True), np.finfo(np.float64).tiny)
+
+    # Last sample of the approach within the noise of the baseline
+    inBaseline = forward <= offset + contactThreshold*noise
+    lastInBaseline = nRampPoints - 1 - firstTrue(inBaseline[:, ::-1], default=nRampPoints)
+    contact = lastInBaseline + 1
+    contact[contact >= nRampPoints] = -1
+
+    # Drops of the deflection in contact (it should only grow there)
+    steps = np.diff(forward, axis=1)
+    stepNoise = np.maximum(np.diff(baseline, axis=1).std(axis=1, keepdims=True),
+                           np.finfo(np.float64).tiny)
+    drops = steps < -jumpThreshold*stepNoise
+    drops &= np.arange(nRampPoints - 1) >= np.where(contact < 0, nRampPoints, contact)[:, None]
+    # The first maxBreakthroughs drops of each force ramp (only the first
+    # step of consecutive drops is kept)
+    drops[:, 1:] &= ~drops[:, :-1]
+    rank = np.cumsum(drops, axis=1)
+    breakthrough = np.full((nRamps, maxBreakthroughs), -1)
+    for k in range(maxBreakthroughs):
+        breakthrough[:, k] = firstTrue(drops & (rank == k + 1))
+
+    minimum = backward.argmin(axis=1)
+    depth = offset[:, 0] - backward[np.arange(nRamps), minimum]
+    pullOff = np.where(depth > adhesionThreshold*noise[:, 0], minimum, -1)
+
+    return {'contact': contact, 'breakthrough': breakthrough, 'pullOff': pullOff}
+
+###############################################################################
+# A class named PointSuggester is declared, which computes the candidate
+# points of all the force ramps of a source in a background thread
+###############################################################################
+
+
+class PointSuggester():
+    '''
+    Candidate points for every force ramp of a curve source (see
+    classCurvePrefetcher), computed by suggestPoints in blocks of
+    blockSize force ramps by a background thread. By default the blocks
+    are as large as fit in maxMemory bytes (see suggestBlockSize), given
+    the length of force ramp startIdx. It starts with the block of force
+    ramp startIdx, so that suggestions are ready for the force ramps about
+    to be shown.
+    A block that fails is skipped (its force ramps get no suggestions),
+    and the rest are still computed.
+
+    Attributes:
+        nRamps, blockSize
+        contact, breakthrough, pullOff: the points (see suggestPoints) of
+            all the force ramps, -1 until computed
+        done: (nRamps,) boolean array, whether each force ramp is done
+        failed: (nRamps,) boolean array, whether each force ramp was in a
+            block that failed
+        lastError: last exception raised by a block, if any
+
+    Methods:
+        pointsFor(idx, direction='ForceForward')
+        isDone()
+        errorMessage()
+        close()
+    '''
+
+    def __init__(self, source, nRamps, startIdx=0, blockSize=None,
+                 maxMemory=SUGGEST_MEMORY_LIMIT, **parameters):
+        self.source = source
+        self.nRamps = nRamps
+        startIdx = min(max(startIdx, 0), max(nRamps - 1, 0))
+        if blockSize is None:
+            blockSize = suggestBlockSize(source.getRampLength(startIdx) if nRamps else 0, maxMemory)
+        self.blockSize = blockSize
+        self.parameters = parameters
+        maxBreakthroughs = parameters.get('maxBreakthroughs', 3)
+        self.contact = np.full(nRamps, -1)
+        self.breakthrough = np.full((nRamps, maxBreakthroughs), -1)
+        self.pullOff = np.full(nRamps, -1)
+        self.done = np.zeros(nRamps, dtype=bool)
+        self.failed = np.zeros(nRamps, dtype=bool)
+        self.lastError = None
+        self.stopped = threading.Event()
+        self.startBlock = startIdx // blockSize
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        # Executed in the background thread, with its own source
+        try:
+            source = self.source.open()
+        except Exception as error:
+            self.failed[:] = True
+            self.lastError = error
+            return
+        try:
+            nBlocks = -(-self.nRamps // self.blockSize)
+            for block in range(nBlocks):
+                if self.stopped.is_set():
+                    return
+                start = ((self.startBlock + block) % nBlocks) * self.blockSize
+                ids = list(range(start, min(start + self.blockSize, self.nRamps)))
+                try:
+                    forward = source.getForceRampArray(ids, 'ForceForward')
+                    backward = source.getForceRampArray(ids, 'ForceBackward')
+                    points = suggestPoints(forward, backward, **self.parameters)
+                except Exception as error:
+                    # The other blocks may still be fine
+                    self.failed[ids] = True
+                    self.lastError = error
+                    continue
+                self.contact[ids] = points['contact']
+                self.breakthrough[ids] = points['breakthrough']
+                self.pullOff[ids] = points['pullOff']
+                self.done[ids] = True
+        finally:
+            source.close()
+
+    def pointsFor(self, idx, direction='ForceForward'):
+        '''
+        Returns the sorted list of suggested indices of force ramp idx in
+        direction (contact and breakthroughs of the approach, pull-off of
+        the retract), or None if they have not been computed yet
+        '''
+        if not self.done[idx]:
+            return None
+        if direction == 'ForceForward':
+            points = [self.contact[idx]] + list(self.breakthrough[idx])
+        else:
+            points = [self.pullOff[idx]]
+        return sorted(int(point) for point in points if point >= 0)
+
+    def isDone(self):
+        return bool((self.done | self.failed).all())
+
+    def errorMessage(self):
+        '''
+        Returns a message with the number of force ramps whose suggestions
+        failed and the last error, or None if there was none
+        '''
+        error = self.lastError
+        if error is None:
+            return None
+        return (f"No candidate points for {int(self.failed.sum())} force ramps: "
+                f"{type(error).__name__}: {error}")
+
+    def close(self):
+        '''
+        Stops the background thread
+        '''
+        self.stopped.set()
+        self.thread.join()
@@ -0,0 +1,226 @@
+###############################################################################
+# Imports
+###############################################################################
+import os
+import json
+import numpy as np
+
+###############################################################################
+# Layout of a training dataset: a directory with the labelled force ramps of
+# any number of labelling sessions, packed one after the other in flat
+# binary files, and the metadata (metadata.json) with the number of curves,
+# samples and labels written so far. Force ramp i is
+#   x[curveOffsets[i]:curveOffsets[i+1]], y[curveOffsets[i]:curveOffsets[i+1]]
+# and its labels, indices of its samples,
+#   labels[labelOffsets[i]:labelOffsets[i+1]]
+# records[i] tells where it comes from: its source file and units (indices
+# into the lists sources and units of the metadata), its number in the
+# session (idx), its position in the map (NX, NY, -1 for series of force
+# ramps) and its direction (index into DIRECTIONS).
+# Files are only appended to, and metadata.json is replaced once the new
+# data is written: whatever is beyond the sizes in the metadata (e.g. an
+# append that did not finish) is ignored, and overwritten by the next one.
+###############################################################################
+
+DATASET_METADATA = 'metadata.json'
+
+DIRECTIONS = ('ForceForward', 'ForceBackward')
+
+CURVE_DTYPE = np.dtype('<f8')
+OFFSET_DTYPE = np.dtype('<i8')
+LABEL_DTYPE = np.dtype('<i8')
+RECORD_DTYPE = np.dtype([('source', '<i4'), ('units', '<i4'), ('idx', '<i8'),
+                         ('NX', '<i4'), ('NY', '<i4'), ('direction', 'i1')])
+
+# File and dtype of each array of the dataset, and the metadata key with
+# its length
+DATASET_ARRAYS = {
+    'x': ('x.bin', CURVE_DTYPE, 'nSamples'),
+    'y': ('y.bin', CURVE_DTYPE, 'nSamples'),
+    'curveOffsets': ('curveOffsets.bin', OFFSET_DTYPE, 'nOffsets'),
+    'labels': ('labels.bin', LABEL_DTYPE, 'nLabels'),
+    'labelOffsets': ('labelOffsets.bin', OFFSET_DTYPE, 'nOffsets'),
+    'records': ('records.bin', RECORD_DTYPE, 'nCurves'),
+}
+
+###############################################################################
+# A class named TrainingDataset is declared, which appends labelled force
+# ramps to a training dataset, and memory maps it to read them back
+###############################################################################
+
+
+class TrainingDataset():
+    '''
+    Labelled force ramps of a training dataset in directory (see the
+    layout above), created if it does not exist.
+    The arrays of the dataset are memory mapped (read-only) when it is
+    opened, so opening it takes the same time whatever its size, and a
+    force ramp is only read from disk when it is used.
+
+    Attributes:
+        directory, metadata
+        sources: source files of the force ramps
+        units: (xLabel, yLabel) of the force ramps
+        x, y, curveOffsets, labels, labelOffsets, records: the arrays of
+            the dataset
+
+    Methods:
+        __init__(directory)
+        __len__()
+        getCurve(i)
+        getLabels(i)
+        getRecord(i)
+        currentCurves()
+        appendCurves(curves)
+    '''
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        try:
+            with open(os.path.join(directory, DATASET_METADATA)) as file:
+                self.metadata = json.load(file)
+        except FileNotFoundError:
+            self.metadata = {'nCurves': 0, 'nSamples': 0, 'nLabels': 0,
+                             'sources': [], 'units': []}
+        self.openArrays()
+
+    def __len__(self):
+        return self.metadata['nCurves']
+
+    @property
+    def sources(self):
+        return self.metadata['sources']
+
+    @property
+    def units(self):
+        return [tuple(units) for units in self.metadata['units']]
+
+    def arrayLength(self, name):
+        lengthKey = DATASET_ARRAYS[name][2]
+        if lengthKey == 'nOffsets':
+            return self.metadata['nCurves'] + 1
+        return self.metadata[lengthKey]
+
+    def openArrays(self):
+        '''
+        Memory maps the arrays of the dataset, as long as the metadata says
+        '''
+        for name, (file_name, dtype, lengthKey) in DATASET_ARRAYS.items():
+            length = self.arrayLength(name)
+            if name.endswith('Offsets') and self.metadata['nCurves'] == 0:
+                array = np.zeros(1, dtype=dtype)
+            elif length == 0:
+                array = np.empty(0, dtype=dtype)
+            else:
+                array = np.memmap(os.path.join(self.directory, file_name), dtype=dtype,
+                                  mode='r', shape=(length,))
+            setattr(self, name, array)
+
+    def getCurve(self, i):
+        '''
+        Returns the (xData, yData) of force ramp i
+        '''
+        start, stop = self.curveOffsets[i], self.curveOffsets[i+1]
+        return self.x[start:stop], self.y[start:stop]
+
+    def getLabels(self, i):
+        '''
+        Returns the labels (indices of samples) of force ramp i
+        '''
+        return self.labels[self.labelOffsets[i]:self.labelOffsets[i+1]]
+
+    def getRecord(self, i):
+        '''
+        Returns a dictionary with where force ramp i comes from: source,
+        xLabel, yLabel, idx, NX, NY and direction
+        '''
+        record = self.records[i]
+        xLabel, yLabel = self.metadata['units'][record['units']]
+        return {'source': self.metadata['sources'][record['source']],
+                'xLabel': xLabel,
+                'yLabel': yLabel,
+                'idx': int(record['idx']),
+                'NX': int(record['NX']),
+                'NY': int(record['NY']),
+                'direction': DIRECTIONS[record['direction']]}
+
+    def currentCurves(self):
+        '''
+        Returns the numbers of the force ramps that are the last ones
+        appended for their source, idx and direction: a force ramp labelled
+        again (in the same session or a later one) replaces the former one
+        '''
+        records = np.asarray(self.records)
+        keys = np.stack((records['source'], records['idx'], records['direction']), axis=1)
+        # np.unique keeps the first occurrence: look from the end
+        _, last = np.unique(keys[::-1], axis=0, return_index=True)
+        return np.sort(len(self) - 1 - last)
+
+    def appendCurves(self, curves):
+        '''
+        Appends curves, an iterable of dictionaries with the keys xData,
+        yData, labels (indices of samples), source (file name), xLabel,
+        yLabel, idx, NX, NY and direction, to the dataset. The data are
+        written first, and the metadata last, so the dataset is never left
+        half appended. Returns the number of curves appended.
+        '''
+        metadata = json.loads(json.dumps(self.metadata))
+        sourceIDs = {source: k for k, source in enumerate(metadata['sources'])}
+        unitsIDs = {tuple(units): k for k, units in enumerate(metadata['units'])}
+        files = {}
+        try:
+            for name, (file_name, dtype, lengthKey) in DATASET_ARRAYS.items():
+                path = os.path.join(self.directory, file_name)
+                files[name] = open(path, 'r+b' if os.path.exists(path) else 'w+b')
+                # Whatever an unfinished append left is overwritten
+                length = self.arrayLength(name) if metadata['nCurves'] else 0
+                files[name].truncate(length * dtype.itemsize)
+                files[name].seek(0, os.SEEK_END)
+                if name.endswith('Offsets') and length == 0:
+                    files[name].write(np.zeros(1, dtype=dtype).tobytes())
+
+            nAppended = 0
+            for curve in curves:
+                xData = np.ascontiguousarray(curve['xData'], dtype=CURVE_DTYPE)
+                yData = np.ascontiguousarray(curve['yData'], dtype=CURVE_DTYPE)
+                labels = np.ascontiguousarray(curve['labels'], dtype=LABEL_DTYPE).ravel()
+                if xData.shape != yData.shape or xData.ndim != 1:
+                    raise ValueError(f"xData and yData of curve {curve['idx']} must be "
+                                     "1-D arrays of the same length")
+                if labels.size and (labels.min() < 0 or labels.max() >= yData.shape[0]):
+                    raise ValueError(f"Labels of curve {curve['idx']} out of its samples")
+                source = os.path.abspath(curve['source'])
+                units = (curve['xLabel'], curve['yLabel'])
+                if source not in sourceIDs:
+                    sourceIDs[source] = len(metadata['sources'])
+                    metadata['sources'].append(source)
+                if units not in unitsIDs:
+                    unitsIDs[units] = len(metadata['units'])
+                    metadata['units'].append(list(units))
+
+                files['x'].write(xData.tobytes())
+                files['y'].write(yData.tobytes())
+                files['labels'].write(labels.tobytes())
+                metadata['nSamples'] += xData.shape[0]
+                metadata['nLabels'] += labels.shape[0]
+                metadata['nCurves'] += 1
+                files['curveOffsets'].write(np.array([metadata['nSamples']], OFFSET_DTYPE).tobytes())
+                files['labelOffsets'].write(np.array([metadata['nLabels']], OFFSET_DTYPE).tobytes())
+                record = np.array([(sourceIDs[source], unitsIDs[units], curve['idx'],
+                                    curve['NX'], curve['NY'], DIRECTIONS.index(curve['direction']))],
+                                  dtype=RECORD_DTYPE)
+                files['records'].write(record.tobytes())
+                nAppended += 1
+        finally:
+            for file in files.values():
+                file.close()
+
+        temporary = os.path.join(self.directory, DATASET_METADATA + '.partial')
+        with open(temporary, 'w') as file:
+            json.dump(metadata, file, indent=1)
+        os.replace(temporary, os.path.join(self.directory, DATASET_METADATA))
+        self.metadata = metadata
+        self.openArrays()
+
+        return nAppended
@@ -0,0 +1,93 @@
+###############################################################################
+# Imports
+###############################################################################
+import numpy as np
+
+###############################################################################
+# Conversion of force ramps to physical units: deflection (V) to force (nN)
+# and Z piezo position (nm) to tip-sample separation (nm)
+###############################################################################
+
+# Calibration parameters, as in the columns of ExperimentalParametersTable:
+#   photodiodeSensitivity: deflection sensitivity, in nm/V
+#   forceConstant: spring constant of the cantilever, in N/m (= nN/nm)
+#   probeRadius: radius of the tip, in nm
+CALIBRATION_PARAMETERS = ('photodiodeSensitivity', 'forceConstant', 'probeRadius')
+
+# Header parameters of Nanoscope files with the calibration of the
+# cantilever, used as defaults at ingest when they are present
+CALIBRATION_HEADER_PARAMETERS = {'photodiodeSensitivity': 'Sens. DeflSens',
+                                 'forceConstant': 'Spring Constant'}
+
+
+def calibrationFromHeader(header):
+    '''
+    Returns a dictionary with the calibration parameters found in header
+    (a NanoscopeHeader)
+    '''
+    calibration = {}
+    for name, parameterName in CALIBRATION_HEADER_PARAMETERS.items():
+        parameter = header.getParameter(parameterName)
+        if parameter is not None and parameter.numbers:
+            calibration[name] = parameter.numbers[0]
+    return calibration
+
+###############################################################################
+# A class named UnitConverter is declared, which converts force ramps with
+# the calibration of one experiment
+###############################################################################
+
+
+class UnitConverter():
+    '''
+    Converts force ramps (deflection in V against Z in nm) to force (nN)
+    against tip-sample separation (nm), with broadcasting, so that any
+    number of them (a single ramp, a row of the map or a whole volume
+    with shape (..., nRampPoints)) is converted in a single pass:
+        deflection (nm) = deflection (V) * photodiodeSensitivity
+        force (nN) = deflection (nm) * forceConstant
+        separation (nm) = rampLength - Z + deflection (nm)
+    i.e. the separation is measured from the position of the tip at the
+    end of the ramp (maximum extension of the piezo) without deflection.
+
+    Attributes:
+        photodiodeSensitivity, forceConstant, probeRadius, rampLength
+
+    Methods:
+        force(deflection)
+        separation(z, deflection)
+        convert(z, deflection)
+    '''
+
+    def __init__(self, photodiodeSensitivity=1., forceConstant=1., probeRadius=1., rampLength=0.):
+        self.photodiodeSensitivity = photodiodeSensitivity
+        self.forceConstant = forceConstant
+        self.probeRadius = probeRadius
+        self.rampLength = rampLength
+
+    def __repr__(self):
+        return (f"UnitConverter(photodiodeSensitivity={self.photodiodeSensitivity}, "
+                f"forceConstant={self.forceConstant}, probeRadius={self.probeRadius}, "
+                f"rampLength={self.rampLength})")
+
+    def force(self, deflection):
+        '''
+        Returns the force (nN) for deflection (V), of any shape
+        '''
+        return np.multiply(deflection, self.photodiodeSensitivity * self.forceConstant)
+
+    def separation(self, z, deflection):
+        '''
+        Returns the tip-sample separation (nm) for z (nm, broadcastable to
+        the shape of deflection) and deflection (V)
+        '''
+        separation = np.multiply(deflection, self.photodiodeSensitivity)
+        separation += self.rampLength
+        separation -= z
+        return separation
+
+    def convert(self, z, deflection):
+        '''
+        Returns (separation, force) for z and deflection
+        '''
+        return self.separation(z, deflection), self.force(deflection)
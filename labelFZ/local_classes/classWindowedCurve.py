@@ -0,0 +1,67 @@
+###############################################################################
+# Imports
+###############################################################################
+import numpy as np
+
+###############################################################################
+# A class named WindowedCurve is declared, a curve read from its store only a
+# window of samples at a time
+###############################################################################
+
+
+class WindowedCurve():
+    '''
+    The y data of a force ramp too long to be read whole every time it is
+    shown. Slicing it (curve[start:stop]) reads just the samples of that
+    window with readWindow(start, stop), and indexing it with integers
+    reads just those samples. It is turned into a full numpy array (e.g.
+    np.asarray(curve)) only when needed, e.g. to export it.
+
+    Attributes:
+        readWindow: function (start, stop) returning the samples
+            [start, stop) of the curve, as a numpy array
+        shape, dtype, ndim, size
+
+    Methods:
+        __init__(readWindow, length, dtype=np.float64)
+        __len__()
+        __getitem__(key)
+        __array__(dtype=None, copy=None)
+    '''
+
+    ndim = 1
+
+    def __init__(self, readWindow, length, dtype=np.float64):
+        self.readWindow = readWindow
+        self.shape = (int(length),)
+        self.size = self.shape[0]
+        self.dtype = np.dtype(dtype)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            samples = range(*key.indices(self.size))
+            if not samples:
+                return np.empty(0, dtype=self.dtype)
+            start, stop = min(samples[0], samples[-1]), max(samples[0], samples[-1]) + 1
+            window = np.asarray(self.readWindow(start, stop), dtype=self.dtype)
+            return window[samples.start-start::samples.step][:len(samples)]
+        if np.ndim(key) == 0:
+            i = int(key)
+            if not -self.size <= i < self.size:
+                raise IndexError(f"Sample {i} out of a curve of {self.size} samples")
+            i %= self.size
+            return np.asarray(self.readWindow(i, i+1), dtype=self.dtype)[0]
+        # A few samples (e.g. the labelled points), each read alone
+        indices = np.asarray(key)
+        if indices.dtype == bool or not np.issubdtype(indices.dtype, np.integer):
+            raise IndexError("A WindowedCurve is indexed with slices or integers only")
+        values = np.empty(indices.shape, dtype=self.dtype)
+        for position, i in np.ndenumerate(indices):
+            values[position] = self[i]
+        return values
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self.readWindow(0, self.size), dtype=dtype or self.dtype)
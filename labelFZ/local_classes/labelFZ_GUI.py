@@ -1,4 +1,4 @@
-from PyQt5.QtWidgets import QMainWindow, QApplication, QFileDialog
+from PyQt5.QtWidgets import QMainWindow, QApplication, QFileDialog, QProgressBar, QPushButton, QActionGroup
 from PyQt5 import QtCore
 import matplotlib.pyplot as plt
 from ..qt5_ui_files.LabelFZ import *
@@ -6,6 +6,17 @@ from matplotlib.backends.backend_qt5agg import (NavigationToolbar2QT as Navigati
 import numpy as np
 from .classNanoscopeForceVolume import *
 from .classNanoscopeForceRamp import *
+from .classForceVolumeSession import *
+from .classForceRampSeries import *
+from .classIngestWorker import *
+from .classFeatureIndexWorker import *
+from .classCurvePrefetcher import *
+from .classOverviewGrid import *
+from .classMapView import *
+from .classPointSuggester import *
+from .classUnitConversion import *
+from .classForceVolumeStores import *
+from .classTrainingDataset import *
 import os
 
 class labelFZ_GUI(QMainWindow):
@@ -19,11 +30,30 @@ class labelFZ_GUI(QMainWindow):
         self.addToolBar(MplToolbar)
 
         self.ui.closePushButton.clicked.connect(QApplication.instance().quit)
+        # Labels not exported yet are exported while the force ramps can
+        # still be read
+        QApplication.instance().aboutToQuit.connect(self.closeLabels)
+        QApplication.instance().aboutToQuit.connect(self.stopIngest)
+        QApplication.instance().aboutToQuit.connect(self.stopFeatureIndexWorker)
+        QApplication.instance().aboutToQuit.connect(self.stopPrefetcher)
+        QApplication.instance().aboutToQuit.connect(self.stopSuggester)
+
+        # Progress of the ingest of force volume files, and button to
+        # cancel it, shown in the status bar only while ingesting
+        self.ingestProgressBar = QProgressBar()
+        self.ingestProgressBar.setMaximumWidth(200)
+        self.cancelIngestPushButton = QPushButton("Cancel")
+        self.cancelIngestPushButton.clicked.connect(self.cancelIngest)
+        self.ui.statusbar.addPermanentWidget(self.ingestProgressBar)
+        self.ui.statusbar.addPermanentWidget(self.cancelIngestPushButton)
+        self.ingestProgressBar.hide()
+        self.cancelIngestPushButton.hide()
 
         
         self.ui.exportPushButton.clicked.connect(self.exportData)
         
         self.ui.actionSetExportDir.triggered.connect(self.selectExportDir)
+        self.ui.actionExportDataset.triggered.connect(self.exportDataset)
         self.ui.getPointPushButton.clicked.connect(self.get_point)
 
         self.ui.nextPushButton.clicked.connect(self.showNextForceRamp)
@@ -31,6 +61,14 @@ class labelFZ_GUI(QMainWindow):
 
         self.ui.actionLoadForceVolume.triggered.connect(self.openForceVolume)
         self.ui.actionLoadForceRamps.triggered.connect(self.openForceRamps)
+        self.ui.actionOverviewGrid.triggered.connect(self.showOverviewGrid)
+        self.ui.actionMapView.triggered.connect(self.showMapView)
+        self.ui.actionPhysicalUnits.toggled.connect(self.setPhysicalUnits)
+        # Storage of the force volumes opened from now on (one of them)
+        self.storageActionGroup = QActionGroup(self)
+        for action in (self.ui.actionStorageSQLite, self.ui.actionStorageMemoryMap,
+                       self.ui.actionStorageChunked):
+            self.storageActionGroup.addAction(action)
 
         self.ui.ForwardDirectionRadioButton.toggled.connect(self.changeFZDirection)
         self.ui.BackwardDirectionRadioButton.toggled.connect(self.changeFZDirection)
@@ -43,121 +81,472 @@ class labelFZ_GUI(QMainWindow):
 
         self.xPoint = []
         self.xClass = []
+        # Points labelled in the force ramps of the file(s) open, by
+        # (idx, direction), and those of them already exported to the
+        # training dataset
+        self.labels = {}
+        self.exportedLabels = {}
+        self.exportDirectory = None
 
         self.fzDirection = 'ForceForward'
+        self.fzObjectType = None
+        self.curveSource = None
+        self.fvSession = None
+        self.ingestWorker = None
+        self.prefetcher = None
+        self.suggester = None
+        self.suggesterMessage = None
+        self.overviewGrid = None
+        self.mapView = None
+        self.seriesFeatureIndex = None
+        self.featureIndexWorker = None
         self.update_graph()        
 
         self.show()
 
     def openForceVolume(self):
 
-        self.fzObject = NanoscopeForceVolumeObject()
-        self.fzObjectType = "Force Volume"
-        self.database_name = 'temporalDataBase.db'
         caption = "Open Nanoscope9 Force Volume File"
         directory = os.getcwd()
         filter_mask = "All Files (*)"
         filenames = QFileDialog.getOpenFileNames(self, caption, directory, filter_mask)[0]
-        # Initially, and empty list that will contain the name of the
-        # loaded files is created
+        if not filenames:
+            return
+        self.closeLabels()
+        self.xPoint = []
+        self.ui.label.setText(str(self.xPoint))
+        # Only one volume is ingested at a time
+        self.stopIngest()
+        self.stopFeatureIndexWorker()
+        self.fzObject = NanoscopeForceVolumeObject()
+        self.fzObjectType = "Force Volume"
         self.nameFile = filenames[0]
-        self.fzObject.fvToSQL(self.nameFile, self.database_name)
-        self.max_idx = self.fzObject.getNumberForceRamps(self.database_name)-1
-        self.x, self.y = self.fzObject.getForceRampFromID(self.database_name, self.idx+1, direction=self.fzDirection, xDimensions=True)
+        backend = self.storageBackend()
+        if backend == 'chunked':
+            self.database_name = chunkedStoreDirectory(self.nameFile)
+        else:
+            self.database_name = 'temporalDataBase.db'
+        if self.fvSession is not None:
+            self.fvSession.close()
+            self.fvSession = None
+        # Until the file is in the database, force ramps are read straight
+        # from the (memory mapped) file, so the first one is shown right away
+        self.fzObject.openMemoryMap(self.nameFile)
+        self.idx = 0
+        self.max_idx = (self.fzObject.fvParameters['numberOfMapRows'][0] *
+                        self.fzObject.fvParameters['numberOfMapColumns'][0]) - 1
+        self.startPrefetcher(MapCurveSource(self.fzObject))
+        self.loadForceRamp()
         self.ui.idxLabel.setText(str(self.idx))
         self.update_graph()
+        if backend == 'memmap':
+            # Force ramps are only ever read from the file
+            self.ui.statusbar.showMessage(f"{self.nameFile} read from the file, without ingest", 5000)
+            return
+        # Files already in the store (and unchanged) are not re-ingested
+        curveEncoding = 'deltazlib' if self.ui.actionCompressCurves.isChecked() else 'raw'
+        self.ingestWorker = IngestWorker(self.nameFile, self.database_name, self, backend,
+                                         curveEncoding)
+        self.ingestWorker.progress.connect(self.onIngestProgress)
+        self.ingestWorker.ingested.connect(self.onIngested)
+        self.ingestWorker.cancelled.connect(self.onIngestCancelled)
+        self.ingestWorker.failed.connect(self.onIngestFailed)
+        self.ingestProgressBar.setValue(0)
+        self.ingestProgressBar.show()
+        self.cancelIngestPushButton.show()
+        self.ui.statusbar.showMessage(f"Ingesting {self.nameFile}...")
+        self.ingestWorker.start()
+
+    def onIngestProgress(self, rowsDone, nRows):
+        if self.sender() is not self.ingestWorker:
+            return
+        self.ingestProgressBar.setMaximum(nRows)
+        self.ingestProgressBar.setValue(rowsDone)
+
+    def onIngested(self, experimentID):
+        if self.sender() is not self.ingestWorker:
+            return
+        self.hideIngestProgress()
+        self.experimentID = experimentID
+        # The store (for a database, a single connection to it) is kept
+        # open while navigating the force ramps of the volume
+        self.fvSession = openStore(self.database_name, self.experimentID)
+        self.startPrefetcher(SessionCurveSource(self.fvSession), restartSuggester=False)
+        self.ui.statusbar.showMessage(f"{self.nameFile} ready in {self.database_name}", 5000)
+
+    def onIngestCancelled(self):
+        if self.sender() is not self.ingestWorker:
+            return
+        self.hideIngestProgress()
+        self.ui.statusbar.showMessage("Ingest cancelled: force ramps are read from the file")
+
+    def onIngestFailed(self, message):
+        if self.sender() is not self.ingestWorker:
+            return
+        self.hideIngestProgress()
+        self.ui.statusbar.showMessage(f"Ingest failed ({message}): force ramps are read from the file")
+
+    def storageBackend(self):
+        '''
+        Returns the storage backend selected for force volumes (see
+        classForceVolumeStores)
+        '''
+        if self.ui.actionStorageMemoryMap.isChecked():
+            return 'memmap'
+        if self.ui.actionStorageChunked.isChecked():
+            return 'chunked'
+        return 'sqlite'
+
+    def hideIngestProgress(self):
+        self.ingestProgressBar.hide()
+        self.cancelIngestPushButton.hide()
+
+    def cancelIngest(self):
+        if self.ingestWorker is not None:
+            self.ingestWorker.cancel()
+
+    def stopIngest(self):
+        '''
+        Cancels the ingest running in the background (if any), and waits
+        for its thread to finish
+        '''
+        if self.ingestWorker is not None:
+            self.ingestWorker.cancel()
+            self.ingestWorker.wait()
+            self.ingestWorker = None
+            self.hideIngestProgress()
+
+    def closeEvent(self, event):
+        self.closeLabels()
+        self.stopIngest()
+        self.stopFeatureIndexWorker()
+        self.stopPrefetcher()
+        self.stopSuggester()
+        if self.overviewGrid is not None:
+            self.overviewGrid.close()
+        if self.mapView is not None:
+            self.mapView.close()
+        super().closeEvent(event)
+
+    def startPrefetcher(self, source, restartSuggester=True):
+        '''
+        Replaces the prefetcher of force ramps by a new one, on source
+        (and the point suggester, unless restartSuggester is False, as
+        when the same force ramps move from the file to the database)
+        '''
+        self.stopPrefetcher()
+        self.curveSource = source
+        self.prefetcher = CurvePrefetcher(self.displaySource(source), self.max_idx+1)
+        # Candidate points of all the force ramps are computed in the
+        # background too, starting from the current one
+        if restartSuggester or self.suggester is None:
+            self.stopSuggester()
+            self.suggester = PointSuggester(source, self.max_idx+1, startIdx=self.idx)
+        self.updateOverviewGrid()
+        self.updateMapView()
+
+    def displaySource(self, source):
+        '''
+        Returns the source of the force ramps shown: source itself, or
+        source in physical units (force against tip-sample separation),
+        with the calibration of the force volume, if they are selected
+        '''
+        self.updateAxisLabels()
+        if not self.ui.actionPhysicalUnits.isChecked() or self.fzObjectType != "Force Volume":
+            return source
+        if self.fvSession is not None:
+            return PhysicalCurveSource(source, self.fvSession.converter, self.fvSession.xDimensions)
+        nRampPoints = self.fzObject.fvParameters['rampPoints'][0]
+        converter = self.fzObject.getConverterFromMap()
+        return PhysicalCurveSource(source, converter,
+                                   np.linspace(0., converter.rampLength, nRampPoints))
+
+    def setPhysicalUnits(self, checked):
+        '''
+        Shows the force ramps in physical units (checked) or as read
+        '''
+        if checked and self.fzObjectType != "Force Volume":
+            self.ui.statusbar.showMessage("Physical units are only available for force volumes", 5000)
+            self.ui.actionPhysicalUnits.setChecked(False)
+            return
+        if self.curveSource is None:
+            self.updateAxisLabels()
+            return
+        # The suggested points are indices, which do not depend on units
+        self.startPrefetcher(self.curveSource, restartSuggester=False)
+        self.loadForceRamp()
+        self.update_graph()
+
+    def updateAxisLabels(self):
+        axes = self.ui.MplWidget.canvas.axes
+        if self.fzObjectType != "Force Volume":
+            axes.set_xlabel('Sample')
+            axes.set_ylabel('Deflection')
+        elif self.ui.actionPhysicalUnits.isChecked():
+            axes.set_xlabel('Separation (nm)')
+            axes.set_ylabel('Force (nN)')
+        else:
+            axes.set_xlabel('Z (nm)')
+            axes.set_ylabel('Deflection (V)')
+
+    def stopPrefetcher(self):
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+            self.prefetcher = None
+
+    def stopSuggester(self):
+        if self.suggester is not None:
+            self.suggester.close()
+            self.suggester = None
+
+    def suggestedPoints(self):
+        '''
+        Returns the list of candidate points of the force ramp shown, or
+        an empty list if they are not available (yet)
+        '''
+        if self.suggester is None:
+            return []
+        self.reportSuggesterError()
+        return self.suggester.pointsFor(self.idx, self.fzDirection) or []
+
+    def reportSuggesterError(self):
+        '''
+        Shows in the status bar the errors of the point suggester, once
+        for each new error
+        '''
+        message = self.suggester.errorMessage()
+        if message is not None and message != self.suggesterMessage:
+            self.suggesterMessage = message
+            self.ui.statusbar.showMessage(message, 10000)
+
+    def labelledPoints(self):
+        '''
+        Returns the points of the force ramp shown: the ones labelled in
+        it, if any, or else the candidate ones
+        '''
+        points = self.labels.get((self.idx, self.fzDirection))
+        return list(points) if points is not None else self.suggestedPoints()
+
+    def recordLabels(self):
+        '''
+        Keeps the labelled points of the force ramp shown, to be exported
+        to the training dataset
+        '''
+        self.labels[(self.idx, self.fzDirection)] = [int(point) for point in self.xPoint]
+
+    def loadForceRamp(self):
+        '''
+        Sets self.x and self.y to the force ramp self.idx, in the
+        direction self.fzDirection. The neighbours of the force ramp are
+        then prefetched in the background. Very long force ramps are not
+        read whole: self.y is then a WindowedCurve, and zooming into them
+        reads only the samples in the view.
+        '''
+        self.x, self.y = self.prefetcher.getForceRamp(self.idx, self.fzDirection)
+        self.ui.idxLabel.setToolTip(f"Cache hit rate: {self.prefetcher.hitRate():.0%}")
 
     def changeFZDirection(self):
         if self.ui.ForwardDirectionRadioButton.isChecked()==True:
             self.fzDirection = 'ForceForward'
-            if self.fzObjectType == "Force Volume":
-                self.x, self.y = self.fzObject.getForceRampFromID(self.database_name, self.idx+1, direction=self.fzDirection, xDimensions=True)
-            else:
-                self.y = self.fzObject[self.idx].Ramp[0]['RawY'][0]
         else:
             self.fzDirection = 'ForceBackward'
-            if self.fzObjectType == "Force Volume":
-                self.x, self.y = self.fzObject.getForceRampFromID(self.database_name, self.idx+1, direction=self.fzDirection, xDimensions=True)
-            else:
-                self.y = self.fzObject[self.idx].Ramp[0]['RawY'][1]
+        self.xPoint = self.labelledPoints()
+        self.ui.label.setText(str(self.xPoint))
+        self.loadForceRamp()
         self.update_graph()
+        self.updateOverviewGrid()
 
     def openForceRamps(self):
-        self.fzObjectType = "Force Ramps"
         caption = "Open File"
         directory = os.getcwd()
         filter_mask = "All Files (*)"
-        self.filenames = QFileDialog.getOpenFileNames(self, caption, directory, filter_mask)[0]
-        self.fzObject = []
+        filenames = QFileDialog.getOpenFileNames(self, caption, directory, filter_mask)[0]
+        if not filenames:
+            return
+        self.closeLabels()
+        self.xPoint = []
+        self.ui.label.setText(str(self.xPoint))
+        self.fzObjectType = "Force Ramps"
+        self.filenames = filenames
+        # The force volume being ingested (if any) is no longer shown
+        self.stopIngest()
+        self.stopFeatureIndexWorker()
+        # Files are only read when their force ramp is shown, and just a
+        # bounded number of them is kept in memory
+        self.fzObject = ForceRampSeries(self.filenames)
+        self.seriesFeatureIndex = None
         self.max_idx = len(self.filenames)-1
-
-        for i in range(len(self.filenames)):
-            self.fzObject.append(NanoscopeForceRamp(self.filenames[i]))
-            self.fzObject[i].readHeader()
-            self.fzObject[i].readRamps()
-        if self.fzDirection == 'ForceForward':
-            self.y = self.fzObject[self.idx].Ramp[0]['RawY'][0]
-        else:
-            self.y = self.fzObject[self.idx].Ramp[0]['RawY'][1]
-        self.x = np.arange(self.y.shape[0])
+        self.idx = 0
+        self.startPrefetcher(SeriesCurveSource(self.fzObject))
+        self.loadForceRamp()
         self.ui.idxLabel.setText(str(self.idx))
         self.update_graph()
 
     def showNextForceRamp(self):
 
         if self.idx < self.max_idx:
-            self.xPoint = []
-            self.xClass = []
-            self.idx += 1
-            self.ui.idxLabel.setText(str(self.idx))
-            if self.fzObjectType == "Force Volume":
-                self.x, self.y = self.fzObject.getForceRampFromID(self.database_name, self.idx+1, direction=self.fzDirection, xDimensions=True)
-            elif self.fzObjectType == "Force Ramps":
-                if self.fzDirection == 'ForceForward':
-                    self.y = self.fzObject[self.idx].Ramp[0]['RawY'][0]
-                else:
-                    self.y = self.fzObject[self.idx].Ramp[0]['RawY'][1]
-                self.x = np.arange(self.y.shape[0])
-            self.xpoint = []
-            self.ui.label.setText(str(self.xPoint))
-            self.update_graph()
+            self.goToForceRamp(self.idx + 1)
 
     def showPreviousForceRamp(self):
 
         if self.idx > 0:
-            self.xPoint = []
-            self.xClass = []
-            self.idx -= 1
-            self.ui.idxLabel.setText(str(self.idx))
-            if self.fzObjectType == "Force Volume":
-                self.x, self.y = self.fzObject.getForceRampFromID(self.database_name, self.idx+1, xDimensions=True)
-            elif self.fzObjectType == "Force Ramps":
-                if self.fzDirection == 'ForceForward':
-                    self.y = self.fzObject[self.idx].Ramp[0]['RawY'][0]
-                else:
-                    self.y = self.fzObject[self.idx].Ramp[0]['RawY'][1]
-                self.x = np.arange(self.y.shape[0])
-            self.xpoint = []
-            self.ui.label.setText(str(self.xPoint))
-            self.update_graph()
+            self.goToForceRamp(self.idx - 1)
+
+    def goToForceRamp(self, idx):
+        '''
+        Shows force ramp idx, with the points labelled in it or else its
+        suggested points (if any) as labelled points, to be confirmed or
+        corrected
+        '''
+        self.xClass = []
+        self.idx = idx
+        self.xPoint = self.labelledPoints()
+        self.ui.idxLabel.setText(str(self.idx))
+        self.loadForceRamp()
+        self.ui.label.setText(str(self.xPoint))
+        self.update_graph()
+        if self.overviewGrid is not None and self.overviewGrid.isVisible():
+            self.overviewGrid.showCurve(self.idx)
+        if self.mapView is not None and self.mapView.isVisible():
+            self.mapView.showCurve(*self.mapPosition(self.idx))
+
+    def showOverviewGrid(self):
+        '''
+        Opens the window with thumbnails of a page of force ramps around
+        the current one
+        '''
+        if self.overviewGrid is None:
+            self.overviewGrid = OverviewGrid()
+            self.overviewGrid.curveSelected.connect(self.goToForceRamp)
+        self.overviewGrid.show()
+        self.overviewGrid.raise_()
+        self.updateOverviewGrid()
+
+    def updateOverviewGrid(self):
+        '''
+        Shows the source and direction of the current force ramps in the
+        overview grid, if open
+        '''
+        if self.overviewGrid is None or not self.overviewGrid.isVisible() or self.prefetcher is None:
+            return
+        self.overviewGrid.setSource(self.prefetcher.source, self.max_idx+1, self.fzDirection, self.idx)
+        self.overviewGrid.setFeatureIndex(self.featureIndexGetter())
+
+    def featureIndexGetter(self):
+        '''
+        Returns a function returning the CurveFeatureIndex of the current
+        force ramps, or None if they have none (yet)
+        '''
+        if self.fzObjectType == "Force Volume":
+            if self.fvSession is None:
+                return None
+            return lambda: self.fvSession.features
+        if self.fzObjectType == "Force Ramps":
+            if self.seriesFeatureIndex is None:
+                self.startFeatureIndexWorker()
+                return None
+            return lambda: self.seriesFeatureIndex
+        return None
+
+    def startFeatureIndexWorker(self):
+        '''
+        Starts building, in the background, the CurveFeatureIndex of the
+        series of force ramps (reading all its files), unless it is
+        already being built. Filtering stays disabled until it is ready.
+        '''
+        if self.featureIndexWorker is not None:
+            return
+        self.featureIndexWorker = FeatureIndexWorker(self.fzObject, self)
+        self.featureIndexWorker.built.connect(self.onFeatureIndexBuilt)
+        self.featureIndexWorker.failed.connect(self.onFeatureIndexFailed)
+        self.ui.statusbar.showMessage("Computing the features of the force ramps...")
+        self.featureIndexWorker.start()
+
+    def onFeatureIndexBuilt(self, featureIndex):
+        if self.sender() is not self.featureIndexWorker:
+            return
+        self.seriesFeatureIndex = featureIndex
+        self.ui.statusbar.showMessage("Features of the force ramps ready", 5000)
+        self.updateOverviewGrid()
+
+    def onFeatureIndexFailed(self, message):
+        # The worker is kept, so that the index is not built again for
+        # this series, and filtering stays disabled
+        if self.sender() is not self.featureIndexWorker:
+            return
+        self.ui.statusbar.showMessage(f"Features of the force ramps not available: {message}")
+
+    def stopFeatureIndexWorker(self):
+        '''
+        Cancels the building of the feature index (if any), and waits for
+        its thread to finish
+        '''
+        if self.featureIndexWorker is not None:
+            self.featureIndexWorker.cancel()
+            self.featureIndexWorker.wait()
+            self.featureIndexWorker = None
+
+    def mapPosition(self, idx):
+        '''
+        Returns the (NX, NY) of force ramp idx of the force volume
+        '''
+        return divmod(idx, self.fzObject.fvParameters['numberOfMapColumns'][0])
+
+    def showMapView(self):
+        '''
+        Opens the window with the map of the force volume
+        '''
+        if self.fzObjectType != "Force Volume":
+            self.ui.statusbar.showMessage("Maps are only available for force volumes", 5000)
+            return
+        if self.mapView is None:
+            self.mapView = MapView()
+            self.mapView.pixelSelected.connect(self.goToMapPosition)
+        self.mapView.show()
+        self.mapView.raise_()
+        self.updateMapView()
+
+    def updateMapView(self):
+        '''
+        Shows the maps of the current force volume in the map view, if open
+        '''
+        if self.mapView is None or not self.mapView.isVisible() or self.prefetcher is None:
+            return
+        if self.fzObjectType != "Force Volume":
+            self.mapView.close()
+            return
+        self.mapView.setSource(self.prefetcher.source)
+        self.mapView.showCurve(*self.mapPosition(self.idx))
+
+    def goToMapPosition(self, NX, NY):
+        self.goToForceRamp(NX * self.fzObject.fvParameters['numberOfMapColumns'][0] + NY)
 
     def get_point(self):
         self.cid = self.ui.MplWidget.canvas.mpl_connect('button_press_event', self.onclick)
         
 
     def update_graph(self):
-        self.ui.MplWidget.canvas.axes.clear()
-        self.ui.MplWidget.canvas.axes.plot(self.x, self.y)
         if self.xPoint:
-            self.ui.MplWidget.canvas.axes.plot(self.x[np.array(self.xPoint).astype(int)], self.y[np.array(self.xPoint).astype(int)],'ro')
-        self.ui.MplWidget.canvas.draw()
+            xPoint = np.array(self.xPoint).astype(int)
+            self.ui.MplWidget.plotCurve(self.x, self.y, self.x[xPoint], self.y[xPoint])
+        else:
+            self.ui.MplWidget.plotCurve(self.x, self.y)
 
     def onclick(self,event):
         #print('button=%d, x=%d, y=%d, xdata=%f, ydata=%f'%(event.button, event.x, event.y, event.xdata, event.ydata))
         self.ui.MplWidget.canvas.mpl_disconnect(self.cid)
+        if event.xdata is None:
+            return
         xpoint = np.abs(self.x - event.xdata).argmin()
-        self.xPoint.append(xpoint)
+        if event.button == 3:
+            # Right click: removes the closest labelled point (e.g. a
+            # wrong suggestion)
+            if self.xPoint:
+                self.xPoint.remove(min(self.xPoint, key=lambda point: abs(point - xpoint)))
+        else:
+            self.xPoint.append(xpoint)
         self.xPoint.sort()
+        self.recordLabels()
         
         self.ui.label.setText(str(self.xPoint))
 
@@ -167,15 +556,92 @@ class labelFZ_GUI(QMainWindow):
         self.exportDirectory = QFileDialog.getExistingDirectory(self, "Select Directory to Export Data")
 
     def exportData(self):
+        self.recordLabels()
         if self.fzObjectType == "Force Volume":
             q = self.nameFile.split('/')
         elif self.fzObjectType == "Force Ramps":
             q = self.filenames[self.idx].split('/')
                 
         nameFZ = self.exportDirectory + '/' + self.ui.lineEditExportName.text() + '_' + str(self.idx)  + '_fz.txt'
-        np.savetxt(nameFZ, [self.x,self.y])
+        # (read whole, if it is a WindowedCurve)
+        np.savetxt(nameFZ, [self.x, np.asarray(self.y)])
         namePoint = self.exportDirectory + '/' + self.ui.lineEditExportName.text() + '_' + str(self.idx)  +  '_labelled_points.txt'
         np.savetxt(namePoint, self.xPoint)
         
                 
 
+    def pendingLabels(self):
+        '''
+        Returns the (idx, direction) of the force ramps labelled (again)
+        since they were last exported to the training dataset
+        '''
+        return sorted(key for key, points in self.labels.items()
+                      if self.exportedLabels.get(key) != tuple(points))
+
+    def datasetDirectory(self):
+        '''
+        Returns the training dataset of the export directory, named as the
+        Export Name
+        '''
+        name = self.ui.lineEditExportName.text() or 'labelFZ'
+        return os.path.join(self.exportDirectory, name + '.fzdataset')
+
+    def labelledCurves(self, keys, batchSize=64):
+        '''
+        Yields the force ramps (idx, direction) keys, as shown (with their
+        units), with their labelled points and where they come from, as
+        appended to a TrainingDataset. They are taken from the prefetcher:
+        from its cache if there, or read in batches.
+        '''
+        axes = self.ui.MplWidget.canvas.axes
+        for direction in DIRECTIONS:
+            ids = [idx for idx, keyDirection in keys if keyDirection == direction]
+            for start in range(0, len(ids), batchSize):
+                batch = ids[start:start+batchSize]
+                for idx, (xData, yData) in zip(batch, self.prefetcher.getForceRamps(batch, direction)):
+                    if self.fzObjectType == "Force Volume":
+                        fileName = self.nameFile
+                        NX, NY = self.mapPosition(idx)
+                    else:
+                        fileName = self.filenames[idx]
+                        NX, NY = -1, -1
+                    yield {'xData': xData, 'yData': yData,
+                           'labels': self.labels[(idx, direction)],
+                           'source': fileName, 'xLabel': axes.get_xlabel(),
+                           'yLabel': axes.get_ylabel(), 'idx': idx,
+                           'NX': NX, 'NY': NY, 'direction': direction}
+
+    def exportDataset(self, askDirectory=True):
+        '''
+        Appends the force ramps labelled since the last export, with their
+        labelled points, to the training dataset (see datasetDirectory and
+        classTrainingDataset). If there is no export directory, it is
+        asked for (if askDirectory). Returns whether they were exported.
+        '''
+        pending = self.pendingLabels()
+        if not pending or self.prefetcher is None:
+            self.ui.statusbar.showMessage("No labelled force ramps to export", 5000)
+            return False
+        if not self.exportDirectory and askDirectory:
+            self.selectExportDir()
+        if not self.exportDirectory:
+            return False
+        dataset = TrainingDataset(self.datasetDirectory())
+        nAppended = dataset.appendCurves(self.labelledCurves(pending))
+        self.exportedLabels.update((key, tuple(self.labels[key])) for key in pending)
+        self.ui.statusbar.showMessage(
+                f"{nAppended} labelled force ramps exported to {dataset.directory} "
+                f"({len(dataset)} in it)", 5000)
+        return True
+
+    def closeLabels(self):
+        '''
+        Exports the labels not exported yet (if there is an export
+        directory), before the force ramps they belong to are closed
+        '''
+        pending = self.pendingLabels()
+        if pending and not self.exportDataset(askDirectory=False):
+            self.ui.statusbar.showMessage(f"{len(pending)} labelled force ramps were not "
+                                          "exported: there is no export directory", 5000)
+        self.labels = {}
+        self.exportedLabels = {}
@@ -154,8 +154,12 @@ class Ui_LabelFZ(object):
         self.menubar.setObjectName("menubar")
         self.menuOpen = QtWidgets.QMenu(self.menubar)
         self.menuOpen.setObjectName("menuOpen")
+        self.menuStorage = QtWidgets.QMenu(self.menuOpen)
+        self.menuStorage.setObjectName("menuStorage")
         self.menuExport_Options = QtWidgets.QMenu(self.menubar)
         self.menuExport_Options.setObjectName("menuExport_Options")
+        self.menuView = QtWidgets.QMenu(self.menubar)
+        self.menuView.setObjectName("menuView")
         LabelFZ.setMenuBar(self.menubar)
         self.statusbar = QtWidgets.QStatusBar(LabelFZ)
         self.statusbar.setObjectName("statusbar")
@@ -166,11 +170,46 @@ class Ui_LabelFZ(object):
         self.actionLoadForceVolume.setObjectName("actionLoadForceVolume")
         self.actionSetExportDir = QtWidgets.QAction(LabelFZ)
         self.actionSetExportDir.setObjectName("actionSetExportDir")
+        self.actionExportDataset = QtWidgets.QAction(LabelFZ)
+        self.actionExportDataset.setObjectName("actionExportDataset")
+        self.actionOverviewGrid = QtWidgets.QAction(LabelFZ)
+        self.actionOverviewGrid.setObjectName("actionOverviewGrid")
+        self.actionMapView = QtWidgets.QAction(LabelFZ)
+        self.actionMapView.setObjectName("actionMapView")
+        self.actionPhysicalUnits = QtWidgets.QAction(LabelFZ)
+        self.actionPhysicalUnits.setCheckable(True)
+        self.actionPhysicalUnits.setObjectName("actionPhysicalUnits")
+        self.actionStorageSQLite = QtWidgets.QAction(LabelFZ)
+        self.actionStorageSQLite.setCheckable(True)
+        self.actionStorageSQLite.setChecked(True)
+        self.actionStorageSQLite.setObjectName("actionStorageSQLite")
+        self.actionStorageMemoryMap = QtWidgets.QAction(LabelFZ)
+        self.actionStorageMemoryMap.setCheckable(True)
+        self.actionStorageMemoryMap.setObjectName("actionStorageMemoryMap")
+        self.actionStorageChunked = QtWidgets.QAction(LabelFZ)
+        self.actionStorageChunked.setCheckable(True)
+        self.actionStorageChunked.setObjectName("actionStorageChunked")
+        self.actionCompressCurves = QtWidgets.QAction(LabelFZ)
+        self.actionCompressCurves.setCheckable(True)
+        self.actionCompressCurves.setObjectName("actionCompressCurves")
+        self.menuStorage.addAction(self.actionStorageSQLite)
+        self.menuStorage.addAction(self.actionStorageMemoryMap)
+        self.menuStorage.addAction(self.actionStorageChunked)
+        self.menuStorage.addSeparator()
+        self.menuStorage.addAction(self.actionCompressCurves)
         self.menuOpen.addAction(self.actionLoadForceRamps)
         self.menuOpen.addAction(self.actionLoadForceVolume)
+        self.menuOpen.addSeparator()
+        self.menuOpen.addAction(self.menuStorage.menuAction())
         self.menuExport_Options.addAction(self.actionSetExportDir)
+        self.menuExport_Options.addAction(self.actionExportDataset)
+        self.menuView.addAction(self.actionOverviewGrid)
+        self.menuView.addAction(self.actionMapView)
+        self.menuView.addSeparator()
+        self.menuView.addAction(self.actionPhysicalUnits)
         self.menubar.addAction(self.menuOpen.menuAction())
         self.menubar.addAction(self.menuExport_Options.menuAction())
+        self.menubar.addAction(self.menuView.menuAction())
 
         self.retranslateUi(LabelFZ)
         QtCore.QMetaObject.connectSlotsByName(LabelFZ)
@@ -192,8 +231,18 @@ class Ui_LabelFZ(object):
         self.ForwardDirectionRadioButton.setText(_translate("LabelFZ", "Forward"))
         self.BackwardDirectionRadioButton.setText(_translate("LabelFZ", "Backward"))
         self.menuOpen.setTitle(_translate("LabelFZ", "Open"))
+        self.menuStorage.setTitle(_translate("LabelFZ", "Force Volume Storage"))
         self.menuExport_Options.setTitle(_translate("LabelFZ", "Export Options"))
+        self.menuView.setTitle(_translate("LabelFZ", "View"))
         self.actionLoadForceRamps.setText(_translate("LabelFZ", "Force Curves"))
         self.actionLoadForceVolume.setText(_translate("LabelFZ", "Force Volume"))
         self.actionSetExportDir.setText(_translate("LabelFZ", "Set Export Dir"))
+        self.actionExportDataset.setText(_translate("LabelFZ", "Export Labelled Dataset"))
+        self.actionOverviewGrid.setText(_translate("LabelFZ", "Overview Grid"))
+        self.actionMapView.setText(_translate("LabelFZ", "Map"))
+        self.actionPhysicalUnits.setText(_translate("LabelFZ", "Physical Units"))
+        self.actionStorageSQLite.setText(_translate("LabelFZ", "SQLite Database"))
+        self.actionStorageMemoryMap.setText(_translate("LabelFZ", "Memory Map (No Ingest)"))
+        self.actionStorageChunked.setText(_translate("LabelFZ", "Chunked Arrays"))
+        self.actionCompressCurves.setText(_translate("LabelFZ", "Compress Curves (SQLite)"))
 from .mplwidget1plot import mplwidget1plot
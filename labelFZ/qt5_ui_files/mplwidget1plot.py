@@ -6,6 +6,10 @@ from matplotlib.figure import Figure
 
 import matplotlib.pyplot as plt
 
+import numpy as np
+
+from ..local_classes.classCurveDecimator import CurveDecimator
+
 class mplwidget1plot (QWidget):
     def __init__(self, parent=None):
         QWidget.__init__(self, parent)
@@ -16,3 +20,75 @@ class mplwidget1plot (QWidget):
         layout.addWidget(self.canvas)
         self.canvas.axes = self.canvas.figure.add_subplot()
         self.setLayout(layout)
+
+        # The curve and the labelled points are persistent artists, updated
+        # with set_data. The points are animated: they are not drawn by
+        # canvas.draw(), but blitted on top of a copy of the axes
+        # (background, with the curve) taken after each full draw
+        self.curveLine, = self.canvas.axes.plot([], [])
+        self.pointsLine, = self.canvas.axes.plot([], [], 'ro', animated=True)
+        self.background = None
+        self.curveData = (None, None)
+        self.dataBounds = None
+        self.canvas.mpl_connect('draw_event', self.onDraw)
+
+        # Long curves are decimated to the resolution of the axes, again
+        # every time the view changes (e.g. zoom or pan with the toolbar)
+        self.decimator = None
+        self.decimatedWindow = None
+        self.canvas.axes.callbacks.connect('xlim_changed', self.onXlimChanged)
+
+    def onDraw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self.canvas.axes.draw_artist(self.pointsLine)
+
+    def blit(self):
+        if self.background is None:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self.background)
+        self.canvas.axes.draw_artist(self.pointsLine)
+        self.canvas.blit(self.canvas.figure.bbox)
+
+    def plotCurve(self, x, y, xPoints=(), yPoints=()):
+        '''
+        Shows the curve (x, y) and the points (xPoints, yPoints) on it.
+        The canvas is only redrawn if the curve is a different one, and
+        the axes only autoscaled if the bounds of the data change; when
+        only the points change, they are just blitted.
+        y can be a WindowedCurve, of which only the samples in the view
+        are read (see CurveDecimator).
+        '''
+        self.pointsLine.set_data(xPoints, yPoints)
+        if self.curveData[0] is x and self.curveData[1] is y:
+            self.blit()
+            return
+
+        self.curveData = (x, y)
+        self.decimator = CurveDecimator(x, y)
+        self.decimatedWindow = None
+        self.updateDecimation(None, None)
+        dataBounds = self.decimator.bounds(self.decimatedWindow[2])
+        if dataBounds != self.dataBounds:
+            self.dataBounds = dataBounds
+            # The decimated curve has the same bounds as the whole one
+            self.canvas.axes.relim()
+            self.canvas.axes.autoscale_view()
+        self.updateDecimation(*self.canvas.axes.get_xlim())
+        self.canvas.draw()
+
+    def updateDecimation(self, xStart, xStop):
+        '''
+        Sets the data of the curve line to the curve decimated for the
+        view [xStart, xStop], with two points per pixel of the axes
+        '''
+        nBins = max(int(self.canvas.axes.bbox.width), 100)
+        window = self.decimator.window(xStart, xStop) + (nBins,)
+        if window == self.decimatedWindow:
+            return
+        self.decimatedWindow = window
+        self.curveLine.set_data(*self.decimator.decimate(xStart, xStop, nBins))
+
+    def onXlimChanged(self, axes):
+        if self.decimator is not None:
+            self.updateDecimation(*axes.get_xlim())